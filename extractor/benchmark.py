@@ -0,0 +1,389 @@
+"""
+Banc d'essai du pipeline d'extraction.
+
+Un corpus synthétique est généré localement avec PyMuPDF, de façon déterministe :
+texte dense, tableaux, images, pages scannées et un document de plus de 1000 pages.
+Chaque document est extrait dans un processus dédié, page par page avec
+extract_page_content (le pipeline séquentiel d'extract_pdf_content), en relevant la
+durée de chaque étape (PAGE_STAGES), le débit en pages par seconde, le pic de mémoire
+résidente et la taille des résultats. Avec un moteur OCR (extractor.ocr.TesseractOCR),
+les pages scannées sont aussi reconnues, sans le cache OCR partagé : chaque exécution
+mesure la reconnaissance. Les mesures sont enregistrées en JSON et
+comparées à une référence pour signaler les régressions.
+
+Ce module n'accède pas à la base : les documents sont extraits dans des processus
+"spawn" qui ne chargent pas Django.
+"""
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import time
+from copy import copy
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from .metrics import PAGE_STAGES, peak_rss_mb
+from .utils import EXTRACTOR_VERSION, PDFBackends, extract_page_content
+
+# À incrémenter à chaque modification des générateurs : le corpus est alors régénéré
+CORPUS_VERSION = 1
+BENCHMARK_FOLDER = os.path.join('media', 'benchmark')
+
+WORDS = (
+    "analyse", "document", "extraction", "page", "tableau", "image", "contrôle", "qualité",
+    "procédure", "lot", "fabrication", "validation", "risque", "produit", "essai", "clinique",
+    "résultat", "méthode", "annexe", "version", "référence", "conformité", "matière", "stabilité",
+    "échantillon", "spécification", "rapport", "données", "patient", "étude", "dose", "sécurité",
+)
+
+# Durée (s) en deçà de laquelle une étape, trop courte pour être mesurée de façon fiable, n'est pas comparée
+MIN_COMPARED_SECONDS = 0.05
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _paragraph(rng, sentences):
+    return " ".join(_sentence(rng, rng.randint(6, 16)) for _ in range(sentences))
+
+
+def _photo(np_rng, width, height):
+    """Image de type photographie : dégradés et bruit, peu compressible"""
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    base = np.concatenate([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2)
+    noise = np_rng.normal(0, 18, (height, width, 3))
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+
+def _image_bytes(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _logo():
+    logo = Image.new("RGB", (240, 80), (20, 60, 140))
+    logo.paste((240, 180, 0), (10, 10, 70, 70))
+    return _image_bytes(logo, "PNG")
+
+
+def _generate_text_heavy(doc, pages, rng, np_rng):
+    """Texte dense sur deux colonnes"""
+    for _ in range(pages):
+        page = doc.new_page()
+        for column in range(2):
+            rect = fitz.Rect(40 + column * 270, 50, 300 + column * 270, 770)
+            page.insert_textbox(rect, "\n\n".join(_paragraph(rng, 6) for _ in range(5)), fontsize=8)
+
+
+def _generate_table_heavy(doc, pages, rng, np_rng):
+    """Un tableau réglé par page, et un tableau sans bordure une page sur deux"""
+    for page_index in range(pages):
+        page = doc.new_page()
+        page.insert_text((40, 40), _sentence(rng, 8), fontsize=11)
+        rows, columns = 22, 6
+        left, top, cell_width, cell_height = 40, 60, 88, 14
+        shape = page.new_shape()
+        for row in range(rows + 1):
+            shape.draw_line((left, top + row * cell_height), (left + columns * cell_width, top + row * cell_height))
+        for column in range(columns + 1):
+            shape.draw_line((left + column * cell_width, top), (left + column * cell_width, top + rows * cell_height))
+        shape.finish(width=0.5)
+        shape.commit()
+        for row in range(rows):
+            for column in range(columns):
+                text = rng.choice(WORDS) if row == 0 or column == 0 else f"{rng.uniform(0, 1000):.2f}"
+                page.insert_text((left + column * cell_width + 3, top + row * cell_height + 10), text, fontsize=8)
+        if page_index % 2:
+            top = top + rows * cell_height + 40
+            for row in range(12):
+                for column in range(4):
+                    text = rng.choice(WORDS) if column == 0 else str(rng.randint(1, 9999))
+                    page.insert_text((60 + column * 120, top + row * 14), text, fontsize=8)
+
+
+def _generate_image_heavy(doc, pages, rng, np_rng):
+    """Plusieurs photographies JPEG, une image PNG et un logo partagé par page"""
+    logo_xref = 0
+    for _ in range(pages):
+        page = doc.new_page()
+        if logo_xref:
+            page.insert_image(fitz.Rect(40, 20, 160, 60), xref=logo_xref)
+        else:
+            logo_xref = page.insert_image(fitz.Rect(40, 20, 160, 60), stream=_logo())
+        for index in range(3):
+            photo = _photo(np_rng, 800, 600)
+            page.insert_image(fitz.Rect(40, 80 + index * 210, 300, 275 + index * 210),
+                              stream=_image_bytes(photo, "JPEG", quality=85))
+        chart = Image.new("RGB", (400, 300), "white")
+        for bar in range(8):
+            chart.paste((60, 120, 200), (20 + bar * 45, 280 - rng.randint(20, 260), 55 + bar * 45, 280))
+        page.insert_image(fitz.Rect(320, 80, 570, 267), stream=_image_bytes(chart, "PNG"))
+        page.insert_textbox(fitz.Rect(320, 300, 570, 770), _paragraph(rng, 8), fontsize=9)
+
+
+def _generate_scanned(doc, pages, rng, np_rng):
+    """Pages numérisées : une image pleine page en niveaux de gris, sans couche texte"""
+    source = fitz.open()
+    for _ in range(pages):
+        source_page = source.new_page()
+        source_page.insert_textbox(fitz.Rect(50, 50, 560, 780), "\n\n".join(_paragraph(rng, 5) for _ in range(6)),
+                                   fontsize=10)
+        pixmap = source_page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+        scan = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+        noise = np_rng.normal(0, 10, (scan.height, scan.width))
+        scan = Image.fromarray(np.clip(np.asarray(scan, dtype=np.float32) + noise, 0, 255).astype(np.uint8))
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=_image_bytes(scan, "JPEG", quality=75))
+    source.close()
+
+
+def _generate_large(doc, pages, rng, np_rng):
+    """Document long à en-tête : logo partagé et quelques paragraphes par page"""
+    logo_xref = 0
+    for page_index in range(pages):
+        page = doc.new_page()
+        if logo_xref:
+            page.insert_image(fitz.Rect(40, 20, 160, 60), xref=logo_xref)
+        else:
+            logo_xref = page.insert_image(fitz.Rect(40, 20, 160, 60), stream=_logo())
+        page.insert_text((400, 45), f"Page {page_index + 1}", fontsize=9)
+        page.insert_textbox(fitz.Rect(40, 80, 570, 400), _paragraph(rng, 6), fontsize=10)
+
+
+# nom -> (générateur, nombre de pages, nombre de pages en mode rapide)
+CORPUS = {
+    "text_heavy": (_generate_text_heavy, 50, 5),
+    "table_heavy": (_generate_table_heavy, 30, 3),
+    "image_heavy": (_generate_image_heavy, 30, 3),
+    "scanned": (_generate_scanned, 20, 2),
+    "large": (_generate_large, 1200, 120),
+}
+
+
+def generate_corpus(folder, quick=False, names=None, force=False):
+    """
+    Génère les PDF du corpus dans folder (sauf s'ils existent déjà pour la même
+    version des générateurs). Retourne {nom: chemin}.
+    """
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, "corpus.json")
+    try:
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    if manifest.get("version") != CORPUS_VERSION or manifest.get("quick") != quick:
+        manifest = {"version": CORPUS_VERSION, "quick": quick, "documents": {}}
+
+    paths = {}
+    for name in names or CORPUS:
+        generator, pages, quick_pages = CORPUS[name]
+        page_count = quick_pages if quick else pages
+        path = os.path.join(folder, f"{name}.pdf")
+        if force or manifest["documents"].get(name) != page_count or not os.path.exists(path):
+            # Graine fixe par document : le corpus est identique d'une génération à l'autre
+            seed = sum(map(ord, name))
+            doc = fitz.open()
+            generator(doc, page_count, random.Random(seed), np.random.default_rng(seed))
+            doc.save(path, garbage=3, deflate=True)
+            doc.close()
+            manifest["documents"][name] = page_count
+        paths[name] = path
+
+    with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return paths
+
+
+def _folder_size(folder):
+    return sum(
+        os.path.getsize(os.path.join(root, filename))
+        for root, dirs, files in os.walk(folder) for filename in files
+    )
+
+
+def benchmark_document(pdf_path, output_folder, ocr=None):
+    """
+    Extrait un document page par page et retourne ses mesures.
+    Exécuté dans un processus dédié : le pic de mémoire est propre au document.
+    ocr (extractor.ocr.TesseractOCR) complète les pages numérisées, avec un cache
+    propre à l'exécution.
+    """
+    shutil.rmtree(output_folder, ignore_errors=True)
+    os.makedirs(output_folder, exist_ok=True)
+    if ocr is not None:
+        ocr = copy(ocr)
+        ocr.cache_folder = os.path.join(output_folder, "ocr")
+    stage_seconds = dict.fromkeys(PAGE_STAGES, 0.0)
+    result_bytes = 0
+    errors = 0
+    counts = {"spans": 0, "images": 0, "tables": 0, "ocr_pages": 0}
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    with PDFBackends(pdf_path) as backends:
+        page_count = backends.page_count
+        for page_num in range(page_count):
+            page_data, page_result = extract_page_content(backends, page_num, output_folder, ocr=ocr)
+            page_metrics = page_result["metrics"]
+            for stage, times in page_metrics["stages"].items():
+                stage_seconds[stage] += times["wall_seconds"]
+            errors += len(page_result.get("extraction_errors", []))
+            counts["spans"] += len(page_data["positioned_text"])
+            counts["images"] += len(page_data["images"])
+            counts["tables"] += len(page_data["tables"])
+            counts["ocr_pages"] += "ocr" in page_data
+            result_bytes += len(json.dumps(page_data, ensure_ascii=False).encode("utf-8"))
+    seconds = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu_start
+    image_bytes = _folder_size(output_folder)
+    shutil.rmtree(output_folder, ignore_errors=True)
+
+    return {
+        "pages": page_count,
+        "seconds": round(seconds, 4),
+        "cpu_seconds": round(cpu_seconds, 4),
+        "pages_per_second": round(page_count / seconds, 2) if seconds else None,
+        "stage_seconds": {stage: round(value, 4) for stage, value in stage_seconds.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "result_bytes": result_bytes,
+        "image_bytes": image_bytes,
+        "output_bytes": result_bytes + image_bytes,
+        "counts": counts,
+        "errors": errors,
+    }
+
+
+def _best_run(runs):
+    """Meilleur temps sur plusieurs exécutions, pic de mémoire le plus élevé"""
+    best = dict(min(runs, key=lambda run: run["seconds"]))
+    rss = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    best["peak_rss_mb"] = max(rss) if rss else None
+    best["runs"] = len(runs)
+    return best
+
+
+def _package_version(name):
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+
+def run_benchmark(corpus, output_folder, repeat=1, progress=None, ocr=None):
+    """
+    Mesure chaque document du corpus ({nom: chemin}), repeat fois, chacun dans un
+    processus neuf, avec le moteur OCR ocr s'il est fourni. Retourne les résultats
+    au format enregistré en JSON.
+    """
+    context = multiprocessing.get_context("spawn")
+    documents = {}
+    for name, path in corpus.items():
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(
+                    benchmark_document, os.path.abspath(path), os.path.abspath(os.path.join(output_folder, name)),
+                    ocr
+                ).result())
+        documents[name] = _best_run(runs)
+        if progress is not None:
+            progress(name, documents[name])
+
+    return {
+        "date": datetime.now().isoformat(),
+        "extractor_version": EXTRACTOR_VERSION,
+        "corpus_version": CORPUS_VERSION,
+        # Langues de l'OCR, None sans OCR : des mesures avec et sans OCR ne sont pas comparables
+        "ocr": ocr.languages if ocr is not None else None,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pymupdf": _package_version("PyMuPDF"),
+            "pypdfium2": _package_version("pypdfium2"),
+            "pdfplumber": _package_version("pdfplumber"),
+        },
+        "documents": documents,
+    }
+
+
+def _compared_metrics(document):
+    """(métrique, valeur, plus grand = mieux) d'un document"""
+    yield "seconds", document["seconds"], False
+    yield "pages_per_second", document["pages_per_second"], True
+    yield "peak_rss_mb", document["peak_rss_mb"], False
+    yield "output_bytes", document["output_bytes"], False
+    for stage, seconds in document["stage_seconds"].items():
+        yield f"stage_seconds.{stage}", seconds, False
+
+
+def compare_results(current, baseline, threshold=0.1):
+    """
+    Compare deux résultats de run_benchmark. Retourne une ligne par document et
+    métrique : {document, metric, baseline, current, change, regression}, où change
+    est la variation relative et regression indique une dégradation au-delà de threshold.
+    """
+    rows = []
+    for name, document in current["documents"].items():
+        reference = baseline.get("documents", {}).get(name)
+        if reference is None:
+            continue
+        reference_metrics = {metric: value for metric, value, _ in _compared_metrics(reference)}
+        for metric, value, higher_is_better in _compared_metrics(document):
+            previous = reference_metrics.get(metric)
+            if value is None or not previous:
+                continue
+            if metric.startswith("stage_seconds.") and max(value, previous) < MIN_COMPARED_SECONDS:
+                continue
+            change = (value - previous) / previous
+            degradation = -change if higher_is_better else change
+            rows.append({
+                "document": name,
+                "metric": metric,
+                "baseline": previous,
+                "current": value,
+                "change": round(change, 4),
+                "regression": degradation > threshold,
+            })
+    return rows
+
+
+def format_report(results, comparison=None):
+    """Rapport texte : mesures par document, puis comparaison à la référence"""
+    lines = [
+        f"Extracteur v{results['extractor_version']} - corpus v{results['corpus_version']} - {results['date']}"
+        + (f" - OCR {results['ocr']}" if results.get("ocr") else ""),
+        "",
+        f"{'document':<12} {'pages':>6} {'s':>8} {'pages/s':>8} {'RSS Mo':>8} {'sortie Mo':>10}  "
+        + " ".join(f"{stage:>17}" for stage in PAGE_STAGES),
+    ]
+    for name, document in results["documents"].items():
+        lines.append(
+            f"{name:<12} {document['pages']:>6} {document['seconds']:>8.2f} {document['pages_per_second'] or 0:>8.1f} "
+            f"{document['peak_rss_mb'] or 0:>8.1f} {document['output_bytes'] / (1024 * 1024):>10.2f}  "
+            + " ".join(f"{document['stage_seconds'][stage]:>17.3f}" for stage in PAGE_STAGES)
+        )
+    if comparison is not None:
+        lines += ["", "Comparaison à la référence :"]
+        regressions = [row for row in comparison if row["regression"]]
+        for row in comparison:
+            marker = "RÉGRESSION" if row["regression"] else ""
+            lines.append(
+                f"  {row['document']:<12} {row['metric']:<32} {row['baseline']:>12} -> {row['current']:>12} "
+                f"({row['change']:+.1%}) {marker}"
+            )
+        lines.append(f"{len(regressions)} régression(s)" if regressions else "Aucune régression")
+    return "\n".join(lines)
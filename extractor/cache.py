@@ -0,0 +1,217 @@
+"""
+Cache des résultats d'extraction indexé par l'empreinte SHA-256 du PDF.
+
+Un PDF déjà extrait (même contenu, même version de l'extracteur) n'est pas
+retraité : le document existant, ses résultats et ses images sont réutilisés.
+L'éviction par âge et par taille totale supprime à la fois les lignes en base,
+les PDF stockés, les tables de spans et les exports de tableaux, et libère les
+références aux images du stockage par contenu ; collect_image_store supprime
+ensuite les images qui ne sont plus référencées par aucun document.
+"""
+import hashlib
+import os
+import shutil
+from datetime import timedelta
+
+from django.db.models import Count
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .derivatives import clear_image_derivatives, clear_page_previews
+from .exports import clear_exports, get_exports_folder
+from .imagestore import iter_stored_files
+from .jobs import get_output_folder, get_profile_path
+from .metrics import ExtractionProfiler
+from .models import ExtractedImage, PDFDocument, StoredImage
+from .ocr import get_extractor_version
+from .spans import get_spans_folder
+
+
+def hash_uploaded_file(uploaded_file):
+    """Calcule le SHA-256 d'un fichier uploadé en le lisant par blocs"""
+    sha256 = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha256.update(chunk)
+    uploaded_file.seek(0)
+    return sha256.hexdigest()
+
+
+def find_cached_document(content_hash):
+    """
+    Retourne un document déjà extrait (ou en cours d'extraction) avec le même
+    contenu et la même version d'extracteur, ou None
+    """
+    if not content_hash:
+        return None
+    candidates = PDFDocument.objects.filter(
+        content_hash=content_hash,
+        extractor_version=get_extractor_version()
+    )
+    document = (
+        candidates.filter(status=PDFDocument.STATUS_DONE).order_by('-extraction_date').first()
+        or candidates.filter(
+            status__in=[PDFDocument.STATUS_QUEUED, PDFDocument.STATUS_RUNNING]
+        ).order_by('-uploaded_at').first()
+    )
+    if document is not None:
+        touch_document(document)
+    return document
+
+
+def touch_document(document):
+    """Met à jour la date de dernier accès utilisée pour l'éviction"""
+    document.last_accessed_at = timezone.now()
+    PDFDocument.objects.filter(id=document.id).update(last_accessed_at=document.last_accessed_at)
+
+
+def _folder_size(folder):
+    total = 0
+    for root, dirs, files in os.walk(folder):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _image_store_share(document):
+    """
+    Part du stockage d'images attribuée au document : chaque image partagée est
+    répartie entre les documents au prorata de leurs références
+    """
+    counts = dict(
+        document.images.exclude(content_hash='')
+        .values_list('content_hash').annotate(count=Count('id')).order_by()
+    )
+    share = 0
+    for stored in StoredImage.objects.filter(content_hash__in=counts, ref_count__gt=0):
+        share += stored.size_bytes * min(counts[stored.content_hash], stored.ref_count) // stored.ref_count
+    return share
+
+
+def document_storage_size(document):
+    """Espace disque occupé par un document : PDF source, images extraites, spans et exports"""
+    return (
+        (document.file_size or 0)
+        + _image_store_share(document)
+        + _folder_size(get_output_folder(document))
+        + _folder_size(get_spans_folder(document.id))
+        + _folder_size(get_exports_folder(document.id))
+    )
+
+
+def delete_document(document):
+    """Supprime un document, son PDF, ses images extraites, ses spans, ses exports et ses profils"""
+    document.release_images()
+    if not PDFDocument.objects.filter(content_hash=document.content_hash).exclude(id=document.id).exists():
+        clear_page_previews(document)
+    shutil.rmtree(get_output_folder(document), ignore_errors=True)
+    shutil.rmtree(get_spans_folder(document.id), ignore_errors=True)
+    clear_exports(document.id)
+    for extension in ExtractionProfiler.EXTENSIONS.values():
+        try:
+            os.remove(get_profile_path(document) + extension)
+        except FileNotFoundError:
+            pass
+    if document.file:
+        document.file.delete(save=False)
+    document.delete()
+
+
+def evict_cache(max_age_days=None, max_bytes=None):
+    """
+    Évince les documents les moins récemment utilisés : d'abord ceux dont le
+    dernier accès dépasse max_age_days, puis les plus anciens jusqu'à ce que
+    l'espace occupé repasse sous max_bytes.
+    Les documents en file ou en cours d'extraction ne sont jamais évincés.
+    Retourne (nombre de documents supprimés, octets libérés).
+    """
+    documents = PDFDocument.objects.exclude(
+        status__in=[PDFDocument.STATUS_QUEUED, PDFDocument.STATUS_RUNNING]
+    ).annotate(
+        last_used=Coalesce('last_accessed_at', 'uploaded_at')
+    ).order_by('last_used')
+
+    evicted = 0
+    freed = 0
+    if max_age_days is not None:
+        cutoff = timezone.now() - timedelta(days=max_age_days)
+        for document in documents.filter(last_used__lt=cutoff):
+            freed += document_storage_size(document)
+            delete_document(document)
+            evicted += 1
+
+    if max_bytes is not None:
+        sizes = [(document, document_storage_size(document)) for document in documents]
+        total = sum(size for _, size in sizes)
+        for document, size in sizes:
+            if total <= max_bytes:
+                break
+            delete_document(document)
+            total -= size
+            freed += size
+            evicted += 1
+
+    return evicted, freed
+
+
+def _recount_references():
+    """
+    Recalcule ref_count à partir des ExtractedImage existantes (rattrape une
+    extraction interrompue entre l'écriture des images et leur enregistrement)
+    """
+    actual = dict(
+        ExtractedImage.objects.exclude(content_hash='')
+        .values_list('content_hash').annotate(count=Count('id')).order_by()
+    )
+    for stored_id, content_hash, ref_count in StoredImage.objects.values_list('id', 'content_hash', 'ref_count'):
+        count = actual.get(content_hash, 0)
+        if count != ref_count:
+            # Mise à jour conditionnelle : une référence ajoutée entre-temps n'est pas écrasée
+            StoredImage.objects.filter(id=stored_id, ref_count=ref_count).update(ref_count=count)
+
+
+def collect_image_store(grace_hours=1):
+    """
+    Ramasse-miettes du stockage d'images : supprime les images qui ne sont plus
+    référencées, et les fichiers sans StoredImage (extraction échouée ou interrompue).
+    Les images modifiées depuis moins de grace_hours sont conservées : une
+    extraction en cours peut les avoir écrites sans les avoir encore enregistrées.
+    Retourne (nombre de fichiers supprimés, octets libérés).
+    """
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    _recount_references()
+
+    deleted = 0
+    freed = 0
+    cutoff_timestamp = cutoff.timestamp()
+    for stored in StoredImage.objects.filter(ref_count__lte=0, updated_at__lt=cutoff):
+        try:
+            if os.path.getmtime(stored.path) >= cutoff_timestamp:
+                continue
+        except FileNotFoundError:
+            pass
+        if StoredImage.objects.filter(id=stored.id, ref_count__lte=0).delete()[0]:
+            clear_image_derivatives(stored.content_hash)
+            try:
+                freed += os.path.getsize(stored.path)
+                os.remove(stored.path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+
+    known = set(StoredImage.objects.values_list('content_hash', flat=True))
+    for path, content_hash in iter_stored_files():
+        if content_hash in known:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff_timestamp:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+                deleted += 1
+        except FileNotFoundError:
+            pass
+
+    return deleted, freed
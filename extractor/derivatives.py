@@ -0,0 +1,160 @@
+"""
+Vignettes des images extraites et aperçus des pages.
+
+Les dérivés sont produits à la première demande, au format WebP et à des largeurs
+fixes (PDF_DERIVATIVE_WIDTHS), puis conservés dans media/derivatives/ :
+- images/<sha[:2]>/<sha>_w<largeur>.webp : vignettes des images du stockage par
+  contenu, partagées comme les images elles-mêmes ;
+- pages/<empreinte du PDF>/p<page>_w<largeur>.webp : pages rendues par pypdfium2.
+Chaque accès rafraîchit la date de modification du fichier ; evict_derivatives
+supprime les dérivés les moins récemment utilisés au-delà d'une taille totale.
+"""
+import os
+import shutil
+import tempfile
+
+import fitz  # PyMuPDF
+from django.conf import settings
+from PIL import Image
+
+from .sources import PDFSource
+
+DERIVATIVES_FOLDER = os.path.join('media', 'derivatives')
+DEFAULT_WIDTHS = (160, 320, 640, 1280)
+
+
+def get_derivative_widths():
+    return tuple(sorted(getattr(settings, 'PDF_DERIVATIVE_WIDTHS', DEFAULT_WIDTHS)))
+
+
+def _get_quality():
+    return getattr(settings, 'PDF_DERIVATIVE_WEBP_QUALITY', 80)
+
+
+def get_thumbnail_path(content_hash, width):
+    return os.path.join(DERIVATIVES_FOLDER, 'images', content_hash[:2], f"{content_hash}_w{width}.webp")
+
+
+def get_previews_folder(document):
+    """Aperçus d'un document, partagés par les documents de même contenu"""
+    key = document.content_hash or f"document_{document.id}"
+    return os.path.join(DERIVATIVES_FOLDER, 'pages', key)
+
+
+def _cached(path):
+    if os.path.exists(path):
+        # Date de modification = dernier accès, pour l'éviction
+        os.utime(path)
+        return True
+    return False
+
+
+def _save_webp(image, path):
+    """Enregistre en WebP via un fichier temporaire : un dérivé incomplet n'est jamais servi"""
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.mode or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.', suffix='.webp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            image.save(output, 'WEBP', quality=_get_quality(), method=4)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _open_image(path, width):
+    """
+    Ouvre une image source en vue de sa réduction à width pixels de large.
+    Les JPEG sont décodés directement à l'échelle 1/2, 1/4 ou 1/8 la plus proche
+    (draft) ; les formats que Pillow ne sait pas lire passent par PyMuPDF.
+    """
+    try:
+        image = Image.open(path)
+        image.draft('RGB', (width, max(1, image.height * width // max(image.width, 1))))
+        image.load()
+        return image
+    except Exception:
+        pixmap = fitz.Pixmap(path)
+        if pixmap.colorspace is not None and pixmap.colorspace.n > 3:
+            pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+        mode = {1: "L", 3: "RGB"}.get(pixmap.n - pixmap.alpha, "RGB") + ("A" if pixmap.alpha else "")
+        return Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def image_thumbnail(content_hash, source_path, width):
+    """Chemin de la vignette WebP d'une image stockée, générée si besoin (jamais agrandie)"""
+    path = get_thumbnail_path(content_hash, width)
+    if not _cached(path):
+        with _open_image(source_path, width) as image:
+            if image.width > width:
+                image.thumbnail((width, image.height), Image.LANCZOS)
+            _save_webp(image, path)
+    return path
+
+
+def page_preview(document, page_number, width):
+    """Chemin de l'aperçu WebP d'une page rendue à width pixels de large, généré si besoin"""
+    path = os.path.join(get_previews_folder(document), f"p{page_number}_w{width}.webp")
+    if not _cached(path):
+        with PDFSource.from_file(document.file) as source:
+            pdf = source.open_pdfium()
+            try:
+                page = pdf[page_number - 1]
+                try:
+                    bitmap = page.render(scale=width / page.get_width(), may_draw_forms=True)
+                    _save_webp(bitmap.to_pil(), path)
+                finally:
+                    page.close()
+            finally:
+                pdf.close()
+    return path
+
+
+def clear_image_derivatives(content_hash):
+    """Supprime les vignettes d'une image retirée du stockage"""
+    for width in get_derivative_widths():
+        try:
+            os.remove(get_thumbnail_path(content_hash, width))
+        except FileNotFoundError:
+            pass
+
+
+def clear_page_previews(document):
+    shutil.rmtree(get_previews_folder(document), ignore_errors=True)
+
+
+def evict_derivatives(max_bytes, folder=DERIVATIVES_FOLDER):
+    """
+    Supprime les dérivés les moins récemment utilisés jusqu'à ce que leur taille
+    totale repasse sous max_bytes. Retourne (nombre de fichiers supprimés, octets libérés).
+    folder permet d'appliquer la même éviction à un autre cache (OCR).
+    """
+    entries = []
+    for root, dirs, files in os.walk(folder):
+        for filename in files:
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    deleted = 0
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        freed += size
+        deleted += 1
+    return deleted, freed
@@ -0,0 +1,149 @@
+"""
+Export des tableaux extraits à la demande.
+
+Les tableaux ne sont stockés qu'une fois, sous forme de lignes de cellules
+(Table.data) ; les fichiers CSV, XLSX et Parquet sont produits au premier
+téléchargement puis conservés dans media/table_exports/<document>/.
+Un tableau modifié dans le navigateur est exporté à partir des lignes envoyées
+par le client (export_edited_table), en mémoire et sans cache.
+CSV ne dépend que de la bibliothèque standard ; XLSX et Parquet importent
+pandas (et openpyxl / pyarrow) uniquement au moment de l'export.
+"""
+import copy
+import csv
+import functools
+import importlib.util
+import io
+import os
+import shutil
+
+EXPORTS_FOLDER = os.path.join('media', 'table_exports')
+
+# format -> (extension, type MIME)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# format -> modules optionnels requis (requirements-export.txt)
+EXPORT_DEPENDENCIES = {
+    'csv': (),
+    'xlsx': ('pandas', 'openpyxl'),
+    'parquet': ('pandas', 'pyarrow'),
+}
+
+
+class ExportUnavailable(Exception):
+    """Format d'export dont les dépendances optionnelles ne sont pas installées"""
+
+
+@functools.lru_cache(maxsize=None)
+def available_export_formats():
+    """Formats dont les dépendances sont installées, sans les importer"""
+    return tuple(
+        export_format for export_format, modules in EXPORT_DEPENDENCIES.items()
+        if all(importlib.util.find_spec(module) is not None for module in modules)
+    )
+
+
+def get_exports_folder(document_id):
+    return os.path.join(EXPORTS_FOLDER, str(document_id))
+
+
+def clear_exports(document_id):
+    """Supprime les exports d'un document (nouvelle extraction ou suppression)"""
+    shutil.rmtree(get_exports_folder(document_id), ignore_errors=True)
+
+
+def table_to_csv(table):
+    """Contenu CSV d'un tableau, en-têtes compris"""
+    output = io.StringIO()
+    csv.writer(output, lineterminator='\n').writerows(table.data)
+    return output.getvalue()
+
+
+def _column_names(header):
+    """Noms de colonnes uniques et non vides, requis par Parquet"""
+    names = []
+    seen = set()
+    for index, cell in enumerate(header):
+        name = cell or f"column_{index + 1}"
+        candidate = name
+        suffix = 2
+        while candidate in seen:
+            candidate = f"{name}_{suffix}"
+            suffix += 1
+        seen.add(candidate)
+        names.append(candidate)
+    return names
+
+
+def table_to_dataframe(table):
+    """DataFrame pandas du tableau ; pandas n'est importé qu'ici"""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ExportUnavailable("pandas n'est pas installé")
+    if table.has_headers and len(table.data) > 1:
+        return pd.DataFrame(table.data[1:], columns=_column_names(table.data[0]))
+    return pd.DataFrame(table.data, columns=_column_names([""] * table.columns))
+
+
+def _write_export(table, export_format, output):
+    """Écrit l'export dans output : chemin de fichier ou flux binaire"""
+    if export_format == 'csv':
+        content = table_to_csv(table)
+        if isinstance(output, str):
+            with open(output, 'w', encoding='utf-8', newline='') as csv_file:
+                csv_file.write(content)
+        else:
+            output.write(content.encode('utf-8'))
+        return
+    df = table_to_dataframe(table)
+    try:
+        if export_format == 'xlsx':
+            df.to_excel(output, index=False, sheet_name=table.table_id[:31])
+        else:
+            df.to_parquet(output, index=False)
+    except ImportError as e:
+        raise ExportUnavailable(str(e).splitlines()[0])
+
+
+def export_table(table, export_format):
+    """
+    Retourne le chemin du fichier d'export du tableau au format demandé,
+    en le générant s'il n'est pas déjà en cache
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(export_format)
+    extension, _ = EXPORT_FORMATS[export_format]
+    folder = get_exports_folder(table.document_id)
+    path = os.path.join(folder, f"{table.table_id}.{extension}")
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        # Écriture dans un fichier temporaire : un export interrompu n'est jamais servi
+        tmp_path = os.path.join(folder, f".{table.table_id}.{os.getpid()}.{extension}")
+        try:
+            _write_export(table, export_format, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return path
+
+
+def export_edited_table(table, rows, export_format):
+    """
+    Contenu (octets) de l'export du tableau avec les cellules rows modifiées par
+    l'utilisateur ; le tableau stocké et l'export en cache ne sont pas modifiés
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(export_format)
+    edited = copy.copy(table)
+    edited.data = rows
+    edited.rows = len(rows)
+    edited.columns = max((len(row) for row in rows), default=0)
+    output = io.BytesIO()
+    _write_export(edited, export_format, output)
+    return output.getvalue()
@@ -0,0 +1,58 @@
+"""
+Empreintes de contenu des pages d'un PDF.
+
+L'empreinte d'une page combine ses dimensions, sa rotation, ses flux de contenu
+et ses ressources : flux bruts des images (et de leurs masques) et des XObjects,
+identité des polices (nom sans préfixe de sous-ensemble, type, encodage). Les
+programmes de police ne sont pas hachés : un sous-ensemble régénéré à chaque
+révision changerait l'empreinte de toutes les pages, alors que le texte extrait
+ne dépend que des codes présents dans le flux de contenu.
+Deux pages d'empreinte identique produisent la même extraction, quel que soit
+leur numéro ou la numérotation des objets du fichier.
+"""
+import hashlib
+
+import fitz  # PyMuPDF
+
+from .sources import PDFSource
+
+
+def _stream_hash(doc, xref, cache):
+    """Haché du flux brut d'un objet, mis en cache par document"""
+    if xref <= 0:
+        return ""
+    digest = cache.get(xref)
+    if digest is None:
+        try:
+            digest = hashlib.sha256(doc.xref_stream_raw(xref) or b"").hexdigest()
+        except Exception:
+            digest = ""
+        cache[xref] = digest
+    return digest
+
+
+def _font_identity(basefont):
+    """Nom de police sans le préfixe de sous-ensemble (ABCDEF+)"""
+    prefix, _, name = basefont.partition("+")
+    return name if name and len(prefix) == 6 and prefix.isupper() else basefont
+
+
+def page_fingerprint(doc, page, cache):
+    sha256 = hashlib.sha256()
+    sha256.update(repr((tuple(page.rect), page.rotation)).encode())
+    sha256.update(page.read_contents())
+    for image in sorted(page.get_images(full=True), key=lambda item: item[7]):
+        xref, smask, name = image[0], image[1], image[7]
+        sha256.update(f"image:{name}:{_stream_hash(doc, xref, cache)}:{_stream_hash(doc, smask, cache)}".encode())
+    for xobject in sorted(page.get_xobjects(), key=lambda item: item[1]):
+        sha256.update(f"xobject:{xobject[1]}:{_stream_hash(doc, xobject[0], cache)}".encode())
+    for font in sorted(page.get_fonts(full=True), key=lambda item: item[4]):
+        sha256.update(f"font:{font[4]}:{_font_identity(font[3])}:{font[2]}:{font[5]}".encode())
+    return sha256.hexdigest()
+
+
+def compute_page_fingerprints(pdf):
+    """Empreintes de toutes les pages du document (chemin ou PDFSource), dans l'ordre"""
+    cache = {}
+    with (pdf.open_fitz() if isinstance(pdf, PDFSource) else fitz.open(pdf)) as doc:
+        return [page_fingerprint(doc, page, cache) for page in doc]
@@ -0,0 +1,58 @@
+"""
+Stockage des images extraites par contenu.
+
+Chaque image est enregistrée une seule fois, sous son empreinte SHA-256 :
+<dossier>/<2 premiers caractères>/<empreinte>.<format>. Une image répétée sur
+plusieurs pages ou dans plusieurs documents (logo, fond de page, en-tête) partage
+le même fichier. Les références sont comptées en base (StoredImage) et les
+fichiers qui ne sont plus référencés sont supprimés par cache.collect_image_store.
+
+Ce module n'accède pas à la base : il est utilisé par les processus d'extraction.
+"""
+import hashlib
+import os
+import tempfile
+
+IMAGE_STORE_FOLDER = os.path.join('media', 'extracted_images', 'store')
+
+
+def get_image_store_folder():
+    return IMAGE_STORE_FOLDER
+
+
+def store_image(folder, image_bytes, image_ext):
+    """
+    Enregistre une image dans le stockage par contenu si elle n'y est pas déjà.
+    Retourne (empreinte, nom de fichier, chemin).
+    """
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+    filename = f"{content_hash}.{image_ext}"
+    shard = os.path.join(folder, content_hash[:2])
+    path = os.path.join(shard, filename)
+    if os.path.exists(path):
+        # Déjà stockée : la date de modification protège le fichier du ramasse-miettes
+        # tant que l'extraction en cours ne l'a pas référencé en base
+        os.utime(path)
+    else:
+        os.makedirs(shard, exist_ok=True)
+        # Écriture atomique : plusieurs extractions peuvent stocker la même image en parallèle
+        fd, temp_path = tempfile.mkstemp(dir=shard, prefix=f".{content_hash}.", suffix=".tmp")
+        with os.fdopen(fd, "wb") as image_file:
+            image_file.write(image_bytes)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    return content_hash, filename, path
+
+
+def iter_stored_files(folder=IMAGE_STORE_FOLDER):
+    """Fichiers du stockage : (chemin, empreinte), empreinte None pour un fichier temporaire"""
+    if not os.path.isdir(folder):
+        return
+    for shard in os.scandir(folder):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.startswith('.'):
+                yield entry.path, None
+            else:
+                yield entry.path, entry.name.split('.', 1)[0]
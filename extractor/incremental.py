@@ -0,0 +1,112 @@
+"""
+Ré-extraction incrémentale d'une révision de document.
+
+Les pages dont l'empreinte (extractor.fingerprints) existe déjà dans le document
+précédent ne sont pas ré-extraites : leur texte, leurs spans, leurs tableaux et
+leurs images sont recopiés, renumérotés si la page a changé de place. Les fichiers
+d'images, stockés par contenu (extractor.imagestore), sont partagés avec le document
+précédent.
+"""
+import os
+
+from .fingerprints import compute_page_fingerprints
+from .models import PDFDocument
+from .ocr import get_extractor_version
+from .sources import PDFSource
+
+
+def _previous_fingerprints(previous):
+    """{empreinte: numéro de page} du document précédent"""
+    pages = list(previous.pages.values_list('page_number', 'fingerprint'))
+    if any(not fingerprint for _, fingerprint in pages) and previous.file:
+        # Document extrait avant l'introduction des empreintes : calculées depuis son PDF
+        try:
+            with PDFSource.from_file(previous.file) as source:
+                computed = compute_page_fingerprints(source)
+        except Exception:
+            computed = []
+        pages = [
+            (page_number, fingerprint or (computed[page_number - 1] if page_number <= len(computed) else ""))
+            for page_number, fingerprint in pages
+        ]
+    by_fingerprint = {}
+    for page_number, fingerprint in pages:
+        if fingerprint:
+            by_fingerprint.setdefault(fingerprint, page_number)
+    return by_fingerprint
+
+
+def plan_page_reuse(previous, fingerprints):
+    """
+    Retourne {numéro de page: numéro de la page identique du document précédent}
+    pour les pages réutilisables (document précédent terminé, même version de
+    l'extracteur, images encore présentes sur le disque)
+    """
+    if (previous is None or previous.status != PDFDocument.STATUS_DONE
+            or previous.extractor_version != get_extractor_version()):
+        return {}
+    by_fingerprint = _previous_fingerprints(previous)
+
+    missing_images = {
+        page_number for page_number, path in previous.images.values_list('page_number', 'path')
+        if not os.path.exists(path)
+    }
+    reuse = {}
+    for index, fingerprint in enumerate(fingerprints):
+        source = by_fingerprint.get(fingerprint)
+        if source is not None and source not in missing_images:
+            reuse[index + 1] = source
+    return reuse
+
+
+def _renumber_page_data(page_data, source_page, page_number):
+    """Adapte identifiants et numéros de page au nouveau numéro"""
+    old_prefix, new_prefix = f"page_{source_page}_", f"page_{page_number}_"
+    page_data["page_number"] = page_number
+    for table in page_data.get("tables", []):
+        table["table_id"] = table["table_id"].replace(old_prefix, new_prefix, 1)
+        table["page"] = page_number
+    for image in page_data.get("images", []):
+        image["image_id"] = image["image_id"].replace(old_prefix, new_prefix, 1)
+        image["page"] = page_number
+    return page_data
+
+
+class ReusedPages:
+    """
+    Pages inchangées d'une révision, recopiées depuis le document précédent.
+    copy_before(n) recopie les pages en attente de numéro inférieur à n, pour que
+    les pages soient enregistrées dans l'ordre (le flux NDJSON en dépend).
+    """
+
+    def __init__(self, document, previous, reuse, fingerprints):
+        self.document = document
+        self.previous = previous
+        self.reuse = reuse
+        self.fingerprints = fingerprints
+        self.pending = sorted(reuse)
+        self.totals = {"pages": 0, "images": 0, "tables": 0, "text_length": 0, "positioned_elements": 0}
+
+    def copy_before(self, page_number=None):
+        while self.pending and (page_number is None or self.pending[0] < page_number):
+            target = self.pending.pop(0)
+            source = self.reuse[target]
+            page_data = self.previous.get_page_data(source)
+            _renumber_page_data(page_data, source, target)
+            self.document.add_page(page_data, fingerprint=self.fingerprints[target - 1])
+            self.totals["pages"] += 1
+            self.totals["images"] += len(page_data["images"])
+            self.totals["tables"] += len(page_data["tables"])
+            self.totals["text_length"] += len(f"\n--- Page {target} ---\n{page_data['text']}\n")
+            self.totals["positioned_elements"] += len(page_data["positioned_text"])
+
+    def update_metadata(self, metadata):
+        """Ajoute les pages recopiées aux statistiques de l'extraction"""
+        for key in ("images", "tables", "text_length", "positioned_elements"):
+            metadata[f"total_{key}"] = metadata.get(f"total_{key}", 0) + self.totals[key]
+        metadata["incremental"] = {
+            "previous_document_id": self.previous.id,
+            "reused_pages": self.totals["pages"],
+            "extracted_pages": metadata.get("total_pages", 0) - self.totals["pages"],
+        }
+        return metadata
@@ -0,0 +1,259 @@
+"""
+Extraction des pages dans des processus isolés, sous budget de temps et de mémoire.
+
+Une page pathologique (flux de contenu démesuré, bombe de décompression, XObjects
+imbriqués sans fin) peut bloquer PyMuPDF ou pdfplumber ou épuiser la mémoire : les
+try/except de l'extraction rattrapent les exceptions, pas un blocage ni un OOM.
+Chaque page est donc confiée à un processus worker (PageWorker) supervisé par le
+processus appelant :
+- au-delà de page_timeout secondes, le worker est tué ;
+- sa mémoire anonyme résidente (RssAnon : tas, piles, tampons décodés, sans les
+  pages du PDF projeté en mémoire qui sont partagées et récupérables par le noyau)
+  est surveillée pendant la page et le worker est tué au-delà de memory_limit_mb ;
+  son espace d'adresses est en outre plafonné (setrlimit) pour
+  qu'une allocation démesurée échoue dans le worker au lieu d'attendre la surveillance ;
+- un worker qui s'arrête anormalement (segfault, OOM killer) est détecté de même.
+La page est alors enregistrée comme un échec structuré (reason : timeout, memory ou
+crash), un nouveau worker est démarré et l'extraction continue à la page suivante.
+L'OCR de la page (tesseract, sous-processus du worker) est soumis au même budget :
+le worker ouvre son propre groupe de processus, tué avec lui, et tesseract hérite
+de la limite d'espace d'adresses.
+Un worker qui ne démarre pas est retiré du pool ; s'il n'en reste aucun, les pages
+restantes sont enregistrées en échec (reason : startup).
+"""
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import wait
+
+from .metrics import enable_page_peaks, status_kb
+from .utils import TABLE_MERGE_IOU, PDFBackends, _safe_extract_page
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Intervalle (s) de surveillance de la mémoire des workers
+POLL_INTERVAL = 0.1
+# Délai (s) accordé à un worker pour démarrer et ouvrir le document
+STARTUP_TIMEOUT = 60
+
+
+def _limit_address_space(memory_limit_mb):
+    """L'espace d'adresses du worker ne peut plus croître de plus de memory_limit_mb"""
+    if resource is None or memory_limit_mb is None:
+        return
+    current_kb = status_kb("VmSize")
+    if current_kb is None:
+        return
+    limit = (current_kb + memory_limit_mb * 1024) * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+
+def _worker_main(conn, source, output_img_folder, table_iou_threshold, memory_limit_mb, ocr):
+    """Boucle d'un worker : reçoit des numéros de page, renvoie leur extraction"""
+    if hasattr(os, "setsid"):
+        # Groupe de processus du worker et de ses tesseract, tués ensemble
+        os.setsid()
+    enable_page_peaks()
+    with PDFBackends(source) as backends:
+        _limit_address_space(memory_limit_mb)
+        conn.send("ready")
+        while True:
+            try:
+                page_num = conn.recv()
+            except EOFError:
+                break
+            if page_num is None:
+                break
+            conn.send((page_num,) + _safe_extract_page(backends, page_num, output_img_folder, table_iou_threshold,
+                                                       ocr))
+
+
+class PageWorker:
+    """Processus d'extraction isolé, ouvert sur un document, qui traite une page à la fois"""
+
+    def __init__(self, context, source, output_img_folder, table_iou_threshold, memory_limit_mb, ocr=None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, source, output_img_folder, table_iou_threshold, memory_limit_mb, ocr),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.page_num = None
+        self.deadline = None
+
+    def wait_ready(self):
+        """True si le worker est prêt ; sinon il est arrêté (code de sortie dans process.exitcode)"""
+        if self.conn.poll(STARTUP_TIMEOUT):
+            try:
+                self.conn.recv()
+                return True
+            except EOFError:
+                # Arrêté au démarrage : son code de sortie est conservé
+                self.process.join(1)
+        self.kill()
+        return False
+
+    def submit(self, page_num, timeout):
+        self.conn.send(page_num)
+        self.page_num = page_num
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def anon_rss_mb(self):
+        """
+        Mémoire anonyme résidente du worker (Mo). VmRSS compterait aussi les pages
+        du fichier projeté en mémoire (PDFSource), qui ne font que croître à la lecture
+        d'un gros PDF ; VmRSS n'est utilisé qu'à défaut de RssAnon (noyau antérieur à 4.5).
+        """
+        rss = status_kb("RssAnon", self.process.pid)
+        if rss is None:
+            rss = status_kb("VmRSS", self.process.pid)
+        return rss / 1024 if rss is not None else None
+
+    def kill(self):
+        try:
+            # Le worker et un éventuel tesseract en cours
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            # Groupe absent (worker arrêté avant setsid, Windows)
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+def _page_failure(page_num, reason, limit, exitcode):
+    """Erreur structurée d'une page abandonnée"""
+    messages = {
+        "timeout": f"délai de {limit} s dépassé",
+        "memory": f"mémoire du worker au-delà de {limit} Mo",
+        "crash": f"arrêt anormal du worker (code {exitcode})",
+        "startup": "le worker n'a pas démarré" + (f" (code {exitcode})" if exitcode is not None else ""),
+    }
+    error = {
+        "error": f"Page {page_num + 1} abandonnée : {messages[reason]}",
+        "page": page_num + 1,
+        "method": "isolation",
+        "reason": reason,
+    }
+    if limit is not None:
+        error["limit"] = limit
+    return error
+
+
+def _check_worker(worker, readable, page_timeout, memory_limit_mb):
+    """
+    Résultat de la page en cours d'un worker : ((page_data, erreurs, mesures), abandonnée),
+    ou None si la page est toujours en cours. Le worker d'une page abandonnée est à remplacer.
+    """
+    if worker.conn in readable:
+        try:
+            page_num, page_data, errors, metrics = worker.conn.recv()
+            return (page_data, errors, metrics), False
+        except (EOFError, OSError):
+            worker.process.join(1)
+            failure = _page_failure(worker.page_num, "crash", None, worker.process.exitcode)
+    elif worker.deadline is not None and time.monotonic() > worker.deadline:
+        failure = _page_failure(worker.page_num, "timeout", page_timeout, None)
+    elif memory_limit_mb is not None and (worker.anon_rss_mb() or 0) > memory_limit_mb:
+        failure = _page_failure(worker.page_num, "memory", memory_limit_mb, None)
+    else:
+        return None
+    return (None, [failure], None), True
+
+
+def iter_pages_isolated(source, page_nums, output_img_folder, workers=1, page_timeout=None,
+                        memory_limit_mb=None, table_iou_threshold=TABLE_MERGE_IOU, ocr=None):
+    """
+    Extrait page_nums de source (PDFSource ou chemin) dans workers processus isolés,
+    une page à la fois par worker, et produit (page_num, page_data, erreurs, mesures)
+    dans l'ordre des pages.
+    Une page qui dépasse page_timeout secondes ou memory_limit_mb Mo de mémoire
+    anonyme résidente, ou dont le worker s'arrête, est produite avec page_data None et une
+    erreur dont reason vaut timeout, memory ou crash ; startup si plus aucun worker
+    n'a pu démarrer.
+    Au plus 2 pages par worker sont extraites en avance sur la page à produire.
+    ocr (extractor.ocr.TesseractOCR) est appliqué par chaque worker aux pages qu'il extrait.
+    """
+    if not page_nums:
+        return
+    context = multiprocessing.get_context("spawn")
+    startup_exitcode = None
+
+    def start_worker():
+        """Worker prêt, ou None s'il n'a pas démarré"""
+        nonlocal startup_exitcode
+        try:
+            worker = PageWorker(context, source, output_img_folder, table_iou_threshold, memory_limit_mb, ocr)
+        except Exception:
+            return None
+        if worker.wait_ready():
+            return worker
+        startup_exitcode = worker.process.exitcode
+        return None
+
+    pool = []
+    try:
+        pool = [start_worker() for _ in range(max(1, min(workers, len(page_nums))))]
+        pool = [worker for worker in pool if worker is not None]
+        window = max(len(pool), 1) * 2
+        results = {}
+        next_index = 0
+        submit_index = 0
+        while next_index < len(page_nums):
+            while next_index < len(page_nums) and page_nums[next_index] in results:
+                page_num = page_nums[next_index]
+                yield (page_num,) + results.pop(page_num)
+                next_index += 1
+
+            if not pool:
+                # Aucun worker n'a pu démarrer : les pages restantes sont en échec
+                for page_num in page_nums[submit_index:]:
+                    results[page_num] = (None, [_page_failure(page_num, "startup", None, startup_exitcode)], None)
+                submit_index = len(page_nums)
+                continue
+
+            for worker in pool:
+                if worker.page_num is None and submit_index < min(len(page_nums), next_index + window):
+                    worker.submit(page_nums[submit_index], page_timeout)
+                    submit_index += 1
+
+            busy = [worker for worker in pool if worker.page_num is not None]
+            if not busy:
+                continue
+            readable = wait([worker.conn for worker in busy], timeout=POLL_INTERVAL)
+            for index, worker in enumerate(pool):
+                if worker.page_num is None:
+                    continue
+                checked = _check_worker(worker, readable, page_timeout, memory_limit_mb)
+                if checked is None:
+                    continue
+                results[worker.page_num], abandoned = checked
+                if abandoned:
+                    worker.kill()
+                    pool[index] = start_worker()
+                else:
+                    worker.page_num = None
+            pool = [worker for worker in pool if worker is not None]
+    finally:
+        for worker in pool:
+            if worker is not None:
+                worker.stop()
@@ -0,0 +1,204 @@
+"""
+File d'attente des extractions PDF.
+
+La base de données sert de file : chaque PDFDocument porte l'état de sa tâche
+(queued / running / done / failed). Un pool de threads local au processus Django
+exécute les tâches au fil de l'eau ; la commande `run_extraction_worker` permet
+de les traiter depuis un processus séparé et de reprendre celles restées en attente.
+
+Chaque extraction terminée est comptabilisée dans le registre de métriques du
+processus (extractor.metrics) ; PDF_EXTRACTION_PROFILER permet d'enregistrer en
+plus un profil de chaque tâche dans media/profiles/.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .fingerprints import compute_page_fingerprints
+from .imagestore import get_image_store_folder
+from .incremental import ReusedPages, plan_page_reuse
+from .metrics import REGISTRY, ExtractionProfiler
+from .models import PDFDocument
+from .ocr import get_extractor_version, get_ocr_engine
+from .sources import PDFSource
+from .utils import extract_pdf_content
+
+_executor = None
+_executor_lock = threading.Lock()
+
+PROFILES_FOLDER = os.path.join('media', 'profiles')
+
+
+def get_output_folder(document):
+    """
+    Dossier des images d'un document extrait avant le stockage par contenu
+    (extractor.imagestore), supprimé avec le document
+    """
+    return os.path.join('media', 'extracted_images', str(document.id))
+
+
+def get_profile_path(document):
+    """Chemin du profil d'extraction d'un document, sans extension (cprofile : .prof, pyinstrument : .html)"""
+    return os.path.join(PROFILES_FOLDER, f"document_{document.id}")
+
+
+def _get_profiler(document):
+    """Profileur configuré par PDF_EXTRACTION_PROFILER (None, 'cprofile' ou 'pyinstrument')"""
+    kind = getattr(settings, 'PDF_EXTRACTION_PROFILER', None)
+    if not kind:
+        return None
+    return ExtractionProfiler(kind, get_profile_path(document))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PDF_EXTRACTION_WORKERS', 2),
+                thread_name_prefix='pdf-extraction'
+            )
+        return _executor
+
+
+def enqueue_extraction(document):
+    """
+    Place le document dans la file. Si le pool local est actif, la tâche lui est
+    soumise dès que la transaction courante est validée.
+    """
+    PDFDocument.objects.filter(id=document.id).update(
+        status=PDFDocument.STATUS_QUEUED,
+        pages_processed=0,
+        error_message=''
+    )
+    document.status = PDFDocument.STATUS_QUEUED
+    if getattr(settings, 'PDF_EXTRACTION_WORKERS', 2) > 0:
+        document_id = document.id
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, document_id))
+
+
+def claim_document(document_id):
+    """Passe atomiquement un document de queued à running ; False s'il est déjà pris"""
+    return PDFDocument.objects.filter(
+        id=document_id,
+        status=PDFDocument.STATUS_QUEUED
+    ).update(status=PDFDocument.STATUS_RUNNING) == 1
+
+
+def next_queued_document_id():
+    """Identifiant du plus ancien document en attente, ou None"""
+    return PDFDocument.objects.filter(
+        status=PDFDocument.STATUS_QUEUED
+    ).order_by('uploaded_at').values_list('id', flat=True).first()
+
+
+def run_extraction(document_id):
+    """
+    Exécute l'extraction d'un document en attente.
+    Pour une révision (previous_document), seules les pages dont l'empreinte a
+    changé sont extraites ; les autres sont recopiées depuis le document précédent.
+    Retourne False si le document a déjà été pris par un autre worker.
+    """
+    if not claim_document(document_id):
+        return False
+
+    document = PDFDocument.objects.get(id=document_id)
+    source = None
+
+    try:
+        # Chaque page est enregistrée dès qu'elle est extraite : le résultat
+        # final ne contient plus que les métadonnées et les erreurs
+        document.clear_pages()
+        output_folder = get_image_store_folder()
+        # Fichier lu une seule fois (projeté, ou lu depuis le stockage) pour les
+        # empreintes et pour tous les moteurs d'extraction
+        source = PDFSource.from_file(document.file)
+        try:
+            fingerprints = compute_page_fingerprints(source)
+        except Exception:
+            fingerprints = []
+        reuse = plan_page_reuse(document.previous_document, fingerprints)
+        reused_pages = ReusedPages(document, document.previous_document, reuse, fingerprints)
+
+        def report_progress(pages_processed, pages_to_process):
+            PDFDocument.objects.filter(id=document_id).update(
+                pages_processed=reused_pages.totals["pages"] + pages_processed,
+                pages_total=len(reuse) + pages_to_process
+            )
+
+        def add_page(page_data):
+            page_number = page_data["page_number"]
+            reused_pages.copy_before(page_number)
+            fingerprint = fingerprints[page_number - 1] if page_number <= len(fingerprints) else ""
+            document.add_page(page_data, fingerprint=fingerprint)
+
+        profiler = _get_profiler(document)
+        with profiler or nullcontext():
+            extraction_results = extract_pdf_content(
+                source,
+                output_folder,
+                progress_callback=report_progress,
+                workers=getattr(settings, 'PDF_EXTRACTION_PROCESSES', 1),
+                chunk_size=getattr(settings, 'PDF_EXTRACTION_CHUNK_SIZE', 8),
+                page_callback=add_page,
+                collect_pages=False,
+                table_iou_threshold=getattr(settings, 'PDF_TABLE_IOU_THRESHOLD', 0.5),
+                page_timeout=getattr(settings, 'PDF_PAGE_TIMEOUT_SECONDS', None),
+                page_memory_limit_mb=getattr(settings, 'PDF_PAGE_MEMORY_LIMIT_MB', None),
+                ocr=get_ocr_engine(),
+                pages=[index for index in range(len(fingerprints)) if index + 1 not in reuse] if reuse else None
+            )
+        reused_pages.copy_before()
+        if reuse:
+            reused_pages.update_metadata(extraction_results['metadata'])
+            report_progress(len(fingerprints) - len(reuse), len(fingerprints) - len(reuse))
+        document.refresh_from_db(fields=['pages_processed', 'pages_total'])
+        document.extraction_results = {
+            key: extraction_results[key] for key in ('metadata', 'extraction_errors') if key in extraction_results
+        }
+        metrics = extraction_results['metadata'].get('metrics')
+        if profiler is not None and metrics is not None:
+            metrics['profile'] = profiler.path
+            if profiler.error:
+                metrics['profile_error'] = profiler.error
+        document.set_counters(extraction_results['metadata'])
+        document.extraction_completed = True
+        document.extraction_date = timezone.now()
+        document.extractor_version = get_extractor_version()
+        document.status = PDFDocument.STATUS_DONE
+        document.save()
+        REGISTRY.record_document(PDFDocument.STATUS_DONE, metrics)
+    except Exception as e:
+        document.status = PDFDocument.STATUS_FAILED
+        document.error_message = f'Erreur lors du traitement du PDF: {str(e)}'
+        document.save(update_fields=['status', 'error_message'])
+        REGISTRY.record_document(PDFDocument.STATUS_FAILED)
+    finally:
+        if source is not None:
+            source.close()
+    return True
+
+
+def queue_gauges():
+    """Métriques instantanées de la file, lues en base, pour REGISTRY.render"""
+    counts = dict.fromkeys((status for status, _ in PDFDocument.STATUS_CHOICES), 0)
+    for row in PDFDocument.objects.values('status').annotate(count=Count('id')):
+        counts[row['status']] = row['count']
+    return [
+        ("pdf_extractor_documents", "Documents par statut d'extraction",
+         [({"status": status}, count) for status, count in counts.items()]),
+    ]
+
+
+def _run_in_thread(document_id):
+    close_old_connections()
+    try:
+        run_extraction(document_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,87 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from extractor.benchmark import (
+    BENCHMARK_FOLDER, CORPUS, compare_results, format_report, generate_corpus, run_benchmark
+)
+from extractor.ocr import get_ocr_engine
+
+
+class Command(BaseCommand):
+    help = "Mesure les performances du pipeline d'extraction sur un corpus synthétique"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=os.path.join(BENCHMARK_FOLDER, 'corpus'),
+                            help="Dossier du corpus généré")
+        parser.add_argument('--quick', action='store_true',
+                            help="Corpus réduit (environ un dixième des pages)")
+        parser.add_argument('--only', default=None,
+                            help=f"Documents à mesurer, séparés par des virgules ({', '.join(CORPUS)})")
+        parser.add_argument('--regenerate', action='store_true',
+                            help="Régénère le corpus même s'il existe déjà")
+        parser.add_argument('--repeat', type=int, default=1,
+                            help="Nombre d'exécutions par document (meilleur temps retenu)")
+        parser.add_argument('--output', default=None,
+                            help="Fichier JSON où enregistrer les mesures")
+        parser.add_argument('--baseline', default=os.path.join(BENCHMARK_FOLDER, 'baseline.json'),
+                            help="Mesures de référence auxquelles comparer")
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Enregistre les mesures comme nouvelle référence")
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help="Dégradation relative signalée comme régression (0.1 = 10 %%)")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Termine en erreur si une régression est détectée")
+
+    def handle(self, *args, **options):
+        names = None
+        if options['only']:
+            names = [name.strip() for name in options['only'].split(',') if name.strip()]
+            unknown = [name for name in names if name not in CORPUS]
+            if unknown:
+                raise CommandError(f"Documents inconnus : {', '.join(unknown)}")
+
+        # OCR selon PDF_OCR_ENABLED, comme les extractions du serveur
+        ocr = get_ocr_engine()
+        if ocr is not None and ocr.error:
+            raise CommandError(ocr.error)
+
+        self.stdout.write("Génération du corpus...")
+        corpus = generate_corpus(options['corpus'], quick=options['quick'], names=names,
+                                 force=options['regenerate'])
+
+        def progress(name, document):
+            self.stdout.write(f"  {name} : {document['pages']} pages en {document['seconds']:.2f} s")
+
+        results = run_benchmark(corpus, os.path.join(BENCHMARK_FOLDER, 'output'),
+                                repeat=max(1, options['repeat']), progress=progress, ocr=ocr)
+        results['quick'] = options['quick']
+
+        comparison = None
+        if os.path.exists(options['baseline']) and not options['save_baseline']:
+            with open(options['baseline'], encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+            if baseline.get('quick') != options['quick']:
+                self.stdout.write(self.style.WARNING("Référence mesurée sur un autre corpus (--quick) : non comparée"))
+            elif baseline.get('ocr') != results['ocr']:
+                self.stdout.write(self.style.WARNING("Référence mesurée avec un autre réglage OCR : non comparée"))
+            else:
+                comparison = compare_results(results, baseline, options['threshold'])
+
+        self.stdout.write("")
+        self.stdout.write(format_report(results, comparison))
+
+        if options['output']:
+            self._write(options['output'], results)
+        if options['save_baseline']:
+            self._write(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f"Référence enregistrée dans {options['baseline']}"))
+
+        if options['fail_on_regression'] and comparison and any(row['regression'] for row in comparison):
+            raise CommandError("Régression de performance détectée")
+
+    def _write(self, path, results):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=2)
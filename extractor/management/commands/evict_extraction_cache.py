@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from extractor.cache import collect_image_store, evict_cache
+from extractor.derivatives import evict_derivatives
+from extractor.ocr import OCR_CACHE_FOLDER
+from extractor.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Évince du cache les documents extraits les plus anciens ou les moins utilisés"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-days', type=float,
+                            default=getattr(settings, 'PDF_EXTRACTION_CACHE_MAX_AGE_DAYS', None),
+                            help="Supprime les documents non consultés depuis ce nombre de jours")
+        parser.add_argument('--max-size-mb', type=float, default=None,
+                            help="Taille maximale du cache en Mo (PDF et images extraites)")
+
+    def handle(self, *args, **options):
+        max_bytes = getattr(settings, 'PDF_EXTRACTION_CACHE_MAX_BYTES', None)
+        if options['max_size_mb'] is not None:
+            max_bytes = int(options['max_size_mb'] * 1024 * 1024)
+        evicted, freed = evict_cache(max_age_days=options['max_age_days'], max_bytes=max_bytes)
+        self.stdout.write(f"{evicted} document(s) évincé(s), {freed / (1024 * 1024):.1f} Mo libérés")
+        
+        # Images du stockage par contenu qui ne sont plus référencées
+        deleted, freed = collect_image_store(getattr(settings, 'PDF_IMAGE_STORE_GRACE_HOURS', 1))
+        self.stdout.write(f"{deleted} image(s) supprimée(s), {freed / (1024 * 1024):.1f} Mo libérés")
+        
+        # Vignettes et aperçus les moins récemment utilisés
+        max_derivative_bytes = getattr(settings, 'PDF_DERIVATIVES_MAX_BYTES', None)
+        if max_derivative_bytes is not None:
+            deleted, freed = evict_derivatives(max_derivative_bytes)
+            self.stdout.write(f"{deleted} vignette(s) supprimée(s), {freed / (1024 * 1024):.1f} Mo libérés")
+        
+        # Résultats OCR les moins récemment utilisés
+        max_ocr_bytes = getattr(settings, 'PDF_OCR_CACHE_MAX_BYTES', None)
+        if max_ocr_bytes is not None:
+            deleted, freed = evict_derivatives(max_ocr_bytes, folder=OCR_CACHE_FOLDER)
+            self.stdout.write(f"{deleted} résultat(s) OCR supprimé(s), {freed / (1024 * 1024):.1f} Mo libérés")
+        
+        # Uploads par morceaux abandonnés
+        max_age_hours = getattr(settings, 'PDF_UPLOAD_SESSION_MAX_AGE_HOURS', None)
+        if max_age_hours is not None:
+            purged = purge_stale_uploads(max_age_hours)
+            self.stdout.write(f"{purged} upload(s) inachevé(s) supprimé(s)")
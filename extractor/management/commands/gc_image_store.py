@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from extractor.cache import collect_image_store
+
+
+class Command(BaseCommand):
+    help = "Supprime du stockage les images extraites qui ne sont plus référencées par aucun document"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float,
+                            default=getattr(settings, 'PDF_IMAGE_STORE_GRACE_HOURS', 1),
+                            help="Conserve les images écrites depuis moins de ce nombre d'heures")
+
+    def handle(self, *args, **options):
+        deleted, freed = collect_image_store(grace_hours=options['grace_hours'])
+        self.stdout.write(f"{deleted} image(s) supprimée(s), {freed / (1024 * 1024):.1f} Mo libérés")
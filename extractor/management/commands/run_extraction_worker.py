@@ -0,0 +1,68 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from extractor.jobs import next_queued_document_id, queue_gauges, run_extraction
+from extractor.metrics import REGISTRY
+from extractor.models import PDFDocument
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Expose les métriques du worker (GET /metrics) au format texte de Prometheus"""
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        try:
+            body = REGISTRY.render(queue_gauges()).encode('utf-8')
+        finally:
+            close_old_connections()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Traite les extractions PDF en attente dans un processus séparé"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Vide la file puis s'arrête au lieu d'attendre de nouvelles tâches")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Délai en secondes entre deux consultations de la file")
+        parser.add_argument('--requeue-running', action='store_true',
+                            help="Remet en file les tâches restées 'running' après un arrêt brutal")
+        parser.add_argument('--metrics-port', type=int, default=None,
+                            help="Port HTTP sur lequel exposer les métriques du worker (/metrics)")
+
+    def handle(self, *args, **options):
+        if options['metrics_port'] is not None:
+            server = ThreadingHTTPServer(('', options['metrics_port']), MetricsHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.stdout.write(f"Métriques exposées sur le port {options['metrics_port']} (/metrics)")
+
+        if options['requeue_running']:
+            count = PDFDocument.objects.filter(
+                status=PDFDocument.STATUS_RUNNING
+            ).update(status=PDFDocument.STATUS_QUEUED, pages_processed=0)
+            self.stdout.write(f"{count} tâche(s) remise(s) en file")
+
+        while True:
+            document_id = next_queued_document_id()
+            if document_id is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            if run_extraction(document_id):
+                document = PDFDocument.objects.get(id=document_id)
+                self.stdout.write(f"Document {document_id} : {document.status}")
@@ -0,0 +1,429 @@
+"""
+Mesures de l'extraction.
+
+Chaque page extraite est mesurée (PageMetrics) : durée réelle et temps CPU de chaque
+étape du pipeline (PAGE_STAGES) et de la page entière, pic de mémoire résidente pendant
+la page (dans un processus dédié à l'extraction, voir enable_page_peaks), et nombre de
+spans, d'images et de tableaux par moteur.
+ExtractionMetrics agrège ces mesures pour un document (metadata["metrics"] du
+résultat) ; le registre du processus (REGISTRY) les cumule d'un document à l'autre
+et les expose au format texte de Prometheus.
+
+Ce module n'accède pas à la base : il est utilisé par les processus d'extraction.
+"""
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Étapes du pipeline d'une page (extract_page_content) ; "ocr" n'est mesurée que si l'OCR est activé
+PAGE_STAGES = ("fitz_text", "fitz_images", "pdfium_images", "plumber_tables", "text_block_tables", "ocr")
+
+# Nombre de pages les plus lentes détaillées dans les métriques d'un document
+SLOWEST_PAGES = 10
+
+# Pic de mémoire mesuré page par page : uniquement dans un processus qui n'extrait
+# qu'une page à la fois (worker du pool, worker isolé). Le pic est propre au processus :
+# le remettre à zéro depuis un thread d'extraction du serveur fausserait les mesures
+# des extractions concurrentes.
+_page_peaks = False
+
+
+def enable_page_peaks():
+    """À appeler au démarrage d'un processus dédié à l'extraction, une page à la fois"""
+    global _page_peaks
+    _page_peaks = True
+
+
+def status_kb(field, pid="self"):
+    """Valeur (ko) d'un champ de /proc/<pid>/status (VmRSS, VmHWM...), None hors Linux"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """
+    Pic de mémoire résidente du processus (Mo), depuis son démarrage ou le dernier
+    reset_peak_rss(). Sous Linux, VmHWM est propre à l'espace mémoire du processus
+    (ru_maxrss survit à exec() et reprendrait le pic du processus parent).
+    """
+    peak = status_kb("VmHWM")
+    if peak is not None:
+        return round(peak / 1024, 1)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Octets sous macOS, kilo-octets sous Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def reset_peak_rss():
+    """Remet le pic de mémoire résidente au niveau actuel (Linux) ; False si impossible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _count_by_method(items, key):
+    counts = {}
+    for item in items:
+        method = item.get(key) or "inconnu"
+        counts[method] = counts.get(method, 0) + 1
+    return counts
+
+
+def count_page_items(page_data):
+    """Spans, images et tableaux d'une page extraite, par moteur"""
+    spans = len(page_data.get("positioned_text", []))
+    ocr_words = page_data.get("ocr", {}).get("words", 0)
+    span_counts = {"PyMuPDF": spans - ocr_words}
+    if ocr_words:
+        span_counts["OCR"] = ocr_words
+    return {
+        "spans": span_counts,
+        "images": _count_by_method(page_data.get("images", []), "extraction_method"),
+        "tables": _count_by_method(page_data.get("tables", []), "extraction_method"),
+    }
+
+
+class PageMetrics:
+    """
+    Mesures d'une page, prises dans le thread qui l'extrait : le temps CPU est celui
+    du thread (time.thread_time), les extractions concurrentes ne s'additionnent pas.
+    Le pic de mémoire est celui du processus pendant la page, None hors d'un processus
+    dédié (enable_page_peaks).
+    """
+
+    def __init__(self, page_number):
+        self.page_number = page_number
+        self.stages = {}
+        if _page_peaks:
+            reset_peak_rss()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+
+    @contextmanager
+    def stage(self, name):
+        """Ajoute la durée réelle et le temps CPU du bloc à l'étape name"""
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+            stage["wall_seconds"] += time.perf_counter() - wall
+            stage["cpu_seconds"] += time.thread_time() - cpu
+
+    def finish(self, page_data):
+        """Mesures de la page, sérialisables (transmises depuis les processus du pool)"""
+        return {
+            "page": self.page_number,
+            "wall_seconds": round(time.perf_counter() - self._wall, 4),
+            "cpu_seconds": round(time.thread_time() - self._cpu, 4),
+            "peak_rss_mb": peak_rss_mb() if _page_peaks else None,
+            "stages": {
+                name: {key: round(value, 4) for key, value in stage.items()}
+                for name, stage in self.stages.items()
+            },
+            "counts": count_page_items(page_data),
+        }
+
+
+class ExtractionMetrics:
+    """Agrège les mesures des pages d'un document, dans l'ordre où elles sont produites"""
+
+    def __init__(self):
+        self._wall = time.perf_counter()
+        self.page_times = []
+        self.stages = {}
+        self.counts = {"spans": {}, "images": {}, "tables": {}}
+        self.failed_pages = {}
+        self.slowest = []
+
+    def add_page(self, page_metrics, errors=()):
+        """
+        page_metrics : résultat de PageMetrics.finish, None pour une page en échec ;
+        la cause de l'échec est lue dans ses erreurs (reason, "exception" par défaut)
+        """
+        if page_metrics is None:
+            reason = next((error["reason"] for error in errors if "reason" in error), "exception")
+            self.failed_pages[reason] = self.failed_pages.get(reason, 0) + 1
+            return
+        self.page_times.append({
+            "page": page_metrics["page"],
+            "wall_seconds": page_metrics["wall_seconds"],
+            "cpu_seconds": page_metrics["cpu_seconds"],
+            "peak_rss_mb": page_metrics["peak_rss_mb"],
+        })
+        for name, stage in page_metrics["stages"].items():
+            total = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "pages": 0})
+            total["wall_seconds"] += stage["wall_seconds"]
+            total["cpu_seconds"] += stage["cpu_seconds"]
+            total["pages"] += 1
+        for kind, methods in page_metrics["counts"].items():
+            for method, count in methods.items():
+                self.counts[kind][method] = self.counts[kind].get(method, 0) + count
+        self.slowest.append(page_metrics)
+        if len(self.slowest) > SLOWEST_PAGES * 2:
+            self._trim_slowest()
+
+    def _trim_slowest(self):
+        self.slowest = sorted(self.slowest, key=lambda page: page["wall_seconds"], reverse=True)[:SLOWEST_PAGES]
+
+    def as_dict(self):
+        """
+        Mesures du document, enregistrées dans metadata["metrics"]. peak_rss_scope indique
+        la portée de peak_rss_mb : "page" (pic le plus élevé des pages, mesurées dans des
+        processus d'extraction dédiés) ou "process" (pic du processus depuis son démarrage,
+        extractions concurrentes comprises, quand les pages ont été extraites sur place).
+        """
+        self._trim_slowest()
+        wall_seconds = time.perf_counter() - self._wall
+        peaks = [page["peak_rss_mb"] for page in self.page_times if page["peak_rss_mb"] is not None]
+        if peaks:
+            peak, peak_scope = max(peaks), "page"
+        else:
+            peak, peak_scope = peak_rss_mb(), "process"
+        return {
+            "wall_seconds": round(wall_seconds, 4),
+            "cpu_seconds": round(sum(page["cpu_seconds"] for page in self.page_times), 4),
+            "pages": len(self.page_times),
+            "failed_pages": self.failed_pages,
+            "pages_per_second": round(len(self.page_times) / wall_seconds, 2) if wall_seconds else None,
+            "peak_rss_mb": peak,
+            "peak_rss_scope": peak_scope,
+            "stages": {
+                name: {
+                    "wall_seconds": round(stage["wall_seconds"], 4),
+                    "cpu_seconds": round(stage["cpu_seconds"], 4),
+                    "pages": stage["pages"],
+                }
+                for name, stage in self.stages.items()
+            },
+            "counts": self.counts,
+            "page_times": self.page_times,
+            "slowest_pages": self.slowest,
+        }
+
+
+# Métriques exposées : nom -> (type, description)
+METRICS = {
+    "pdf_extractor_documents_total": ("counter", "Extractions terminées, par statut"),
+    "pdf_extractor_pages_total": ("counter", "Pages extraites"),
+    "pdf_extractor_failed_pages_total": ("counter", "Pages dont l'extraction a échoué, par cause"),
+    "pdf_extractor_stage_wall_seconds_total": ("counter", "Durée réelle cumulée de chaque étape"),
+    "pdf_extractor_stage_cpu_seconds_total": ("counter", "Temps CPU cumulé de chaque étape"),
+    "pdf_extractor_extracted_items_total": ("counter", "Spans, images et tableaux extraits, par moteur"),
+    "pdf_extractor_document_seconds": ("histogram", "Durée d'extraction d'un document"),
+    "pdf_extractor_document_cpu_seconds": ("histogram", "Temps CPU d'extraction d'un document"),
+    "pdf_extractor_page_seconds": ("histogram", "Durée d'extraction d'une page"),
+    "pdf_extractor_document_peak_rss_bytes": ("histogram", "Pic de mémoire résidente des pages d'un document"),
+}
+
+HISTOGRAM_BUCKETS = {
+    "pdf_extractor_document_seconds": (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+    "pdf_extractor_document_cpu_seconds": (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+    "pdf_extractor_page_seconds": (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    "pdf_extractor_document_peak_rss_bytes": tuple(
+        megabytes * 1024 * 1024 for megabytes in (128, 256, 512, 1024, 2048, 4096, 8192)
+    ),
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Compteurs et histogrammes du processus, cumulés depuis son démarrage.
+    Chaque processus qui exécute des extractions (serveur Django, run_extraction_worker)
+    expose les siens ; Prometheus les additionne.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def _increment(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name, value):
+        buckets = HISTOGRAM_BUCKETS[name]
+        histogram = self._histograms.setdefault(name, {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0})
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["buckets"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+    def record_document(self, status, metrics=None):
+        """Comptabilise une extraction terminée ; metrics : metadata["metrics"] du résultat"""
+        with self._lock:
+            self._increment("pdf_extractor_documents_total", 1, status=status)
+            if not metrics:
+                return
+            self._increment("pdf_extractor_pages_total", metrics["pages"])
+            for reason, count in metrics["failed_pages"].items():
+                self._increment("pdf_extractor_failed_pages_total", count, reason=reason)
+            for stage, totals in metrics["stages"].items():
+                self._increment("pdf_extractor_stage_wall_seconds_total", totals["wall_seconds"], stage=stage)
+                self._increment("pdf_extractor_stage_cpu_seconds_total", totals["cpu_seconds"], stage=stage)
+            for kind, methods in metrics["counts"].items():
+                for method, count in methods.items():
+                    self._increment("pdf_extractor_extracted_items_total", count, kind=kind, backend=method)
+            self._observe("pdf_extractor_document_seconds", metrics["wall_seconds"])
+            self._observe("pdf_extractor_document_cpu_seconds", metrics["cpu_seconds"])
+            for page in metrics["page_times"]:
+                self._observe("pdf_extractor_page_seconds", page["wall_seconds"])
+            # Le pic d'un processus qui extrait plusieurs documents n'est pas celui du document
+            if metrics["peak_rss_mb"] is not None and metrics.get("peak_rss_scope") == "page":
+                self._observe("pdf_extractor_document_peak_rss_bytes", metrics["peak_rss_mb"] * 1024 * 1024)
+
+    def render(self, gauges=()):
+        """
+        Métriques au format texte de Prometheus. gauges : métriques instantanées
+        supplémentaires, (nom, description, [(labels, valeur)]).
+        """
+        lines = []
+        with self._lock:
+            for name, (metric_type, description) in METRICS.items():
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+                if metric_type == "counter":
+                    samples = sorted(
+                        (labels, value) for (key, labels), value in self._counters.items() if key == name
+                    )
+                    for labels, value in samples:
+                        lines.append(f"{name}{_labels(labels)} {_format_value(value)}")
+                    continue
+                histogram = self._histograms.get(name, {
+                    "buckets": [0] * len(HISTOGRAM_BUCKETS[name]), "sum": 0.0, "count": 0
+                })
+                for bound, count in zip(HISTOGRAM_BUCKETS[name], histogram["buckets"]):
+                    lines.append(f"{name}_bucket{_labels([('le', _format_value(bound))])} {count}")
+                lines.append(f"{name}_bucket{_labels([('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum {_format_value(histogram['sum'])}")
+                lines.append(f"{name}_count {histogram['count']}")
+        process_peak = peak_rss_mb()
+        if process_peak is not None:
+            gauges = [("pdf_extractor_process_peak_rss_bytes", "Pic de mémoire résidente du processus",
+                       [({}, process_peak * 1024 * 1024)])] + list(gauges)
+        for name, description, samples in gauges:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+# Un seul profil à la fois par processus (voir ExtractionProfiler)
+_profiler_lock = threading.Lock()
+
+
+class ExtractionProfiler:
+    """
+    Profil d'une extraction, enregistré dans path : cProfile (.prof, à lire avec
+    pstats ou snakeviz) ou pyinstrument (.html). Seul le thread qui exécute le bloc
+    est profilé ; les pages confiées au pool de processus n'y figurent pas.
+    Un seul profil à la fois par processus (depuis Python 3.12, deux cProfile actifs
+    en même temps lèvent une erreur) : une extraction lancée pendant qu'une autre est
+    profilée n'est pas profilée, et la raison est notée dans error.
+    """
+
+    EXTENSIONS = {"cprofile": ".prof", "pyinstrument": ".html"}
+
+    def __init__(self, kind, path):
+        if kind not in self.EXTENSIONS:
+            raise ValueError(f"Profileur inconnu : {kind} (cprofile ou pyinstrument)")
+        self.kind = kind
+        self.path = os.path.splitext(path)[0] + self.EXTENSIONS[kind]
+        self.error = None
+        self._profiler = None
+        self._locked = False
+
+    def _skip(self, reason):
+        self.error = reason
+        logger.warning("Extraction non profilée (%s) : %s", self.path, reason)
+
+    def __enter__(self):
+        if not _profiler_lock.acquire(blocking=False):
+            self._skip("un autre profil est en cours dans ce processus")
+            return self
+        self._locked = True
+        try:
+            if self.kind == "cprofile":
+                profiler = cProfile.Profile()
+                profiler.enable()
+            else:
+                try:
+                    from pyinstrument import Profiler
+                except ImportError:
+                    self._skip("pyinstrument n'est pas installé")
+                    self._release()
+                    return self
+                profiler = Profiler()
+                profiler.start()
+        except (RuntimeError, ValueError) as e:
+            # Profileur déjà actif hors de ce module (débogueur, autre outil)
+            self._skip(str(e))
+            self._release()
+            return self
+        self._profiler = profiler
+        return self
+
+    def _release(self):
+        if self._locked:
+            self._locked = False
+            _profiler_lock.release()
+
+    def __exit__(self, *exc_info):
+        if self._profiler is None:
+            self.path = None
+            return False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if self.kind == "cprofile":
+                self._profiler.disable()
+                self._profiler.dump_stats(self.path)
+            else:
+                self._profiler.stop()
+                with open(self.path, "w", encoding="utf-8") as output:
+                    output.write(self._profiler.output_html())
+        finally:
+            self._release()
+        return False
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+def backfill_job_status(apps, schema_editor):
+    """
+    Documents antérieurs à la file d'extraction : terminés, ou en échec s'ils
+    n'ont jamais abouti (ils ne sont pas remis en file au déploiement)
+    """
+    PDFDocument = apps.get_model('extractor', 'PDFDocument')
+    PDFDocument.objects.filter(extraction_completed=True).update(status='done')
+    PDFDocument.objects.filter(extraction_completed=False).update(
+        status='failed',
+        error_message="Extraction antérieure à la file d'extraction, jamais terminée : téléverser à nouveau le PDF"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extractor', '0002_pdfdocument_extraction_completed_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='error_message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='pages_processed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='pages_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='status',
+            field=models.CharField(choices=[('queued', 'En attente'), ('running', 'En cours'), ('done', 'Terminée'), ('failed', 'Échec')], db_index=True, default='queued', max_length=16),
+        ),
+        migrations.RunPython(backfill_job_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,117 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extractor', '0004_pdfdocument_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='positioned_element_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='table_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='text_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ExtractedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('image_id', models.CharField(max_length=100)),
+                ('filename', models.CharField(max_length=255)),
+                ('path', models.CharField(max_length=500)),
+                ('format', models.CharField(blank=True, max_length=16)),
+                ('width', models.PositiveIntegerField(default=0)),
+                ('height', models.PositiveIntegerField(default=0)),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('mode', models.CharField(blank=True, max_length=16)),
+                ('extraction_method', models.CharField(blank=True, max_length=50)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='extractor.pdfdocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['document', 'page_number'], name='extractor_e_documen_c0190e_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Page',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('width', models.FloatField(default=0)),
+                ('height', models.FloatField(default=0)),
+                ('rotation', models.IntegerField(default=0)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='extractor.pdfdocument')),
+            ],
+            options={
+                'ordering': ['page_number'],
+                'constraints': [models.UniqueConstraint(fields=('document', 'page_number'), name='unique_document_page')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Table',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('table_id', models.CharField(max_length=100)),
+                ('data', models.JSONField(default=list)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('columns', models.PositiveIntegerField(default=0)),
+                ('has_borders', models.BooleanField(default=False)),
+                ('has_headers', models.BooleanField(default=False)),
+                ('extraction_method', models.CharField(blank=True, max_length=50)),
+                ('csv_data', models.TextField(blank=True, null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tables', to='extractor.pdfdocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['document', 'page_number'], name='extractor_t_documen_3ee442_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TextSpan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('x0', models.FloatField()),
+                ('y0', models.FloatField()),
+                ('x1', models.FloatField()),
+                ('y1', models.FloatField()),
+                ('font', models.CharField(blank=True, max_length=255)),
+                ('size', models.FloatField(default=0)),
+                ('flags', models.IntegerField(default=0)),
+                ('color', models.BigIntegerField(default=0)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='text_spans', to='extractor.pdfdocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['document', 'page_number'], name='extractor_t_documen_786e37_idx')],
+            },
+        ),
+    ]
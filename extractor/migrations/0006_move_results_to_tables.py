@@ -0,0 +1,125 @@
+from django.db import migrations
+
+
+def move_results_to_tables(apps, schema_editor):
+    """Répartit les résultats JSON existants dans les tables Page, TextSpan, Table et ExtractedImage"""
+    PDFDocument = apps.get_model('extractor', 'PDFDocument')
+    Page = apps.get_model('extractor', 'Page')
+    TextSpan = apps.get_model('extractor', 'TextSpan')
+    Table = apps.get_model('extractor', 'Table')
+    ExtractedImage = apps.get_model('extractor', 'ExtractedImage')
+
+    for document in PDFDocument.objects.exclude(extraction_results=None).iterator():
+        results = document.extraction_results
+        if 'pages' not in results:
+            continue
+        for page_data in results['pages']:
+            page_number = page_data['page_number']
+            bbox = page_data.get('bbox') or [0, 0, 0, 0]
+            Page.objects.create(
+                document=document, page_number=page_number, text=page_data.get('text', ''),
+                width=bbox[2], height=bbox[3], rotation=page_data.get('rotation', 0)
+            )
+            TextSpan.objects.bulk_create(
+                TextSpan(
+                    document=document, page_number=page_number, position=position,
+                    text=span['text'], x0=span['bbox'][0], y0=span['bbox'][1],
+                    x1=span['bbox'][2], y1=span['bbox'][3], font=span.get('font', ''),
+                    size=span.get('size', 0), flags=span.get('flags', 0), color=span.get('color', 0)
+                )
+                for position, span in enumerate(page_data.get('positioned_text', []))
+            )
+            Table.objects.bulk_create(
+                Table(
+                    document=document, page_number=page_number, position=position,
+                    table_id=table['table_id'], data=table.get('data', []),
+                    rows=table.get('rows', 0), columns=table.get('columns', 0),
+                    has_borders=table.get('has_borders', False), has_headers=table.get('has_headers', False),
+                    extraction_method=table.get('extraction_method', ''), csv_data=table.get('csv_data')
+                )
+                for position, table in enumerate(page_data.get('tables', []))
+            )
+            ExtractedImage.objects.bulk_create(
+                ExtractedImage(
+                    document=document, page_number=page_number, position=position,
+                    image_id=image['image_id'], filename=image['filename'], path=image['path'],
+                    format=image.get('format', ''), width=image.get('width', 0), height=image.get('height', 0),
+                    size_bytes=image.get('size_bytes', 0), mode=image.get('mode', ''),
+                    extraction_method=image.get('extraction_method', '')
+                )
+                for position, image in enumerate(page_data.get('images', []))
+            )
+
+        metadata = results.get('metadata', {})
+        document.page_count = metadata.get('total_pages', len(results['pages']))
+        document.table_count = metadata.get('total_tables', len(results.get('tables', [])))
+        document.image_count = metadata.get('total_images', len(results.get('images', [])))
+        document.text_length = metadata.get('total_text_length', len(results.get('text', '')))
+        document.positioned_element_count = metadata.get(
+            'total_positioned_elements', len(results.get('positioned_text', []))
+        )
+        document.extraction_results = {
+            key: results[key] for key in ('metadata', 'extraction_errors') if key in results
+        }
+        document.save()
+
+
+def restore_results_blob(apps, schema_editor):
+    """Reconstitue le JSON complet à partir des tables"""
+    PDFDocument = apps.get_model('extractor', 'PDFDocument')
+
+    for document in PDFDocument.objects.exclude(extraction_results=None).iterator():
+        results = {
+            'text': '',
+            'positioned_text': [],
+            'tables': [],
+            'images': [],
+            'metadata': document.extraction_results.get('metadata', {}),
+            'pages': []
+        }
+        for page in document.pages.order_by('page_number'):
+            page_data = {
+                'page_number': page.page_number,
+                'text': page.text,
+                'positioned_text': [
+                    {'text': span.text, 'bbox': [span.x0, span.y0, span.x1, span.y1], 'font': span.font,
+                     'size': span.size, 'flags': span.flags, 'color': span.color}
+                    for span in document.text_spans.filter(page_number=page.page_number).order_by('position')
+                ],
+                'tables': [
+                    {'table_id': table.table_id, 'page': table.page_number, 'data': table.data,
+                     'rows': table.rows, 'columns': table.columns, 'has_borders': table.has_borders,
+                     'has_headers': table.has_headers, 'extraction_method': table.extraction_method,
+                     'csv_data': table.csv_data}
+                    for table in document.tables.filter(page_number=page.page_number).order_by('position')
+                ],
+                'images': [
+                    {'image_id': image.image_id, 'filename': image.filename, 'path': image.path,
+                     'page': image.page_number, 'format': image.format, 'width': image.width,
+                     'height': image.height, 'size_bytes': image.size_bytes, 'mode': image.mode,
+                     'extraction_method': image.extraction_method}
+                    for image in document.images.filter(page_number=page.page_number).order_by('position')
+                ],
+                'bbox': [0, 0, page.width, page.height],
+                'rotation': page.rotation
+            }
+            results['text'] += f"\n--- Page {page.page_number} ---\n{page.text}\n"
+            results['positioned_text'].extend(page_data['positioned_text'])
+            results['tables'].extend(page_data['tables'])
+            results['images'].extend(page_data['images'])
+            results['pages'].append(page_data)
+        if 'extraction_errors' in document.extraction_results:
+            results['extraction_errors'] = document.extraction_results['extraction_errors']
+        document.extraction_results = results
+        document.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extractor', '0005_normalized_results'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_results_to_tables, restore_results_blob),
+    ]
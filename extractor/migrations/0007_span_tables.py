@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+from extractor.spans import SpanTable, get_spans_path
+
+
+def spans_to_files(apps, schema_editor):
+    """Convertit les lignes TextSpan en une SpanTable .npz par page"""
+    Page = apps.get_model('extractor', 'Page')
+    TextSpan = apps.get_model('extractor', 'TextSpan')
+
+    for page in Page.objects.iterator():
+        spans = [
+            {'text': span.text, 'bbox': [span.x0, span.y0, span.x1, span.y1], 'font': span.font,
+             'size': span.size, 'flags': span.flags, 'color': span.color}
+            for span in TextSpan.objects.filter(
+                document_id=page.document_id, page_number=page.page_number
+            ).order_by('position')
+        ]
+        if spans:
+            SpanTable.from_spans(spans).save(get_spans_path(page.document_id, page.page_number))
+        page.span_count = len(spans)
+        page.save(update_fields=['span_count'])
+
+
+def files_to_spans(apps, schema_editor):
+    """Recrée les lignes TextSpan à partir des fichiers .npz"""
+    Page = apps.get_model('extractor', 'Page')
+    TextSpan = apps.get_model('extractor', 'TextSpan')
+
+    for page in Page.objects.exclude(span_count=0).iterator():
+        try:
+            spans = SpanTable.load(get_spans_path(page.document_id, page.page_number))
+        except FileNotFoundError:
+            continue
+        TextSpan.objects.bulk_create(
+            TextSpan(
+                document_id=page.document_id, page_number=page.page_number, position=position,
+                text=span['text'], x0=span['bbox'][0], y0=span['bbox'][1],
+                x1=span['bbox'][2], y1=span['bbox'][3], font=span['font'],
+                size=span['size'], flags=span['flags'], color=span['color']
+            )
+            for position, span in enumerate(spans)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extractor', '0006_move_results_to_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='span_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(spans_to_files, files_to_spans),
+        migrations.DeleteModel(
+            name='TextSpan',
+        ),
+    ]
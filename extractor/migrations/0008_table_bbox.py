@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extractor', '0007_span_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='table',
+            name='bbox',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
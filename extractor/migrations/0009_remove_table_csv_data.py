@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extractor', '0008_table_bbox'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='table',
+            name='csv_data',
+        ),
+    ]
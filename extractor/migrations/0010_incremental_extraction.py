@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extractor', '0009_remove_table_csv_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='previous_document',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revisions', to='extractor.pdfdocument'),
+        ),
+    ]
@@ -1,52 +1,406 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.utils import timezone
 import json
+import os
+import shutil
+import uuid
+
+from .exports import clear_exports
+from .spans import SpanTable, get_spans_folder, get_spans_path
+
+# Contenu d'une page, dans l'ordre du format produit par extract_pdf_content
+PAGE_SECTIONS = ('text', 'positioned_text', 'tables', 'images')
+
 
 class PDFDocument(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'En attente'),
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_DONE, 'Terminée'),
+        (STATUS_FAILED, 'Échec'),
+    ]
+
     file = models.FileField(upload_to='pdfs/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
-    # Résultats d'extraction stockés en JSON
+    # Métadonnées et erreurs d'extraction stockées en JSON
     extraction_results = models.JSONField(null=True, blank=True)
     extraction_completed = models.BooleanField(default=False)
     extraction_date = models.DateTimeField(null=True, blank=True)
     
+    # Suivi de la tâche d'extraction en arrière-plan
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    pages_processed = models.PositiveIntegerField(default=0)
+    pages_total = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    
     # Métadonnées du fichier
     original_filename = models.CharField(max_length=255, blank=True)
-    file_size = models.PositiveIntegerField(null=True, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    
+    # Compteurs dénormalisés : le contenu est stocké dans Page, Table et ExtractedImage (les spans
+    # positionnés dans des SpanTable .npz, une par page), extraction_results ne conserve plus que les métadonnées et les erreurs
+    page_count = models.PositiveIntegerField(default=0)
+    table_count = models.PositiveIntegerField(default=0)
+    image_count = models.PositiveIntegerField(default=0)
+    text_length = models.PositiveIntegerField(default=0)
+    positioned_element_count = models.PositiveIntegerField(default=0)
+    
+    # Cache des résultats : empreinte SHA-256 du contenu et version de l'extracteur
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    extractor_version = models.CharField(max_length=16, blank=True)
+    last_accessed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    
+    # Révision d'un document déjà extrait : seules les pages modifiées sont ré-extraites
+    previous_document = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='revisions'
+    )
     
     def __str__(self):
         return f"PDF Document {self.id} - {self.original_filename or self.file.name}"
     
+    @property
+    def progress(self):
+        """Avancement de l'extraction, page par page"""
+        return {
+            'pages_processed': self.pages_processed,
+            'pages_total': self.pages_total,
+            'percent': round(100 * self.pages_processed / self.pages_total) if self.pages_total else 0,
+        }
+    
     @property
     def has_text(self):
-        if not self.extraction_results:
-            return False
-        return bool(self.extraction_results.get('text', '').strip())
+        return self.positioned_element_count > 0
     
     @property
     def has_tables(self):
-        if not self.extraction_results:
-            return False
-        return len(self.extraction_results.get('tables', [])) > 0
+        return self.table_count > 0
     
     @property
     def has_images(self):
-        if not self.extraction_results:
-            return False
-        return len(self.extraction_results.get('images', [])) > 0
+        return self.image_count > 0
     
     @property
     def total_pages(self):
-        if not self.extraction_results:
-            return 0
-        return self.extraction_results.get('metadata', {}).get('total_pages', 0)
+        return self.page_count
     
     def get_page_data(self, page_number):
         """Retourne les données d'une page spécifique"""
-        if not self.extraction_results:
-            return None
-        pages = self.extraction_results.get('pages', [])
-        for page in pages:
-            if page.get('page_number') == page_number:
-                return page
+        for page_data in self.iter_page_data(first_page=page_number, last_page=page_number):
+            return page_data
         return None
+    
+    def iter_page_data(self, first_page=None, last_page=None, batch_size=20, sections=None):
+        """
+        Reconstruit les pages au format de extract_pdf_content, dans l'ordre,
+        par lots de batch_size pages (3 requêtes par lot au plus, les spans
+        positionnés étant lus depuis les fichiers .npz de chaque page).
+        sections limite le contenu produit (parmi PAGE_SECTIONS) ; les tables
+        des sections non demandées ne sont pas interrogées.
+        """
+        if sections is None:
+            sections = PAGE_SECTIONS
+        pages = self.pages.order_by('page_number')
+        if first_page is not None:
+            pages = pages.filter(page_number__gte=first_page)
+        if last_page is not None:
+            pages = pages.filter(page_number__lte=last_page)
+        
+        batch = []
+        for page in pages.iterator(chunk_size=batch_size):
+            batch.append(page)
+            if len(batch) == batch_size:
+                yield from self._build_pages(batch, sections)
+                batch = []
+        if batch:
+            yield from self._build_pages(batch, sections)
+    
+    def _build_pages(self, pages, sections):
+        page_range = {
+            'page_number__gte': pages[0].page_number,
+            'page_number__lte': pages[-1].page_number,
+        }
+        children = {}
+        if 'tables' in sections:
+            children['tables'] = _group_by_page(self.tables.filter(**page_range))
+        if 'images' in sections:
+            children['images'] = _group_by_page(self.images.filter(**page_range))
+        for page in pages:
+            page_data = {"page_number": page.page_number}
+            for section in PAGE_SECTIONS:
+                if section == 'text' and 'text' in sections:
+                    page_data["text"] = page.text
+                elif section == 'positioned_text' and 'positioned_text' in sections:
+                    page_data["positioned_text"] = page.spans.to_list()
+                elif section in children:
+                    page_data[section] = [item.to_dict() for item in children[section].get(page.page_number, [])]
+            page_data["bbox"] = [0, 0, page.width, page.height]
+            page_data["rotation"] = page.rotation
+            yield page_data
+    
+    def build_results(self):
+        """Reconstruit le dictionnaire complet de résultats d'extraction"""
+        stored = self.extraction_results or {}
+        results = {
+            "text": "",
+            "positioned_text": [],
+            "tables": [],
+            "images": [],
+            "metadata": stored.get('metadata', {}),
+            "pages": []
+        }
+        text_parts = []
+        for page_data in self.iter_page_data():
+            results["positioned_text"].extend(page_data["positioned_text"])
+            results["tables"].extend(page_data["tables"])
+            results["images"].extend(page_data["images"])
+            results["pages"].append(page_data)
+            text_parts.append(f"\n--- Page {page_data['page_number']} ---\n{page_data['text']}\n")
+        results["text"] = "".join(text_parts)
+        if stored.get('extraction_errors'):
+            results["extraction_errors"] = stored['extraction_errors']
+        return results
+    
+    def add_page(self, page_data, fingerprint=""):
+        """Enregistre une page extraite et son contenu dans les tables dédiées"""
+        page_number = page_data["page_number"]
+        bbox = page_data.get("bbox") or [0, 0, 0, 0]
+        with transaction.atomic():
+            self._add_page_rows(page_number, bbox, page_data, fingerprint)
+    
+    def _add_page_rows(self, page_number, bbox, page_data, fingerprint):
+        spans = SpanTable.from_spans(page_data.get("positioned_text", []))
+        if len(spans):
+            spans.save(get_spans_path(self.id, page_number))
+        Page.objects.create(
+            document=self,
+            page_number=page_number,
+            text=page_data.get("text", ""),
+            width=bbox[2],
+            height=bbox[3],
+            rotation=page_data.get("rotation", 0),
+            span_count=len(spans),
+            fingerprint=fingerprint
+        )
+        Table.objects.bulk_create(
+            Table.from_dict(self, page_number, position, table)
+            for position, table in enumerate(page_data.get("tables", []))
+        )
+        ExtractedImage.objects.bulk_create(
+            ExtractedImage.from_dict(self, page_number, position, image)
+            for position, image in enumerate(page_data.get("images", []))
+        )
+        StoredImage.acquire(page_data.get("images", []))
+    
+    def clear_pages(self):
+        """Supprime les pages et leur contenu (avant une nouvelle extraction)"""
+        shutil.rmtree(get_spans_folder(self.id), ignore_errors=True)
+        clear_exports(self.id)
+        self.tables.all().delete()
+        self.release_images()
+        self.pages.all().delete()
+    
+    def release_images(self):
+        """Supprime les images du document et libère leurs références dans le stockage par contenu"""
+        with transaction.atomic():
+            StoredImage.release(self.images.all())
+            self.images.all().delete()
+    
+    def set_counters(self, metadata):
+        """Compteurs dénormalisés à partir des métadonnées d'extraction"""
+        self.page_count = metadata.get('total_pages', 0)
+        self.table_count = metadata.get('total_tables', 0)
+        self.image_count = metadata.get('total_images', 0)
+        self.text_length = metadata.get('total_text_length', 0)
+        self.positioned_element_count = metadata.get('total_positioned_elements', 0)
+
+
+def _group_by_page(queryset):
+    grouped = {}
+    for item in queryset.order_by('page_number', 'position'):
+        grouped.setdefault(item.page_number, []).append(item)
+    return grouped
+
+
+class Page(models.Model):
+    document = models.ForeignKey(PDFDocument, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.PositiveIntegerField()
+    text = models.TextField(blank=True)
+    width = models.FloatField(default=0)
+    height = models.FloatField(default=0)
+    rotation = models.IntegerField(default=0)
+    # Nombre de spans positionnés, stockés hors base dans une SpanTable .npz
+    span_count = models.PositiveIntegerField(default=0)
+    # Empreinte du contenu de la page (voir extractor.fingerprints)
+    fingerprint = models.CharField(max_length=64, blank=True)
+    
+    class Meta:
+        ordering = ['page_number']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'page_number'], name='unique_document_page'),
+        ]
+    
+    def __str__(self):
+        return f"Page {self.page_number} - document {self.document_id}"
+    
+    @property
+    def spans_path(self):
+        return get_spans_path(self.document_id, self.page_number)
+    
+    @property
+    def spans(self):
+        """SpanTable de la page, chargée à la demande depuis son fichier .npz"""
+        if not hasattr(self, '_spans'):
+            if self.span_count and os.path.exists(self.spans_path):
+                self._spans = SpanTable.load(self.spans_path)
+            else:
+                self._spans = SpanTable.empty()
+        return self._spans
+
+
+class Table(models.Model):
+    document = models.ForeignKey(PDFDocument, on_delete=models.CASCADE, related_name='tables')
+    page_number = models.PositiveIntegerField()
+    position = models.PositiveIntegerField()
+    table_id = models.CharField(max_length=100)
+    data = models.JSONField(default=list)
+    rows = models.PositiveIntegerField(default=0)
+    columns = models.PositiveIntegerField(default=0)
+    bbox = models.JSONField(null=True, blank=True)
+    has_borders = models.BooleanField(default=False)
+    has_headers = models.BooleanField(default=False)
+    extraction_method = models.CharField(max_length=50, blank=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['document', 'page_number'])]
+    
+    @classmethod
+    def from_dict(cls, document, page_number, position, table):
+        return cls(
+            document=document, page_number=page_number, position=position,
+            table_id=table["table_id"], data=table.get("data", []),
+            rows=table.get("rows", 0), columns=table.get("columns", 0), bbox=table.get("bbox"),
+            has_borders=table.get("has_borders", False), has_headers=table.get("has_headers", False),
+            extraction_method=table.get("extraction_method", "")
+        )
+    
+    def to_dict(self):
+        return {
+            "table_id": self.table_id,
+            "page": self.page_number,
+            "data": self.data,
+            "rows": self.rows,
+            "columns": self.columns,
+            "bbox": self.bbox,
+            "has_borders": self.has_borders,
+            "has_headers": self.has_headers,
+            "extraction_method": self.extraction_method
+        }
+
+
+class ExtractedImage(models.Model):
+    document = models.ForeignKey(PDFDocument, on_delete=models.CASCADE, related_name='images')
+    page_number = models.PositiveIntegerField()
+    position = models.PositiveIntegerField()
+    image_id = models.CharField(max_length=100)
+    filename = models.CharField(max_length=255)
+    path = models.CharField(max_length=500)
+    format = models.CharField(max_length=16, blank=True)
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    size_bytes = models.PositiveIntegerField(default=0)
+    mode = models.CharField(max_length=16, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    extraction_method = models.CharField(max_length=50, blank=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['document', 'page_number'])]
+    
+    @classmethod
+    def from_dict(cls, document, page_number, position, image):
+        return cls(
+            document=document, page_number=page_number, position=position,
+            image_id=image["image_id"], filename=image["filename"], path=image["path"],
+            format=image.get("format", ""), width=image.get("width", 0), height=image.get("height", 0),
+            size_bytes=image.get("size_bytes", 0), mode=image.get("mode", ""),
+            content_hash=image.get("content_hash", ""), extraction_method=image.get("extraction_method", "")
+        )
+    
+    def to_dict(self):
+        return {
+            "image_id": self.image_id,
+            "filename": self.filename,
+            "path": self.path,
+            "page": self.page_number,
+            "format": self.format,
+            "width": self.width,
+            "height": self.height,
+            "size_bytes": self.size_bytes,
+            "mode": self.mode,
+            "content_hash": self.content_hash,
+            "extraction_method": self.extraction_method
+        }
+
+
+class StoredImage(models.Model):
+    """
+    Fichier du stockage d'images par contenu (extractor.imagestore), partagé par
+    toutes les ExtractedImage de même empreinte, quel que soit le document.
+    ref_count compte ces références ; un fichier qui n'est plus référencé est
+    supprimé par cache.collect_image_store.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=500)
+    format = models.CharField(max_length=16, blank=True)
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    @classmethod
+    def acquire(cls, images):
+        """Ajoute une référence par image (dicts au format d'extraction)"""
+        counts = {}
+        for image in images:
+            if image.get("content_hash"):
+                counts.setdefault(image["content_hash"], [image, 0])[1] += 1
+        now = timezone.now()
+        for content_hash, (image, count) in counts.items():
+            cls.objects.get_or_create(content_hash=content_hash, defaults={
+                "path": image["path"], "format": image.get("format", ""),
+                "size_bytes": image.get("size_bytes", 0)
+            })
+            cls.objects.filter(content_hash=content_hash).update(
+                ref_count=F('ref_count') + count, updated_at=now
+            )
+    
+    @classmethod
+    def release(cls, extracted_images):
+        """Retire les références d'un ensemble d'ExtractedImage (avant leur suppression)"""
+        counts = (
+            extracted_images.exclude(content_hash='')
+            .values_list('content_hash').annotate(count=Count('id')).order_by()
+        )
+        now = timezone.now()
+        for content_hash, count in counts:
+            cls.objects.filter(content_hash=content_hash).update(
+                ref_count=F('ref_count') - count, updated_at=now
+            )
+
+
+class UploadSession(models.Model):
+    """Upload par morceaux en cours : le fichier partiel est écrit dans media/uploads/<id>.part"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    original_filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.original_filename} ({self.received}/{self.size})"
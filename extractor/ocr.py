@@ -0,0 +1,242 @@
+"""
+Reconnaissance de caractères (OCR) des pages numérisées.
+
+Une page numérisée ne contient qu'une image : l'extraction native n'en tire aucun
+texte. Reconnaître toutes les pages serait hors de prix ; la page n'est donc
+confiée à Tesseract (installé localement, appelé en sous-processus) que si :
+- son texte natif couvre moins de min_text_coverage de sa surface (spans déjà
+  extraits, sans coût supplémentaire) ;
+- son rendu (pypdfium2, en niveaux de gris, à dpi points par pouce) n'est pas vide :
+  une page blanche, numérisée ou non, n'est pas reconnue.
+Le rendu et la reconnaissance sont une étape ("ocr") de l'extraction de la page
+(extract_page_content), exécutée dans le même processus qu'elle : en mode isolé,
+ils sont soumis au budget de la page (délai, mémoire) et tesseract hérite de la
+limite d'espace d'adresses du worker. Le parallélisme vient des processus
+d'extraction ; threads fixe le nombre de threads OpenMP de chaque tesseract.
+Le résultat est mis en cache sous l'empreinte SHA-256 du rendu :
+ocr/<sha[:2]>/<sha>_<langues>.json.
+
+Les mots reconnus sont ajoutés à positioned_text au format des spans natifs
+(police "OCR", taille = hauteur de la ligne), sauf ceux déjà couverts par un span
+natif, et leurs lignes au texte de la page.
+
+Ce module n'accède pas à la base : il est utilisé par les processus d'extraction.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+
+from .spatial import BBoxIndex, bbox_containment
+from .utils import EXTRACTOR_VERSION, _record_error
+
+OCR_CACHE_FOLDER = os.path.join('media', 'ocr')
+
+# Police des spans reconnus
+OCR_FONT = "OCR"
+# Plus grand côté d'un rendu (pixels) : le DPI est réduit pour les très grandes pages
+MAX_RENDER_SIDE = 8000
+# Une page dont moins de cette part de pixels est sombre est considérée comme blanche
+BLANK_INK_RATIO = 0.0005
+# Part de la surface d'un mot couverte par un span natif au-delà de laquelle il est ignoré
+NATIVE_OVERLAP = 0.5
+
+
+def get_ocr_engine():
+    """Moteur OCR configuré par PDF_OCR_ENABLED et PDF_OCR_*, ou None"""
+    if not getattr(settings, 'PDF_OCR_ENABLED', False):
+        return None
+    return TesseractOCR(
+        languages=getattr(settings, 'PDF_OCR_LANGUAGES', 'eng'),
+        dpi=getattr(settings, 'PDF_OCR_DPI', 300),
+        min_text_coverage=getattr(settings, 'PDF_OCR_MIN_TEXT_COVERAGE', 0.01),
+        min_confidence=getattr(settings, 'PDF_OCR_MIN_CONFIDENCE', 30),
+        threads=getattr(settings, 'PDF_OCR_THREADS', 1),
+        timeout=getattr(settings, 'PDF_OCR_TIMEOUT_SECONDS', 120),
+        command=getattr(settings, 'PDF_OCR_TESSERACT_CMD', 'tesseract'),
+    )
+
+
+def get_extractor_version():
+    """
+    Version d'extracteur des résultats produits avec la configuration courante :
+    l'OCR change le contenu extrait, un document extrait sans OCR n'est pas
+    réutilisé une fois l'OCR activé (ni l'inverse)
+    """
+    if getattr(settings, 'PDF_OCR_ENABLED', False):
+        return f"{EXTRACTOR_VERSION}+ocr"
+    return EXTRACTOR_VERSION
+
+
+def text_coverage(page_data):
+    """Part de la surface de la page couverte par les spans de texte natifs"""
+    _, _, width, height = page_data.get("bbox") or (0, 0, 0, 0)
+    if width <= 0 or height <= 0:
+        return 0.0
+    covered = 0.0
+    for span in page_data["positioned_text"]:
+        x0, y0, x1, y1 = span["bbox"]
+        covered += max(0.0, min(x1, width) - max(x0, 0)) * max(0.0, min(y1, height) - max(y0, 0))
+    return min(1.0, covered / (width * height))
+
+
+def is_blank(image):
+    """Rendu en niveaux de gris sans encre (page blanche, verso numérisé vide)"""
+    histogram = image.histogram()
+    return sum(histogram[:128]) < BLANK_INK_RATIO * image.width * image.height
+
+
+def parse_tsv(tsv, min_confidence):
+    """Mots d'une sortie TSV de tesseract : {text, left, top, width, height, conf, line}"""
+    words = []
+    for row in tsv.splitlines()[1:]:
+        fields = row.split("\t")
+        # level 5 : mot ; les niveaux page, bloc, paragraphe et ligne n'ont pas de texte
+        if len(fields) < 12 or fields[0] != "5" or not fields[11].strip():
+            continue
+        conf = float(fields[10])
+        if conf < min_confidence:
+            continue
+        words.append({
+            "text": fields[11].strip(),
+            "left": int(fields[6]),
+            "top": int(fields[7]),
+            "width": int(fields[8]),
+            "height": int(fields[9]),
+            "conf": round(conf, 1),
+            "line": [int(fields[2]), int(fields[3]), int(fields[4])],
+        })
+    return words
+
+
+class TesseractOCR:
+    """
+    OCR des pages par tesseract. error est renseigné (et aucune page n'est
+    reconnue) si la commande est introuvable.
+    """
+
+    def __init__(self, languages="eng", dpi=300, min_text_coverage=0.01, min_confidence=30, threads=1,
+                 timeout=120, command="tesseract", cache_folder=OCR_CACHE_FOLDER):
+        self.languages = languages
+        self.dpi = dpi
+        self.min_text_coverage = min_text_coverage
+        self.min_confidence = min_confidence
+        self.threads = threads
+        self.timeout = timeout
+        self.command = shutil.which(command)
+        self.cache_folder = cache_folder
+        self.error = None if self.command else f"OCR désactivé : commande {command} introuvable"
+
+    def needs_ocr(self, page_data):
+        return self.error is None and text_coverage(page_data) < self.min_text_coverage
+
+    def _cache_path(self, image_hash):
+        return os.path.join(self.cache_folder, image_hash[:2], f"{image_hash}_{self.languages}.json")
+
+    def render(self, pdfium_doc, page_num):
+        """Rendu en niveaux de gris de la page et son échelle (pixels par point)"""
+        page = pdfium_doc[page_num]
+        try:
+            scale = min(self.dpi / 72, MAX_RENDER_SIDE / max(page.get_width(), page.get_height(), 1))
+            image = page.render(scale=scale, grayscale=True, may_draw_forms=True).to_pil()
+        finally:
+            page.close()
+        return image.convert("L"), scale
+
+    def recognize(self, image, scale):
+        """Mots reconnus sur le rendu (coordonnées en pixels) et s'ils venaient du cache"""
+        sha256 = hashlib.sha256(f"{image.width}x{image.height}:".encode())
+        sha256.update(image.tobytes())
+        image_hash = sha256.hexdigest()
+        path = self._cache_path(image_hash)
+        try:
+            with open(path) as cached:
+                words = json.load(cached)["words"]
+            # Date de modification = dernier accès, pour l'éviction
+            os.utime(path)
+            return words, True
+        except (OSError, ValueError, KeyError):
+            pass
+
+        # PGM : format sans compression que tesseract lit sur son entrée standard
+        pgm = io.BytesIO()
+        image.save(pgm, "PPM")
+        env = dict(os.environ)
+        if self.threads:
+            # Le parallélisme vient des processus d'extraction, pas de tesseract
+            env["OMP_THREAD_LIMIT"] = str(self.threads)
+        completed = subprocess.run(
+            [self.command, "stdin", "stdout", "-l", self.languages, "--dpi", str(round(scale * 72)), "tsv"],
+            input=pgm.getvalue(), capture_output=True, timeout=self.timeout, env=env
+        )
+        if completed.returncode != 0:
+            message = completed.stderr.decode("utf-8", "replace").strip().splitlines()
+            raise RuntimeError(message[-1] if message else f"tesseract : code {completed.returncode}")
+        words = parse_tsv(completed.stdout.decode("utf-8", "replace"), self.min_confidence)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Écriture atomique : plusieurs extractions peuvent reconnaître la même page
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+        with os.fdopen(fd, "w") as cache_file:
+            json.dump({"words": words}, cache_file)
+        os.replace(temp_path, path)
+        return words, False
+
+    def apply(self, page_data, words, scale, cached):
+        """Ajoute les mots reconnus à la page, hors mots déjà couverts par un span natif"""
+        native = BBoxIndex()
+        for span in page_data["positioned_text"]:
+            native.insert(span["bbox"])
+
+        lines = {}
+        for word in words:
+            bbox = [round(value / scale, 2) for value in (word["left"], word["top"], word["left"] + word["width"],
+                                                          word["top"] + word["height"])]
+            if any(bbox_containment(bbox, other) >= NATIVE_OVERLAP for other, _ in native.overlapping(bbox)):
+                continue
+            lines.setdefault(tuple(word["line"]), []).append((bbox, word))
+
+        spans = []
+        text_lines = []
+        confidences = []
+        for line_words in lines.values():
+            size = round(max(bbox[3] - bbox[1] for bbox, _ in line_words), 2)
+            for bbox, word in line_words:
+                spans.append({"text": word["text"], "bbox": bbox, "font": OCR_FONT, "size": size,
+                              "flags": 0, "color": 0})
+                confidences.append(word["conf"])
+            text_lines.append(" ".join(word["text"] for _, word in line_words) + "\n")
+
+        page_data["positioned_text"] = page_data["positioned_text"] + spans
+        page_data["text"] += "".join(text_lines)
+        page_data["ocr"] = {
+            "engine": "tesseract",
+            "languages": self.languages,
+            "dpi": round(scale * 72),
+            "words": len(spans),
+            "mean_confidence": round(sum(confidences) / len(confidences), 1) if confidences else None,
+            "cached": cached,
+        }
+
+    def process_page(self, backends, page_num, page_data, page_result):
+        """
+        Rend la page (pypdfium2, handles de l'extraction) et la complète par OCR,
+        sauf si le rendu est blanc. Les erreurs sont ajoutées à page_result.
+        """
+        try:
+            image, scale = self.render(backends.pdfium_doc, page_num)
+            if is_blank(image):
+                return
+            words, cached = self.recognize(image, scale)
+            self.apply(page_data, words, scale, cached)
+        except Exception as e:
+            _record_error(page_result, {
+                "error": f"Erreur OCR page {page_num + 1}: {str(e)}",
+                "page": page_num + 1,
+                "method": "OCR"
+            })
@@ -0,0 +1,136 @@
+"""
+Contenu d'un PDF partagé par les moteurs d'extraction.
+
+Un PDFSource est lu une seule fois : projeté en mémoire (mmap) quand le fichier
+est sur disque, lu une fois en mémoire quand le stockage n'expose pas de chemin
+local (stockage distant, en mémoire). PyMuPDF et pypdfium2 ouvrent directement ce
+tampon, sans copie ; pdfplumber le lit au travers d'un flux qui n'en copie que les
+morceaux demandés. Aucun fichier temporaire n'est écrit.
+
+Transmis à un autre processus (pool d'extraction, worker isolé), un PDFSource
+adossé à un fichier est projeté à nouveau dans ce processus (les pages du fichier
+restent partagées par le cache du système) ; un PDFSource en mémoire y est copié
+une fois, à la création du processus.
+"""
+import ctypes
+import io
+import mmap
+import os
+
+import fitz  # PyMuPDF
+import pdfplumber
+import pypdfium2 as pdfium
+
+
+class _BufferReader(io.RawIOBase):
+    """Flux en lecture seule sur un tampon (mmap, bytes), lu par morceaux sans copie du tampon entier"""
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class PDFSource:
+    """
+    Contenu d'un PDF (mmap ou bytes), ouvert une fois et partagé par PyMuPDF,
+    pypdfium2 et pdfplumber. path est le chemin du fichier projeté, None pour un
+    contenu lu depuis un stockage sans chemin local.
+    """
+
+    def __init__(self, data, path=None):
+        self.data = data
+        self.path = path
+
+    @classmethod
+    def from_path(cls, path):
+        with open(path, "rb") as pdf_file:
+            if os.fstat(pdf_file.fileno()).st_size == 0:
+                # mmap refuse un fichier vide : l'erreur est laissée aux moteurs
+                return cls(b"", path)
+            # ACCESS_COPY : tampon inscriptible, exigé par ctypes pour pypdfium2,
+            # mais jamais écrit, donc jamais copié
+            data = mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_COPY)
+        return cls(data, path)
+
+    @classmethod
+    def from_file(cls, field_file):
+        """Source d'un FieldFile Django : projeté s'il est sur le disque local, lu une fois sinon"""
+        try:
+            path = field_file.path
+        except NotImplementedError:
+            path = None
+        # InMemoryStorage fournit un chemin qui ne correspond à aucun fichier
+        if path is not None and os.path.isfile(path):
+            return cls.from_path(path)
+        with field_file.open("rb") as pdf_file:
+            return cls(pdf_file.read())
+
+    @classmethod
+    def open(cls, pdf):
+        """Source d'un chemin, ou la source elle-même"""
+        return pdf if isinstance(pdf, cls) else cls.from_path(pdf)
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def open_fitz(self):
+        return fitz.open(stream=memoryview(self.data), filetype="pdf")
+
+    def open_pdfium(self):
+        if isinstance(self.data, bytes):
+            return pdfium.PdfDocument(self.data)
+        return pdfium.PdfDocument((ctypes.c_char * len(self.data)).from_buffer(self.data))
+
+    def open_plumber(self):
+        """PDF pdfplumber et son flux, à fermer après le PDF"""
+        stream = _BufferReader(self.data)
+        return pdfplumber.open(stream), stream
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                # Tampon encore référencé par un document ouvert : la projection
+                # est libérée avec le dernier d'entre eux
+                pass
+
+    def __reduce__(self):
+        if self.path is not None:
+            return PDFSource.from_path, (self.path,)
+        return PDFSource, (bytes(self.data),)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
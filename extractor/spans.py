@@ -0,0 +1,127 @@
+"""
+Représentation compacte des spans de texte positionnés.
+
+Au lieu d'une liste de dicts (texte, bbox, police, taille, flags, couleur) par span,
+SpanTable stocke des colonnes : un tampon UTF-8 unique pour les textes avec ses
+offsets, les bbox en float32, les polices internées et les attributs en tableaux
+NumPy. Elle se sérialise en .npz, et les dicts ne sont matérialisés qu'à la demande.
+"""
+import os
+
+import numpy as np
+
+SPANS_FOLDER = os.path.join('media', 'extracted_spans')
+
+
+def get_spans_folder(document_id):
+    """Dossier des tables de spans d'un document, une par page"""
+    return os.path.join(SPANS_FOLDER, str(document_id))
+
+
+def get_spans_path(document_id, page_number):
+    return os.path.join(get_spans_folder(document_id), f"page_{page_number}.npz")
+
+
+class SpanTable:
+    """Table de spans positionnés en colonnes, matérialisée paresseusement"""
+
+    def __init__(self, text_buffer, offsets, bboxes, font_codes, fonts, sizes, flags, colors):
+        self.text_buffer = text_buffer
+        self.offsets = offsets
+        self.bboxes = bboxes
+        self.font_codes = font_codes
+        self.fonts = fonts
+        self.sizes = sizes
+        self.flags = flags
+        self.colors = colors
+
+    @classmethod
+    def from_spans(cls, spans):
+        """Construit la table à partir de spans au format positioned_text"""
+        fonts = []
+        font_codes = {}
+        encoded = []
+        codes = []
+        for span in spans:
+            encoded.append(span["text"].encode("utf-8"))
+            font_code = font_codes.get(span["font"])
+            if font_code is None:
+                font_code = font_codes[span["font"]] = len(fonts)
+                fonts.append(span["font"])
+            codes.append(font_code)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        return cls(
+            text_buffer=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            offsets=offsets,
+            bboxes=np.array([span["bbox"] for span in spans], dtype=np.float32).reshape(-1, 4),
+            font_codes=np.array(codes, dtype=np.int32),
+            fonts=fonts,
+            sizes=np.array([span["size"] for span in spans], dtype=np.float32),
+            flags=np.array([span["flags"] for span in spans], dtype=np.int32),
+            colors=np.array([span["color"] for span in spans], dtype=np.uint32),
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text(self, index):
+        return self.text_buffer[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return {
+            "text": self.text(index),
+            "bbox": self.bboxes[index].tolist(),
+            "font": self.fonts[self.font_codes[index]],
+            "size": float(self.sizes[index]),
+            "flags": int(self.flags[index]),
+            "color": int(self.colors[index])
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_list(self):
+        """Matérialise tous les spans sous forme de dicts"""
+        return list(self)
+
+    def save(self, path):
+        """Sérialise la table dans un fichier .npz compressé"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as output:
+            np.savez_compressed(
+                output,
+                text_buffer=self.text_buffer,
+                offsets=self.offsets,
+                bboxes=self.bboxes,
+                font_codes=self.font_codes,
+                fonts=np.frombuffer("\0".join(self.fonts).encode("utf-8"), dtype=np.uint8),
+                sizes=self.sizes,
+                flags=self.flags,
+                colors=self.colors,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            fonts = data["fonts"].tobytes().decode("utf-8")
+            return cls(
+                text_buffer=data["text_buffer"],
+                offsets=data["offsets"],
+                bboxes=data["bboxes"],
+                font_codes=data["font_codes"],
+                fonts=fonts.split("\0") if fonts else [],
+                sizes=data["sizes"],
+                flags=data["flags"],
+                colors=data["colors"],
+            )
+
+    @classmethod
+    def empty(cls):
+        return cls.from_spans([])
@@ -0,0 +1,99 @@
+"""
+Index spatial des boîtes englobantes d'une page.
+
+Grille uniforme : la page est découpée en cellules carrées de GRID_CELL_SIZE
+points, et chaque bbox (x0, y0, x1, y1) est enregistrée dans les cellules qu'elle
+recouvre. Une requête ne compare la bbox qu'aux entrées des cellules qu'elle
+touche : son coût dépend de la densité locale de la page, pas du nombre total
+d'entrées ni de la plus large d'entre elles (un tableau pleine largeur n'occupe
+que les cellules de sa surface). Les insertions et les requêtes s'entrelacent
+(les tableaux sont indexés au fur et à mesure qu'ils sont retenus), ce qu'un
+R-tree empaqueté une fois pour toutes (STR) ne permettrait pas sans reconstruction.
+"""
+from math import floor
+
+# Côté des cellules de la grille, en points PDF (une page A4 fait 595 x 842 points)
+GRID_CELL_SIZE = 64.0
+
+
+def bbox_iou(a, b):
+    """Intersection sur union de deux bbox (x0, y0, x1, y1)"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def bbox_containment(inner, outer):
+    """Part de la surface de inner comprise dans outer"""
+    width = min(inner[2], outer[2]) - max(inner[0], outer[0])
+    height = min(inner[3], outer[3]) - max(inner[1], outer[1])
+    area = (inner[2] - inner[0]) * (inner[3] - inner[1])
+    if width <= 0 or height <= 0 or area <= 0:
+        return 0.0
+    return width * height / area
+
+
+class BBoxIndex:
+    """
+    Bbox d'une page indexées sur une grille uniforme (voir le module) : insertion
+    en O(cellules recouvertes), requête en O(cellules touchées + entrées de ces cellules)
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        self._cell_size = cell_size
+        self._cells = {}
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell_range(self, bbox):
+        size = self._cell_size
+        return (floor(bbox[0] / size), floor(bbox[1] / size),
+                floor(bbox[2] / size), floor(bbox[3] / size))
+
+    def insert(self, bbox, item=None):
+        bbox = tuple(bbox)
+        position = len(self._entries)
+        self._entries.append((bbox, item))
+        col0, row0, col1, row1 = self._cell_range(bbox)
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                self._cells.setdefault((col, row), []).append(position)
+
+    def _candidates(self, bbox):
+        """Positions des entrées enregistrées dans les cellules touchées par bbox"""
+        col0, row0, col1, row1 = self._cell_range(bbox)
+        candidates = set()
+        if (col1 - col0 + 1) * (row1 - row0 + 1) > len(self._cells):
+            # Requête plus étendue que la partie occupée de la grille
+            for (col, row), positions in self._cells.items():
+                if col0 <= col <= col1 and row0 <= row <= row1:
+                    candidates.update(positions)
+        else:
+            for col in range(col0, col1 + 1):
+                for row in range(row0, row1 + 1):
+                    candidates.update(self._cells.get((col, row), ()))
+        return candidates
+
+    def overlapping(self, bbox):
+        """Entrées (bbox, item) dont la boîte intersecte bbox, dans l'ordre d'insertion"""
+        result = []
+        for position in sorted(self._candidates(bbox)):
+            other, item = self._entries[position]
+            if other[0] < bbox[2] and other[2] > bbox[0] and other[1] < bbox[3] and other[3] > bbox[1]:
+                result.append((other, item))
+        return result
+
+    def best_match(self, bbox):
+        """(iou, item) de l'entrée qui recouvre le plus bbox, ou (0.0, None)"""
+        best = (0.0, None)
+        for other, item in self.overlapping(bbox):
+            iou = bbox_iou(bbox, other)
+            if iou > best[0]:
+                best = (iou, item)
+        return best
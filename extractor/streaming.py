@@ -0,0 +1,156 @@
+"""
+Diffusion des pages au fil de l'extraction.
+
+Le worker enregistre chaque page dans la table Page dès qu'elle est extraite ;
+le flux relit les nouvelles pages à intervalle régulier jusqu'à la fin du job,
+ou jusqu'à un délai (PDF_STREAM_IDLE_TIMEOUT sans nouvelle page ni progression,
+PDF_STREAM_MAX_SECONDS au total) au-delà duquel il se termine par un événement
+'error' de statut 'timeout' : un job bloqué ou perdu ne retient pas la connexion.
+
+Les résultats complets d'un grand document sont encodés en JSON au fil de la
+lecture des pages, section par section dans des fichiers temporaires
+(iter_results_json), sans être assemblés en mémoire.
+"""
+import json
+import tempfile
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+
+from .models import PDFDocument
+
+# Sections des résultats complets conservées en mémoire jusqu'à cette taille, puis sur disque
+SPOOL_SIZE = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+def iter_document_events(document, poll_interval=0.5, idle_timeout=None, max_seconds=None):
+    """
+    Produit les événements du flux d'un document : 'document' (état initial),
+    'page' pour chaque page dans l'ordre, puis 'end' ou 'error'. Le flux s'arrête
+    sur une erreur de statut 'timeout' après idle_timeout secondes sans nouvelle
+    page ni progression, ou max_seconds secondes au total (None : sans limite).
+    """
+    if idle_timeout is None:
+        idle_timeout = getattr(settings, 'PDF_STREAM_IDLE_TIMEOUT', 300)
+    if max_seconds is None:
+        max_seconds = getattr(settings, 'PDF_STREAM_MAX_SECONDS', 3600)
+    started = last_activity = time.monotonic()
+    last_progress = document.progress
+    yield {
+        'type': 'document',
+        'document_id': document.id,
+        'status': document.status,
+        'progress': document.progress
+    }
+
+    last_page = 0
+    while True:
+        document.refresh_from_db()
+        finished = document.status in (PDFDocument.STATUS_DONE, PDFDocument.STATUS_FAILED)
+
+        # Les pages enregistrées avant la fin du job sont envoyées avant l'événement final
+        sent = 0
+        for page_data in document.iter_page_data(first_page=last_page + 1):
+            last_page = page_data['page_number']
+            sent += 1
+            yield {'type': 'page', 'page': page_data, 'progress': document.progress}
+
+        if document.status == PDFDocument.STATUS_FAILED:
+            yield {'type': 'error', 'status': document.status, 'error': document.error_message}
+            return
+
+        if finished:
+            results = document.extraction_results or {}
+            yield {
+                'type': 'end',
+                'status': document.status,
+                'metadata': results.get('metadata', {}),
+                'extraction_errors': results.get('extraction_errors', [])
+            }
+            return
+
+        now = time.monotonic()
+        if sent or document.progress != last_progress:
+            last_activity = now
+            last_progress = document.progress
+        if idle_timeout is not None and now - last_activity >= idle_timeout:
+            yield {
+                'type': 'error',
+                'status': 'timeout',
+                'error': f"Aucune progression de l'extraction depuis {idle_timeout} s"
+            }
+            return
+        if max_seconds is not None and now - started >= max_seconds:
+            yield {
+                'type': 'error',
+                'status': 'timeout',
+                'error': f"Durée maximale du flux dépassée ({max_seconds} s)"
+            }
+            return
+
+        if not sent:
+            time.sleep(poll_interval)
+
+
+def iter_results_json(document, add_image_url=None, add_page_urls=None):
+    """
+    Résultats complets du document, au format de PDFDocument.build_results, encodés
+    en JSON par morceaux. Les pages sont lues une seule fois et chaque section (text,
+    positioned_text, tables, images, pages) est écrite au fur et à mesure dans un
+    fichier temporaire, puis les fichiers sont renvoyés dans l'ordre du format : la
+    mémoire utilisée ne dépend pas du nombre de pages.
+    add_image_url(image) et add_page_urls(page) complètent les images et les pages.
+    """
+    sections = ("text", "positioned_text", "tables", "images", "pages")
+    with ExitStack() as stack:
+        spill = {
+            section: stack.enter_context(
+                tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, mode="w+", encoding="utf-8")
+            )
+            for section in sections
+        }
+        counts = dict.fromkeys(sections, 0)
+
+        def write_items(section, items):
+            for item in items:
+                spill[section].write(("" if not counts[section] else ", ") + json.dumps(item))
+                counts[section] += 1
+
+        for page_data in document.iter_page_data():
+            # Contenu de la chaîne JSON du texte, sans ses guillemets
+            spill["text"].write(
+                json.dumps(f"\n--- Page {page_data['page_number']} ---\n{page_data['text']}\n")[1:-1]
+            )
+            if add_image_url is not None:
+                for image in page_data["images"]:
+                    add_image_url(image)
+            if add_page_urls is not None:
+                # Complète aussi les tableaux de la page (liens d'export)
+                add_page_urls(page_data)
+            write_items("positioned_text", page_data["positioned_text"])
+            write_items("tables", page_data["tables"])
+            write_items("images", page_data["images"])
+            write_items("pages", [page_data])
+
+        stored = document.extraction_results or {}
+        yield '{"text": "'
+        yield from _read_spilled(spill["text"])
+        yield '"'
+        for section in ("positioned_text", "tables", "images"):
+            yield f', "{section}": ['
+            yield from _read_spilled(spill[section])
+            yield "]"
+        yield ', "metadata": ' + json.dumps(stored.get("metadata", {}))
+        yield ', "pages": ['
+        yield from _read_spilled(spill["pages"])
+        yield "]"
+        if stored.get("extraction_errors"):
+            yield ', "extraction_errors": ' + json.dumps(stored["extraction_errors"])
+        yield "}"
+
+
+def _read_spilled(spill_file):
+    spill_file.seek(0)
+    yield from iter(lambda: spill_file.read(READ_SIZE), "")
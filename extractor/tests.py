@@ -1,3 +1,1217 @@
-from django.test import TestCase
+"""
+Tests de l'extracteur.
 
-# Create your tests here.
+Les PDF de test sont ceux du corpus de benchmark (extractor.benchmark), générés
+en version réduite une fois par classe. Les modules de l'extracteur écrivent
+dans des dossiers media/ relatifs : chaque classe s'exécute dans un dossier
+temporaire.
+"""
+import base64
+import csv
+import hashlib
+import importlib
+import importlib.util
+import io
+import json
+import mmap
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+import fitz  # PyMuPDF
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from .benchmark import benchmark_document, compare_results, format_report, generate_corpus, run_benchmark
+from .cache import collect_image_store, evict_cache
+from .derivatives import DERIVATIVES_FOLDER, evict_derivatives
+from .imagestore import get_image_store_folder, store_image
+from .incremental import plan_page_reuse
+from .isolation import PageWorker, _check_worker, iter_pages_isolated
+from .jobs import run_extraction
+from .metrics import ExtractionProfiler
+from .models import ExtractedImage, Page, PDFDocument, StoredImage, UploadSession
+from .ocr import TesseractOCR, get_extractor_version, is_blank, parse_tsv, text_coverage
+from .sources import PDFSource
+from .spans import SpanTable
+from .spatial import BBoxIndex
+from .streaming import iter_document_events, iter_results_json
+from .utils import (LAYOUT_COLUMNS, TABLE_MERGE_IOU, PDFBackends, _add_table, _has_aligned_text,
+                    classify_table_page, detect_tables_from_text_blocks, extract_page_content, extract_pdf_content, extract_text_with_layout,
+                    iter_pdf_pages, layout_to_records)
+from .views import _decode_cursor, _encode_cursor, _parse_page_ranges
+
+
+class TemporaryWorkdirMixin:
+    """Dossier de travail et MEDIA_ROOT temporaires, partagés par les tests de la classe"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.previous_cwd = os.getcwd()
+        cls.workdir = tempfile.mkdtemp(prefix="pdf_extractor_tests_")
+        os.chdir(cls.workdir)
+        cls.media_settings = override_settings(MEDIA_ROOT=os.path.join(cls.workdir, 'media'))
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        os.chdir(cls.previous_cwd)
+        shutil.rmtree(cls.workdir, ignore_errors=True)
+        super().tearDownClass()
+
+
+class CorpusMixin(TemporaryWorkdirMixin):
+    """Corpus de benchmark réduit (documents corpus_names), dans self.corpus"""
+
+    corpus_names = ['text_heavy', 'table_heavy']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.corpus = generate_corpus(os.path.join(cls.workdir, 'corpus'), quick=True, names=cls.corpus_names)
+
+
+def text_blocks(rows):
+    """Blocs de texte au format de _parse_text_dict : une ligne par liste de x0"""
+    blocks = []
+    for index, starts in enumerate(rows):
+        for x0 in starts:
+            blocks.append({"text": "cellule", "x0": x0, "x1": x0 + 40, "y0": 50 + index * 12,
+                           "y1": 58 + index * 12, "font_size": 8})
+    return blocks
+
+
+class ExtractedDocumentMixin(CorpusMixin):
+    """
+    Téléverse et extrait un document du corpus ; la classe de test fixe
+    PDF_EXTRACTION_WORKERS à 0 : la file est exécutée dans le test
+    """
+
+    def queue(self, path, expected_status=202, **data):
+        with open(path, 'rb') as pdf_file:
+            response = self.client.post('/process/', {'pdf_file': pdf_file, **data})
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.json()
+
+    def upload(self, path, **data):
+        document_id = self.queue(path, **data)['document_id']
+        run_extraction(document_id)
+        return PDFDocument.objects.get(id=document_id)
+
+
+class BenchmarkTests(CorpusMixin, TestCase):
+    corpus_names = ['text_heavy', 'table_heavy', 'scanned']
+
+    def test_corpus_is_generated_once(self):
+        folder = os.path.join(self.workdir, 'corpus')
+        mtimes = {name: os.path.getmtime(path) for name, path in self.corpus.items()}
+        paths = generate_corpus(folder, quick=True, names=self.corpus_names)
+        self.assertEqual(paths, self.corpus)
+        self.assertEqual({name: os.path.getmtime(path) for name, path in paths.items()}, mtimes)
+        with open(os.path.join(folder, 'corpus.json')) as manifest:
+            self.assertEqual(json.load(manifest)['documents'], {'text_heavy': 5, 'table_heavy': 3, 'scanned': 2})
+
+    def test_benchmark_document(self):
+        result = benchmark_document(self.corpus['table_heavy'], os.path.join(self.workdir, 'out'))
+        self.assertEqual(result['pages'], 3)
+        self.assertEqual(result['errors'], 0)
+        self.assertGreater(result['counts']['tables'], 0)
+        self.assertGreater(result['counts']['spans'], 0)
+        self.assertGreater(result['stage_seconds']['plumber_tables'], 0)
+        self.assertEqual(result['output_bytes'], result['result_bytes'] + result['image_bytes'])
+        self.assertFalse(os.path.exists(os.path.join(self.workdir, 'out')))
+
+    def test_scanned_pages_have_no_native_text(self):
+        result = benchmark_document(self.corpus['scanned'], os.path.join(self.workdir, 'out'))
+        self.assertEqual(result['counts']['spans'], 0)
+        self.assertGreater(result['counts']['images'], 0)
+
+    def test_run_benchmark_and_compare(self):
+        results = run_benchmark({'text_heavy': self.corpus['text_heavy']}, os.path.join(self.workdir, 'bench'))
+        document = results['documents']['text_heavy']
+        self.assertEqual(document['pages'], 5)
+        self.assertEqual(document['runs'], 1)
+        self.assertIn('text_heavy', format_report(results))
+
+        self.assertFalse(any(row['regression'] for row in compare_results(results, results)))
+        baseline = json.loads(json.dumps(results))
+        baseline['documents']['text_heavy']['seconds'] = document['seconds'] / 2
+        rows = {row['metric']: row for row in compare_results(results, baseline)}
+        self.assertTrue(rows['seconds']['regression'])
+        self.assertAlmostEqual(rows['seconds']['change'], 1.0, places=2)
+
+
+class SinglePassExtractionTests(CorpusMixin, TestCase):
+    corpus_names = ['text_heavy', 'table_heavy']
+
+    def test_each_page_is_parsed_once(self):
+        get_text = fitz.Page.get_text
+        calls = []
+
+        def counted_get_text(page, *args, **kwargs):
+            calls.append((page.number, args))
+            return get_text(page, *args, **kwargs)
+
+        with PDFBackends(self.corpus['table_heavy']) as backends:
+            with mock.patch.object(fitz.Page, 'get_text', autospec=True, side_effect=counted_get_text):
+                for page_num in range(backends.page_count):
+                    extract_page_content(backends, page_num, 'images')
+            self.assertEqual(calls, [(page_num, ('dict',)) for page_num in range(backends.page_count)])
+
+    def test_document_is_opened_once_per_backend(self):
+        opened = []
+        for name in ('open_fitz', 'open_pdfium', 'open_plumber'):
+            original = getattr(PDFSource, name)
+            patcher = mock.patch.object(PDFSource, name, autospec=True,
+                                        side_effect=lambda source, name=name, original=original: (
+                                            opened.append(name), original(source))[1])
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        result = extract_pdf_content(self.corpus['table_heavy'], 'images')
+        self.assertGreater(result['metadata']['total_tables'], 0)
+        # Pas d'image à compléter : pypdfium2 n'est jamais ouvert
+        self.assertEqual(sorted(opened), ['open_fitz', 'open_plumber'])
+
+    def test_secondary_backends_only_when_needed(self):
+        with PDFBackends(self.corpus['text_heavy']) as backends:
+            for page_num in range(backends.page_count):
+                page_data, _ = extract_page_content(backends, page_num, 'images')
+                self.assertTrue(page_data['text'])
+            self.assertIsNone(backends._pdfium_doc)
+            self.assertIsNone(backends._plumber_pdf)
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class ExtractionJobTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['text_heavy']
+
+    def test_upload_is_queued_then_extracted(self):
+        queued = self.queue(self.corpus['text_heavy'])
+        self.assertEqual(queued['status'], PDFDocument.STATUS_QUEUED)
+        url = f"/results/{queued['document_id']}/"
+        self.assertEqual(self.client.get(url).status_code, 202)
+
+        self.assertTrue(run_extraction(queued['document_id']))
+        # Déjà pris : un second worker ne l'extrait pas à nouveau
+        self.assertFalse(run_extraction(queued['document_id']))
+        data = self.client.get(url).json()
+        self.assertEqual(data['status'], PDFDocument.STATUS_DONE)
+        self.assertEqual(data['progress'], {'pages_processed': 5, 'pages_total': 5, 'percent': 100})
+        self.assertEqual(len(data['results']['pages']), 5)
+
+    def test_failed_extraction(self):
+        queued = self.queue(self.corpus['text_heavy'])
+        document = PDFDocument.objects.get(id=queued['document_id'])
+        os.remove(document.file.path)
+        run_extraction(document.id)
+        document.refresh_from_db()
+        self.assertEqual(document.status, PDFDocument.STATUS_FAILED)
+        self.assertTrue(document.error_message)
+        self.assertFalse(self.client.get(f'/results/{document.id}/').json()['success'])
+
+    def test_migration_backfills_legacy_documents(self):
+        migration = importlib.import_module('extractor.migrations.0003_pdfdocument_job_status')
+        done = PDFDocument.objects.create(extraction_completed=True)
+        abandoned = PDFDocument.objects.create(extraction_completed=False)
+        migration.backfill_job_status(apps, None)
+        done.refresh_from_db()
+        abandoned.refresh_from_db()
+        self.assertEqual(done.status, PDFDocument.STATUS_DONE)
+        self.assertEqual(done.error_message, '')
+        # Jamais remis en file
+        self.assertEqual(abandoned.status, PDFDocument.STATUS_FAILED)
+        self.assertTrue(abandoned.error_message)
+
+
+class ParallelExtractionTests(CorpusMixin, TestCase):
+    corpus_names = ['table_heavy', 'image_heavy']
+
+    def test_pool_matches_serial_extraction(self):
+        for name, path in self.corpus.items():
+            serial = extract_pdf_content(path, os.path.join('images', name))
+            parallel = extract_pdf_content(path, os.path.join('images', name), workers=2, chunk_size=1)
+            self.assertEqual(parallel['pages'], serial['pages'], name)
+            self.assertEqual(parallel['text'], serial['text'])
+            self.assertEqual(parallel['metadata']['total_tables'], serial['metadata']['total_tables'])
+            self.assertEqual(parallel['metadata']['total_images'], serial['metadata']['total_images'])
+
+    def test_pages_are_produced_in_order(self):
+        pages = iter_pdf_pages(self.corpus['image_heavy'], 'images', workers=2, chunk_size=1)
+        self.assertEqual([page_num for page_num, *_ in pages], [0, 1, 2])
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class ResultCacheTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['text_heavy', 'table_heavy']
+
+    def test_identical_upload_reuses_document(self):
+        document = self.upload(self.corpus['text_heavy'])
+        again = self.queue(self.corpus['text_heavy'], expected_status=200)
+        self.assertTrue(again['cached'])
+        self.assertEqual(again['document_id'], document.id)
+        self.assertEqual(again['status'], PDFDocument.STATUS_DONE)
+        self.assertEqual(PDFDocument.objects.count(), 1)
+
+        other = self.queue(self.corpus['table_heavy'])
+        self.assertFalse(other['cached'])
+
+    def test_extractor_version_is_part_of_the_key(self):
+        document = self.upload(self.corpus['text_heavy'])
+        PDFDocument.objects.filter(id=document.id).update(extractor_version='0')
+        again = self.queue(self.corpus['text_heavy'])
+        self.assertFalse(again['cached'])
+        self.assertNotEqual(again['document_id'], document.id)
+
+    def test_eviction(self):
+        old = self.upload(self.corpus['text_heavy'])
+        recent = self.upload(self.corpus['table_heavy'])
+        PDFDocument.objects.filter(id=old.id).update(last_accessed_at=timezone.now() - timedelta(days=40))
+        queued = PDFDocument.objects.create(status=PDFDocument.STATUS_QUEUED)
+
+        self.assertEqual(evict_cache(max_age_days=30)[0], 1)
+        self.assertFalse(PDFDocument.objects.filter(id=old.id).exists())
+        self.assertFalse(os.path.exists(old.file.path))
+
+        evicted, freed = evict_cache(max_bytes=0)
+        self.assertEqual(evicted, 1)
+        self.assertGreater(freed, 0)
+        self.assertFalse(PDFDocument.objects.filter(id=recent.id).exists())
+        # Un document en file n'est jamais évincé
+        self.assertTrue(PDFDocument.objects.filter(id=queued.id).exists())
+
+
+class ImageDeduplicationTests(TemporaryWorkdirMixin, TestCase):
+
+    def make_pdf(self):
+        """Une photo JPEG (XObject) et une image inline, que seul pypdfium2 extrait"""
+        image = Image.radial_gradient('L').resize((320, 240)).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        pixels = bytes((x * 16) ^ (y * 16) for y in range(16) for x in range(16))
+        inline = b"q 160 0 0 160 50 400 cm BI /W 16 /H 16 /CS /G /BPC 8 /F /AHx ID " + pixels.hex().encode() + b"> EI Q"
+        path = os.path.join(self.workdir, 'inline_image.pdf')
+        with fitz.open() as doc:
+            page = doc.new_page()
+            page.insert_image(fitz.Rect(50, 50, 370, 290), stream=buffer.getvalue())
+            page.clean_contents()
+            xref = page.get_contents()[0]
+            doc.update_stream(xref, doc.xref_stream(xref) + b"\n" + inline)
+            doc.save(path)
+        return path
+
+    def test_pdfium_pass_uses_in_memory_index(self):
+        path = self.make_pdf()
+        image_open = Image.open
+        opened = []
+
+        def tracked_open(fp, *args, **kwargs):
+            opened.append(fp)
+            return image_open(fp, *args, **kwargs)
+
+        with PDFBackends(path) as backends:
+            with mock.patch('extractor.utils.Image.open', side_effect=tracked_open):
+                page_data, page_result = extract_page_content(backends, 0, 'images')
+            # Deux blocs image pour une seule image PyMuPDF : la passe pypdfium2 a bien eu lieu
+            self.assertIsNotNone(backends._pdfium_doc)
+
+        # La photo, déjà indexée par la passe PyMuPDF, n'est pas extraite une seconde fois
+        self.assertEqual([image['extraction_method'] for image in page_data['images']], ['PyMuPDF', 'pypdfium2'])
+        self.assertNotIn('image_hashes', page_result)
+        # Aucun fichier relu depuis le disque : uniquement les octets en mémoire
+        self.assertTrue(opened)
+        self.assertTrue(all(isinstance(fp, io.BytesIO) for fp in opened))
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class StreamingTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['text_heavy']
+
+    def test_pages_then_end(self):
+        document = self.upload(self.corpus['text_heavy'])
+        response = self.client.get(f'/results/{document.id}/stream/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([event['type'] for event in events], ['document'] + ['page'] * 5 + ['end'])
+        self.assertEqual([event['page']['page_number'] for event in events[1:-1]], [1, 2, 3, 4, 5])
+        self.assertEqual(events[-1]['status'], PDFDocument.STATUS_DONE)
+        self.assertEqual(events[-1]['metadata']['total_pages'], 5)
+
+    def test_stalled_job_times_out(self):
+        document = PDFDocument.objects.create(status=PDFDocument.STATUS_RUNNING)
+        events = list(iter_document_events(document, poll_interval=0, idle_timeout=0))
+        self.assertEqual([event['type'] for event in events], ['document', 'error'])
+        self.assertEqual(events[-1]['status'], 'timeout')
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class NormalizedResultsTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['table_heavy']
+
+    def test_results_are_rebuilt_from_rows(self):
+        document = self.upload(self.corpus['table_heavy'])
+        expected = extract_pdf_content(self.corpus['table_heavy'], 'images')
+
+        # Le document ne garde que les métadonnées ; le contenu est dans les tables
+        self.assertLessEqual(set(document.extraction_results), {'metadata', 'extraction_errors'})
+        self.assertEqual(document.pages.count(), 3)
+        self.assertEqual(document.tables.count(), expected['metadata']['total_tables'])
+        self.assertEqual(document.page_count, 3)
+        self.assertEqual(document.table_count, expected['metadata']['total_tables'])
+        self.assertEqual(document.text_length, expected['metadata']['total_text_length'])
+        self.assertTrue(document.has_tables)
+
+        results = document.build_results()
+        self.assertEqual(results['text'], expected['text'])
+        self.assertEqual([table['data'] for table in results['tables']],
+                         [table['data'] for table in expected['tables']])
+        self.assertEqual(len(results['positioned_text']), len(expected['positioned_text']))
+        self.assertEqual(document.get_page_data(2), results['pages'][1])
+        self.assertIsNone(document.get_page_data(4))
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class ResultsParametersTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['text_heavy']
+
+    def test_parse_page_ranges(self):
+        self.assertEqual(_parse_page_ranges('1-5,8,12-'), [(1, 5), (8, 8), (12, None)])
+        self.assertEqual(_parse_page_ranges('4-6, 1-3 ,10'), [(1, 6), (10, 10)])
+        self.assertEqual(_parse_page_ranges('3-,1-2,5-7'), [(1, None)])
+        self.assertEqual(_parse_page_ranges('-3'), [(1, 3)])
+        for value in ('', ',', '0', '5-2', 'a', '1-b'):
+            with self.assertRaises(ValueError):
+                _parse_page_ranges(value)
+
+    def test_cursor(self):
+        self.assertEqual(_decode_cursor(_encode_cursor(7)), 7)
+        for page in (0, -1, '3'):
+            with self.assertRaises(ValueError):
+                _decode_cursor(base64.urlsafe_b64encode(json.dumps({'page': page}).encode()).decode())
+        with self.assertRaises(ValueError):
+            _decode_cursor('pas un curseur')
+
+    def test_pages_limit_and_cursor(self):
+        document = self.upload(self.corpus['text_heavy'])
+        url = f'/results/{document.id}/'
+        data = self.client.get(url, {'pages': '2-', 'fields': 'text', 'limit': 2}).json()
+        self.assertEqual([page['page_number'] for page in data['results']['pages']], [2, 3])
+        self.assertNotIn('positioned_text', data['results']['pages'][0])
+        data = self.client.get(url, {'pages': '2-', 'fields': 'text', 'limit': 2,
+                                     'cursor': data['next_cursor']}).json()
+        self.assertEqual([page['page_number'] for page in data['results']['pages']], [4, 5])
+        self.assertIsNone(data['next_cursor'])
+
+        for params in ({'pages': '0'}, {'fields': 'nope'}, {'limit': 0}, {'cursor': 'x'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_etag(self):
+        document = self.upload(self.corpus['text_heavy'])
+        url = f'/results/{document.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(url, {'pages': '1'})['ETag'], etag)
+
+        # Nouvelle extraction : l'ETag change
+        PDFDocument.objects.filter(id=document.id).update(pages_processed=1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_sections_limit_the_queries(self):
+        document = self.upload(self.corpus['text_heavy'])
+        with self.assertNumQueries(1):
+            pages = list(document.iter_page_data(sections=('text',)))
+        self.assertEqual([sorted(page) for page in pages], [['bbox', 'page_number', 'rotation', 'text']] * 5)
+
+
+class TextLayoutTests(CorpusMixin, TestCase):
+    corpus_names = ['text_heavy']
+
+    def test_columns_hold_real_character_boxes(self):
+        layout = extract_text_with_layout(self.corpus['text_heavy'])
+        self.assertNotIn('extraction_errors', layout)
+        lengths = {len(layout[name]) for name in LAYOUT_COLUMNS}
+        self.assertEqual(len(lengths), 1)
+        self.assertGreater(lengths.pop(), 0)
+        self.assertEqual(sorted(set(layout['page'].tolist())), [1, 2, 3, 4, 5])
+
+        with fitz.open(self.corpus['text_heavy']) as doc:
+            span = doc[0].get_text('rawdict')['blocks'][0]['lines'][0]['spans'][0]
+        records = layout_to_records(layout, 0, len(span['chars']))
+        self.assertEqual(''.join(record['char'] for record in records), ''.join(char['c'] for char in span['chars']))
+        for record, char in zip(records, span['chars']):
+            self.assertAlmostEqual(record['x'], char['bbox'][0], places=3)
+            self.assertAlmostEqual(record['width'], char['bbox'][2] - char['bbox'][0], places=3)
+            self.assertEqual(record['font'], span['font'])
+        # Largeurs propres à chaque caractère, pas une moyenne par span
+        self.assertGreater(len({round(record['width'], 3) for record in records}), 1)
+
+    def test_errors_are_reported(self):
+        with self.assertLogs('extractor.utils', 'ERROR'):
+            layout = extract_text_with_layout(os.path.join(self.workdir, 'absent.pdf'))
+        self.assertEqual(len(layout['page']), 0)
+        self.assertEqual(layout['fonts'], [])
+        self.assertEqual(len(layout['extraction_errors']), 1)
+
+
+class SpanTableTests(TemporaryWorkdirMixin, TestCase):
+    spans = [
+        {'text': 'Référence', 'bbox': [10.5, 20.0, 80.25, 32.0], 'font': 'Helvetica-Bold',
+         'size': 12.0, 'flags': 16, 'color': 0},
+        {'text': '', 'bbox': [0.0, 0.0, 0.0, 0.0], 'font': 'Helvetica', 'size': 9.5, 'flags': 0, 'color': 255},
+        {'text': 'Quantité à retourner €', 'bbox': [90.0, 20.0, 200.5, 32.0], 'font': 'Helvetica',
+         'size': 12.0, 'flags': 0, 'color': 0xFF0000},
+    ]
+
+    def test_npz_roundtrip(self):
+        path = os.path.join(self.workdir, 'spans', '1.npz')
+        table = SpanTable.from_spans(self.spans)
+        self.assertEqual(table.fonts, ['Helvetica-Bold', 'Helvetica'])
+        table.save(path)
+        loaded = SpanTable.load(path)
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded.to_list(), self.spans)
+        self.assertEqual(loaded[-1]['text'], 'Quantité à retourner €')
+        with self.assertRaises(IndexError):
+            loaded[3]
+
+        empty_path = os.path.join(self.workdir, 'spans', 'empty.npz')
+        SpanTable.empty().save(empty_path)
+        self.assertEqual(SpanTable.load(empty_path).to_list(), [])
+
+    def test_page_spans_are_loaded_on_demand(self):
+        document = PDFDocument.objects.create()
+        document.add_page({'page_number': 1, 'text': 'Référence', 'positioned_text': self.spans,
+                           'bbox': [0, 0, 595, 842]})
+        self.assertTrue(os.path.exists(document.pages.get().spans_path))
+
+        with mock.patch.object(SpanTable, 'load', wraps=SpanTable.load) as load:
+            pages = list(document.iter_page_data(sections=('text',)))
+            load.assert_not_called()
+            page = document.pages.get()
+            self.assertEqual(page.spans.to_list(), self.spans)
+            self.assertEqual(len(page.spans), 3)
+            load.assert_called_once()
+        self.assertEqual(pages[0]['text'], 'Référence')
+
+
+class TableClassifierTests(TestCase):
+
+    def test_aligned_columns(self):
+        self.assertTrue(_has_aligned_text(text_blocks([[40, 150, 260, 370]] * 4)))
+        # Trois lignes suffisent, pas deux
+        self.assertTrue(_has_aligned_text(text_blocks([[40, 150, 260]] * 3)))
+        self.assertFalse(_has_aligned_text(text_blocks([[40, 150, 260]] * 2)))
+
+    def test_two_column_prose_is_not_a_table(self):
+        # Une seule colonne alignée hors marge : texte sur deux colonnes
+        self.assertFalse(_has_aligned_text(text_blocks([[40, 320]] * 10)))
+
+    def test_unaligned_cells(self):
+        rows = [[40, 150 + offset * 30, 260 + offset * 45] for offset in range(6)]
+        self.assertFalse(_has_aligned_text(text_blocks(rows)))
+
+    def test_classify_table_page(self):
+        doc = fitz.open()
+        page = doc.new_page()
+        aligned = text_blocks([[40, 150, 260, 370]] * 4)
+        prose = text_blocks([[40, 320]] * 30)
+        self.assertEqual(classify_table_page(page, []), [])
+        self.assertEqual(classify_table_page(page, aligned), ['text'])
+        self.assertEqual(classify_table_page(page, prose), [])
+        # Peu de lignes : la stratégie "text" est toujours exécutée
+        self.assertEqual(classify_table_page(page, text_blocks([[40]] * 20)), ['text'])
+
+        for y in (40, 60, 80, 100):
+            page.draw_line((30, y), (420, y))
+        for x in (30, 140, 420):
+            page.draw_line((x, 40), (x, 100))
+        self.assertEqual(classify_table_page(page, aligned), ['lines', 'hybrid', 'text'])
+        self.assertEqual(classify_table_page(page, prose), ['lines', 'hybrid'])
+        doc.close()
+
+    def test_horizontal_rulings_around_text(self):
+        doc = fitz.open()
+        page = doc.new_page()
+        prose = text_blocks([[40, 320]] * 30)
+        # Un filet sous l'en-tête de page, tracé en double : pas un tableau
+        page.draw_line((30, 45), (420, 45))
+        page.draw_line((30, 45.4), (420, 45.4))
+        self.assertEqual(classify_table_page(page, prose), [])
+        # Cellules encadrées par des traits horizontaux, sans traits verticaux
+        page.draw_line((30, 60), (420, 60))
+        page.draw_line((30, 72), (420, 72))
+        self.assertEqual(classify_table_page(page, prose), ['lines', 'hybrid'])
+        doc.close()
+
+
+class RuledTableRecallTests(TemporaryWorkdirMixin, TestCase):
+
+    def make_pdf(self):
+        """Tableau réglé de 3 colonnes (traits en rectangles fins, en-tête grisé) sous du texte courant"""
+        path = os.path.join(self.workdir, 'ruled_table.pdf')
+        with fitz.open() as doc:
+            page = doc.new_page()
+            for line in range(30):
+                page.insert_text((50, 50 + line * 11), f"Ligne {line + 1} du courrier, texte courant sans tableau.",
+                                 fontsize=9)
+            page.draw_rect(fitz.Rect(127, 452, 468, 495), color=None, fill=(0.85, 0.85, 0.85))
+            for y in (452, 495, 510, 525):
+                page.draw_rect(fitz.Rect(127, y, 468, y + 0.5), color=None, fill=(0, 0, 0))
+            for x in (127, 240, 345, 468):
+                page.draw_rect(fitz.Rect(x, 452, x + 0.5, 525), color=None, fill=(0, 0, 0))
+            cells = [
+                (156, 478, 'REFERENCE'), (250, 478, 'NUMERO DE LOT'), (376, 465, 'QUANTITE A'), (376, 478, 'RETOURNER'),
+                (156, 506, 'SSTRAP5'), (250, 506, 'A1234'), (376, 506, '2'),
+                (156, 521, 'SSTRAP10'), (250, 521, 'B5678'), (376, 521, '1'),
+            ]
+            for x, y, text in cells:
+                page.insert_text((x, y), text, fontsize=9)
+            doc.save(path)
+        return path
+
+    def test_ruled_table_is_extracted(self):
+        with PDFBackends(self.make_pdf()) as backends:
+            page_data, _ = extract_page_content(backends, 0, 'images')
+        self.assertEqual(len(page_data['tables']), 1)
+        table = page_data['tables'][0]
+        self.assertEqual(table['columns'], 3)
+        self.assertEqual(table['data'], [
+            ['REFERENCE', 'NUMERO DE LOT', 'QUANTITE A\nRETOURNER'],
+            ['SSTRAP5', 'A1234', '2'],
+            ['SSTRAP10', 'B5678', '1'],
+        ])
+
+
+class TableDeduplicationTests(TestCase):
+
+    def add(self, page_data, index, table_id, bbox):
+        return _add_table(page_data, index, {'table_id': table_id, 'bbox': bbox}, TABLE_MERGE_IOU)
+
+    def test_overlapping_tables_are_merged(self):
+        page_data = {'tables': []}
+        index = BBoxIndex()
+        self.assertTrue(self.add(page_data, index, 't1', [100, 100, 300, 200]))
+        # Même tableau trouvé par une autre stratégie (IoU > 0,5)
+        self.assertFalse(self.add(page_data, index, 't2', [105, 100, 305, 200]))
+        # Fragment du premier tableau
+        self.assertFalse(self.add(page_data, index, 't3', [110, 110, 200, 190]))
+        # Tableau voisin, faible recouvrement
+        self.assertTrue(self.add(page_data, index, 't4', [250, 100, 450, 200]))
+        # Tableau sans bbox : toujours retenu, jamais indexé
+        self.assertTrue(_add_table(page_data, index, {'table_id': 't5'}, TABLE_MERGE_IOU))
+        self.assertEqual([table['table_id'] for table in page_data['tables']], ['t1', 't4', 't5'])
+        self.assertEqual(len(index), 2)
+
+    def test_bbox_index_overlapping(self):
+        index = BBoxIndex()
+        index.insert((0, 0, 600, 20), 'large')
+        index.insert((10, 100, 50, 120), 'a')
+        index.insert((300, 100, 350, 120), 'b')
+        self.assertEqual({item for _, item in index.overlapping((20, 10, 320, 110))}, {'large', 'a', 'b'})
+        self.assertEqual({item for _, item in index.overlapping((400, 100, 500, 130))}, set())
+        # Boîte à droite d'une entrée plus large trouvée malgré x0 inférieur
+        self.assertEqual({item for _, item in index.overlapping((500, 5, 520, 15))}, {'large'})
+        self.assertEqual(index.best_match((12, 100, 50, 120))[1], 'a')
+        self.assertEqual(index.best_match((700, 0, 800, 10)), (0.0, None))
+
+    def test_page_wide_table_among_small_ones(self):
+        index = BBoxIndex()
+        index.insert((20, 20, 580, 820), 'page')
+        small = {}
+        for row in range(20):
+            for col in range(15):
+                bbox = (25 + col * 37, 25 + row * 39, 55 + col * 37, 55 + row * 39)
+                small[f'{row}-{col}'] = bbox
+                index.insert(bbox, f'{row}-{col}')
+        self.assertEqual(len(index), 301)
+
+        query = (100, 100, 110, 110)
+        expected = {'page'} | {item for item, bbox in small.items()
+                               if bbox[0] < query[2] and bbox[2] > query[0] and bbox[1] < query[3] and bbox[3] > query[1]}
+        self.assertEqual({item for _, item in index.overlapping(query)}, expected)
+        self.assertEqual(index.best_match(small['3-2'])[1], '3-2')
+        # Seules les entrées des cellules voisines sont comparées, malgré le tableau pleine page
+        self.assertLess(len(index._candidates(query)), 10)
+        # Requête plus large que la grille occupée
+        self.assertEqual(len(index.overlapping((-1e6, -1e6, 1e6, 1e6))), 301)
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class TableExportTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['table_heavy']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.has_openpyxl = importlib.util.find_spec('openpyxl') is not None
+
+    def setUp(self):
+        self.document = self.upload(self.corpus['table_heavy'])
+        self.table = self.document.tables.order_by('page_number', 'position').first()
+        self.url = f'/tables/{self.document.id}/{self.table.table_id}/export/'
+
+    def read_csv(self, response):
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return list(csv.reader(io.StringIO(content.decode('utf-8'))))
+
+    def test_csv_export_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read_csv(response), self.table.data)
+        self.assertTrue(os.path.exists(os.path.join('media', 'table_exports', str(self.document.id),
+                                                    f'{self.table.table_id}.csv')))
+        self.assertEqual(self.client.get(self.url, {'format': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.get(f'/tables/{self.document.id}/absent/export/').status_code, 404)
+
+    def test_export_urls_list_available_formats(self):
+        table = self.client.get(f'/results/{self.document.id}/').json()['results']['tables'][0]
+        self.assertEqual(table['export_urls']['csv'], self.url + '?format=csv')
+        self.assertEqual('xlsx' in table['export_urls'], self.has_openpyxl)
+
+    def test_missing_optional_dependency(self):
+        if self.has_openpyxl:
+            self.skipTest('openpyxl est installé')
+        response = self.client.get(self.url, {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.json()['success'])
+
+    def test_edited_cells_are_exported(self):
+        edited = [list(row) for row in self.table.data]
+        edited[0][0] = 'Cellule modifiée'
+        response = self.client.post(self.url, json.dumps({'rows': edited}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'{self.table.table_id}.csv', response['Content-Disposition'])
+        self.assertEqual(self.read_csv(response), edited)
+        # Ni le tableau stocké ni l'export en cache ne sont modifiés
+        self.assertEqual(self.read_csv(self.client.get(self.url)), self.table.data)
+
+        for body in ('pas du JSON', json.dumps({'rows': 'a,b'}), json.dumps([['a']])):
+            response = self.client.post(self.url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+class TextBlockTableTests(TestCase):
+
+    def block(self, text, x0, row, width=40):
+        return {"text": text, "x0": x0, "x1": x0 + width, "y0": 50 + row * 12, "y1": 58 + row * 12, "font_size": 8}
+
+    def row_blocks(self, rows, starts, first_row=0):
+        return [self.block(text, x0, row) for row, cells in enumerate(rows, start=first_row)
+                for text, x0 in zip(cells, starts)]
+
+    def test_several_tables_on_a_page(self):
+        lots = [["Réf", "Lot", "Qté"], ["A1", "L-01", "2"], ["A2", "L-02", "5"], ["A3", "L-03", "1"]]
+        sites = [["Site", "Pays"], ["Gidy", "France"], ["Arklow", "Irlande"], ["Varsovie", "Pologne"]]
+        blocks = self.row_blocks(lots, (40, 150, 260))
+        blocks += [self.block("Paragraphe de texte courant entre les deux tableaux de la page.", 40, row, width=400)
+                   for row in range(4, 7)]
+        blocks += self.row_blocks(sites, (40, 200), first_row=7)
+        snapshot = json.dumps(blocks)
+
+        tables = detect_tables_from_text_blocks(blocks, 3)
+        self.assertEqual([table['data'] for table in tables], [lots, sites])
+        self.assertEqual([table['table_id'] for table in tables],
+                         ['page_3_pymupdf_table_1', 'page_3_pymupdf_table_2'])
+        self.assertEqual(tables[0]['bbox'], [40.0, 50.0, 300.0, 94.0])
+        # Les blocs d'entrée ne sont pas modifiés
+        self.assertEqual(json.dumps(blocks), snapshot)
+
+    def test_two_column_prose_is_rejected(self):
+        sentence = "Une phrase de texte courant, assez longue pour une colonne de prose."
+        blocks = [self.block(sentence, x0, row, width=240) for row in range(20) for x0 in (40, 320)]
+        self.assertEqual(detect_tables_from_text_blocks(blocks, 1), [])
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class IncrementalExtractionTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['text_heavy']
+
+    def previous_document(self, fingerprints, **fields):
+        fields = {'status': PDFDocument.STATUS_DONE, 'extractor_version': get_extractor_version(), **fields}
+        document = PDFDocument.objects.create(**fields)
+        for page_number, fingerprint in enumerate(fingerprints, start=1):
+            Page.objects.create(document=document, page_number=page_number, fingerprint=fingerprint)
+        return document
+
+    def test_plan_page_reuse(self):
+        previous = self.previous_document(['a', 'b', 'c'])
+        # Pages déplacées, ajoutée, supprimée
+        self.assertEqual(plan_page_reuse(previous, ['c', 'x', 'a', 'b']), {1: 3, 3: 1, 4: 2})
+        self.assertEqual(plan_page_reuse(None, ['a']), {})
+
+    def test_no_reuse_across_versions_or_unfinished(self):
+        self.assertEqual(plan_page_reuse(self.previous_document(['a'], extractor_version='0'), ['a']), {})
+        previous = self.previous_document(['a'])
+        PDFDocument.objects.filter(id=previous.id).update(status=PDFDocument.STATUS_FAILED)
+        previous.refresh_from_db()
+        self.assertEqual(plan_page_reuse(previous, ['a']), {})
+
+    def test_pages_with_missing_images_are_extracted_again(self):
+        previous = self.previous_document(['a', 'b'])
+        ExtractedImage.objects.create(document=previous, page_number=2, position=0, image_id='page_2_img_1',
+                                      filename='absente.png', path=os.path.join(self.workdir, 'absente.png'))
+        self.assertEqual(plan_page_reuse(previous, ['a', 'b']), {1: 1})
+
+    def test_revision_reuses_unchanged_pages(self):
+        first = self.upload(self.corpus['text_heavy'])
+        self.assertEqual(first.status, PDFDocument.STATUS_DONE)
+
+        revision_path = os.path.join(self.workdir, 'revision.pdf')
+        doc = fitz.open(self.corpus['text_heavy'])
+        doc[2].insert_text((40, 780), "Révision de la page 3", fontsize=8)
+        doc.save(revision_path)
+        doc.close()
+
+        revision = self.upload(revision_path, previous_document_id=first.id)
+        self.assertEqual(revision.status, PDFDocument.STATUS_DONE)
+        metadata = revision.extraction_results['metadata']
+        self.assertEqual(metadata['incremental'], {'previous_document_id': first.id, 'reused_pages': 4,
+                                                   'extracted_pages': 1})
+        self.assertEqual(revision.pages.count(), 5)
+        self.assertIn("Révision de la page 3", revision.get_page_data(3)['text'])
+        self.assertEqual(revision.get_page_data(1)['text'], first.get_page_data(1)['text'])
+
+
+class ChunkedUploadTests(TemporaryWorkdirMixin, TestCase):
+    content = b"%PDF-1.7\n" + b"0" * 200
+
+    def create_session(self, size=None):
+        response = self.client.post('/uploads/', {'filename': 'document.pdf', 'size': size or len(self.content)})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload_id']
+
+    def put(self, upload_id, start, end, content=None):
+        return self.client.put(
+            f'/uploads/{upload_id}/', (content or self.content)[start:end + 1],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(content or self.content)}'
+        )
+
+    def test_chunks_advance_offset(self):
+        upload_id = self.create_session()
+        self.assertEqual(self.client.get(f'/uploads/{upload_id}/').json()['offset'], 0)
+        response = self.put(upload_id, 0, 99)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['offset'], 100)
+        self.assertEqual(self.client.get(f'/uploads/{upload_id}/').json()['offset'], 100)
+        self.assertEqual(self.put(upload_id, 100, len(self.content) - 1).json()['offset'], len(self.content))
+        with open(os.path.join('media', 'uploads', f'{upload_id}.part'), 'rb') as part:
+            self.assertEqual(part.read(), self.content)
+
+    def test_unexpected_offset_conflicts(self):
+        upload_id = self.create_session()
+        self.put(upload_id, 0, 99)
+        for start, end in ((50, 149), (150, 199)):
+            response = self.put(upload_id, start, end)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['offset'], 100)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).received, 100)
+
+    def test_incomplete_upload_cannot_be_completed(self):
+        upload_id = self.create_session()
+        self.put(upload_id, 0, 99)
+        response = self.client.post(f'/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 100)
+
+    def test_invalid_requests(self):
+        upload_id = self.create_session()
+        self.assertEqual(self.client.put(f'/uploads/{upload_id}/', b'x', content_type='application/octet-stream',
+                                         HTTP_CONTENT_RANGE='bytes 5-2/10').status_code, 400)
+        # Morceau au-delà de la taille annoncée
+        self.assertEqual(self.put(upload_id, 0, len(self.content), self.content + b"0").status_code, 400)
+        self.assertEqual(self.client.post('/uploads/', {'filename': 'document.txt', 'size': 10}).status_code, 400)
+        self.assertEqual(self.client.post('/uploads/', {'filename': 'document.pdf', 'size': 0}).status_code, 400)
+
+    def test_first_chunk_must_be_a_pdf(self):
+        content = b"GIF89a" + b"0" * 2000
+        upload_id = self.create_session(len(content))
+        response = self.put(upload_id, 0, len(content) - 1, content)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.filter(id=upload_id).exists())
+
+
+class RawImageStorageTests(TemporaryWorkdirMixin, TestCase):
+
+    def jpeg(self, mode):
+        image = Image.linear_gradient('L').resize((120, 80)).convert(mode)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        return buffer.getvalue()
+
+    def test_jpeg_streams_are_written_unchanged(self):
+        streams = {'L': self.jpeg('L'), 'RGB': self.jpeg('RGB')}
+        path = os.path.join(self.workdir, 'jpegs.pdf')
+        with fitz.open() as doc:
+            page = doc.new_page()
+            for index, stream in enumerate(streams.values()):
+                page.insert_image(fitz.Rect(50, 50 + index * 150, 230, 170 + index * 150), stream=stream)
+            doc.save(path)
+
+        with PDFBackends(path) as backends:
+            # Aucune image réencodée
+            with mock.patch.object(Image.Image, 'save', side_effect=AssertionError('image réencodée')):
+                page_data, _ = extract_page_content(backends, 0, 'images')
+        images = {image['mode']: image for image in page_data['images']}
+        self.assertEqual(set(images), set(streams))
+        for mode, stream in streams.items():
+            image = images[mode]
+            self.assertEqual(image['format'], 'jpeg')
+            self.assertEqual((image['width'], image['height']), (120, 80))
+            self.assertEqual(image['size_bytes'], len(stream))
+            self.assertEqual(image['content_hash'], hashlib.sha256(stream).hexdigest())
+            with open(image['path'], 'rb') as image_file:
+                self.assertEqual(image_file.read(), stream)
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class SharedImageStoreTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = []
+
+    def make_pdf(self, name, title):
+        """Logo répété sur les trois pages (même xref)"""
+        image = Image.radial_gradient('L').resize((64, 64)).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        path = os.path.join(self.workdir, f'{name}.pdf')
+        with fitz.open() as doc:
+            xref = 0
+            for page_number in range(3):
+                page = doc.new_page()
+                page.insert_text((50, 200), f"{title}, page {page_number + 1}", fontsize=12)
+                xref = page.insert_image(fitz.Rect(50, 50, 114, 114), stream=buffer.getvalue(), xref=xref)
+            doc.save(path)
+        return path
+
+    def test_shared_xref_is_extracted_once(self):
+        extract_image = fitz.Document.extract_image
+        calls = []
+
+        def counted_extract_image(doc, xref):
+            calls.append(xref)
+            return extract_image(doc, xref)
+
+        with mock.patch.object(fitz.Document, 'extract_image', autospec=True, side_effect=counted_extract_image):
+            result = extract_pdf_content(self.make_pdf('logo', 'Logo'), 'images')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(result['images']), 3)
+        self.assertEqual(len({image['path'] for image in result['images']}), 1)
+
+    def test_reference_counting_and_collection(self):
+        first = self.upload(self.make_pdf('first', 'Premier document'))
+        second = self.upload(self.make_pdf('second', 'Second document'))
+        stored = StoredImage.objects.get()
+        self.assertEqual(stored.ref_count, 6)
+        self.assertEqual(set(ExtractedImage.objects.values_list('path', flat=True)), {stored.path})
+
+        # Fichier orphelin (extraction interrompue avant l'enregistrement en base)
+        _, _, orphan_path = store_image(get_image_store_folder(), b'orphelin', 'png')
+
+        first.clear_pages()
+        stored.refresh_from_db()
+        self.assertEqual(stored.ref_count, 3)
+        self.assertEqual(collect_image_store(grace_hours=0)[0], 1)
+        self.assertTrue(os.path.exists(stored.path))
+        self.assertFalse(os.path.exists(orphan_path))
+
+        second.clear_pages()
+        self.assertEqual(collect_image_store(grace_hours=0)[0], 1)
+        self.assertFalse(StoredImage.objects.exists())
+        self.assertFalse(os.path.exists(stored.path))
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class DerivativeTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['image_heavy']
+
+    def setUp(self):
+        self.document = self.upload(self.corpus['image_heavy'])
+        self.page = self.client.get(f'/results/{self.document.id}/', {'pages': '1'}).json()['results']['pages'][0]
+
+    def get_webp(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.format, 'WEBP')
+            return image.size
+
+    def test_image_thumbnails(self):
+        image = max(self.page['images'], key=lambda image: image['width'])
+        self.assertIn(f"{image['url']} {image['width']}w", image['srcset'])
+        url = image['thumbnail_url'].split('?')[0]
+        width, height = self.get_webp(url, w=160)
+        self.assertEqual(width, 160)
+        self.assertAlmostEqual(height, image['height'] * 160 / image['width'], delta=1)
+
+        with mock.patch('extractor.derivatives._save_webp') as save:
+            self.get_webp(url, w=160)
+            save.assert_not_called()
+        self.assertEqual(self.client.get(url, {'w': 100}).status_code, 400)
+        self.assertEqual(self.client.get('/images/absent/thumbnail/', {'w': 160}).status_code, 404)
+
+    def test_page_previews(self):
+        self.assertIn('?w=320 320w', self.page['preview_srcset'])
+        width, height = self.get_webp(self.page['preview_url'].split('?')[0], w=320)
+        self.assertEqual(width, 320)
+        self.assertGreater(height, width)
+        self.assertEqual(self.client.get(f'/pages/{self.document.id}/99/preview/', {'w': 320}).status_code, 404)
+
+    def test_least_recently_used_are_evicted(self):
+        shutil.rmtree(DERIVATIVES_FOLDER, ignore_errors=True)
+        url = self.page['preview_url'].split('?')[0]
+        for width in (160, 320, 640):
+            self.get_webp(url, w=width)
+        paths = sorted((os.path.join(root, name) for root, _, names in os.walk(DERIVATIVES_FOLDER) for name in names),
+                       key=lambda path: os.path.basename(path))
+        self.assertEqual(len(paths), 3)
+        now = timezone.now().timestamp()
+        for age, path in enumerate(paths):
+            os.utime(path, (now - age * 60, now - age * 60))
+        sizes = [os.path.getsize(path) for path in paths]
+
+        # Seul le plus ancien dérivé est supprimé
+        self.assertEqual(evict_derivatives(sum(sizes) - 1), (1, sizes[-1]))
+        self.assertEqual([os.path.exists(path) for path in paths], [True, True, False])
+        self.assertEqual(evict_derivatives(0)[0], 2)
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class ExtractionMetricsTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['table_heavy']
+
+    def test_document_metrics_and_prometheus(self):
+        document = self.upload(self.corpus['table_heavy'])
+        metrics = document.extraction_results['metadata']['metrics']
+        self.assertEqual(metrics['pages'], 3)
+        self.assertEqual(metrics['stages']['fitz_text']['pages'], 3)
+        self.assertGreater(metrics['stages']['plumber_tables']['wall_seconds'], 0)
+        self.assertEqual([page['page'] for page in metrics['page_times']], [1, 2, 3])
+        self.assertGreater(metrics['counts']['tables']['pdfplumber_lines'], 0)
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('pdf_extractor_documents_total{status="done"}', text)
+        self.assertIn('pdf_extractor_stage_wall_seconds_total{stage="plumber_tables"}', text)
+        self.assertIn('pdf_extractor_page_seconds_bucket{le="+Inf"}', text)
+        self.assertIn('pdf_extractor_documents{status="done"} 1', text)
+
+    @override_settings(PDF_EXTRACTION_PROFILER='cprofile')
+    def test_profile_is_saved(self):
+        document = self.upload(self.corpus['table_heavy'])
+        metrics = document.extraction_results['metadata']['metrics']
+        self.assertTrue(metrics['profile'].endswith('.prof'))
+        self.assertTrue(os.path.exists(metrics['profile']))
+
+    @override_settings(PDF_EXTRACTION_PROFILER='cprofile')
+    def test_concurrent_extraction_is_not_profiled(self):
+        with ExtractionProfiler('cprofile', os.path.join(self.workdir, 'profiles', 'other')):
+            with self.assertLogs('extractor.metrics', 'WARNING'):
+                document = self.upload(self.corpus['table_heavy'])
+        self.assertEqual(document.status, PDFDocument.STATUS_DONE)
+        metrics = document.extraction_results['metadata']['metrics']
+        self.assertIsNone(metrics['profile'])
+        self.assertIn('profil', metrics['profile_error'])
+
+
+class PageIsolationTests(TemporaryWorkdirMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Page 1 : grille de texte aligné, plusieurs secondes de pdfplumber ; page 2 : une ligne
+        cls.pdf_path = os.path.join(cls.workdir, 'slow.pdf')
+        doc = fitz.open()
+        page = doc.new_page(width=1200, height=1600)
+        for row in range(150):
+            for col in range(12):
+                page.insert_text((20 + col * 98, 20 + row * 10), f"c{row}x{col}", fontsize=6)
+        doc.new_page().insert_text((50, 50), "Page rapide", fontsize=12)
+        doc.save(cls.pdf_path)
+        doc.close()
+
+    def test_timeout_abandons_the_page_and_continues(self):
+        pages = list(iter_pages_isolated(self.pdf_path, [0, 1], os.path.join('media', 'images'), page_timeout=0.3))
+        self.assertEqual([page_num for page_num, *_ in pages], [0, 1])
+
+        _, page_data, errors, metrics = pages[0]
+        self.assertIsNone(page_data)
+        self.assertIsNone(metrics)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]['reason'], 'timeout')
+        self.assertEqual(errors[0]['page'], 1)
+        self.assertEqual(errors[0]['limit'], 0.3)
+
+        _, page_data, errors, metrics = pages[1]
+        self.assertIn("Page rapide", page_data['text'])
+        self.assertEqual(errors, [])
+        self.assertIsNotNone(metrics['peak_rss_mb'])
+
+    def test_memory_limit_ignores_mapped_file_pages(self):
+        # 900 Mo résidents dont 880 de pages du PDF projeté en mémoire : sous la limite de 100 Mo
+        worker = PageWorker.__new__(PageWorker)
+        worker.process = mock.Mock(pid=4242)
+        worker.conn = mock.Mock()
+        worker.page_num = 0
+        worker.deadline = None
+        status = {'VmRSS': 900 * 1024, 'RssAnon': 20 * 1024}
+        with mock.patch('extractor.isolation.status_kb', side_effect=lambda field, pid: status.get(field)):
+            self.assertIsNone(_check_worker(worker, [], None, 100))
+            status['RssAnon'] = 150 * 1024
+            (page_data, errors, metrics), abandoned = _check_worker(worker, [], None, 100)
+        self.assertTrue(abandoned)
+        self.assertEqual(errors[0]['reason'], 'memory')
+        self.assertEqual(errors[0]['limit'], 100)
+
+        # Noyau sans RssAnon : VmRSS à défaut
+        del status['RssAnon']
+        with mock.patch('extractor.isolation.status_kb', side_effect=lambda field, pid: status.get(field)):
+            self.assertEqual(worker.anon_rss_mb(), 900)
+
+
+@override_settings(PDF_EXTRACTION_WORKERS=0)
+class StreamedResultsTests(ExtractedDocumentMixin, TestCase):
+    corpus_names = ['table_heavy', 'image_heavy']
+
+    def test_encoded_results_match_build_results(self):
+        for name in self.corpus_names:
+            document = self.upload(self.corpus[name])
+            with self.subTest(name):
+                encoded = ''.join(iter_results_json(document))
+                self.assertEqual(json.loads(encoded), document.build_results())
+
+    def test_large_document_response_is_streamed(self):
+        document = self.upload(self.corpus['image_heavy'])
+        with override_settings(PDF_LARGE_DOCUMENT_PAGES=1000):
+            expected = self.client.get(f'/results/{document.id}/').json()
+        with override_settings(PDF_LARGE_DOCUMENT_PAGES=3):
+            response = self.client.get(f'/results/{document.id}/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+        self.assertTrue(expected['results']['images'])
+
+
+class PDFSourceTests(CorpusMixin, TestCase):
+    corpus_names = ['text_heavy']
+
+    def assert_backends_agree(self, source):
+        with source.open_fitz() as doc:
+            self.assertEqual(doc.page_count, 5)
+            first_line = doc[0].get_text().split('\n')[0]
+        pdf = source.open_pdfium()
+        self.assertEqual(len(pdf), 5)
+        pdf.close()
+        plumber, stream = source.open_plumber()
+        with plumber:
+            self.assertEqual(len(plumber.pages), 5)
+            self.assertIn(first_line, plumber.pages[0].extract_text())
+        stream.close()
+
+    def test_file_is_mapped_once_and_shared(self):
+        path = self.corpus['text_heavy']
+        with PDFSource.from_path(path) as source:
+            self.assertIsInstance(source.data, mmap.mmap)
+            self.assertEqual(source.size, os.path.getsize(path))
+            self.assert_backends_agree(source)
+            # Transmis à un autre processus : projeté à nouveau depuis le chemin
+            copy = pickle.loads(pickle.dumps(source))
+            self.assertIsInstance(copy.data, mmap.mmap)
+            self.assertEqual(copy.path, path)
+            copy.close()
+
+    def test_storage_without_local_file_is_read_once(self):
+        storage = InMemoryStorage()
+        with open(self.corpus['text_heavy'], 'rb') as pdf_file:
+            name = storage.save('document.pdf', ContentFile(pdf_file.read()))
+        field_file = PDFDocument().file
+        field_file.storage, field_file.name = storage, name
+        with PDFSource.from_file(field_file) as source:
+            self.assertIsInstance(source.data, bytes)
+            self.assertIsNone(source.path)
+            self.assert_backends_agree(source)
+            copy = pickle.loads(pickle.dumps(source))
+            self.assertEqual(copy.data, source.data)
+
+    def test_missing_file_has_no_size(self):
+        results = extract_pdf_content(os.path.join(self.workdir, 'absent.pdf'), 'images')
+        self.assertIsNone(results['metadata']['file_size'])
+        self.assertTrue(results['extraction_errors'])
+
+
+# Sortie TSV de tesseract : deux mots sur une ligne, un mot sous le seuil de confiance
+FAKE_TSV = "\n".join("\t".join(row) for row in [
+    ["level", "page_num", "block_num", "par_num", "line_num", "word_num", "left", "top", "width", "height",
+     "conf", "text"],
+    ["1", "1", "0", "0", "0", "0", "0", "0", "2480", "3508", "-1", ""],
+    ["5", "1", "1", "1", "1", "1", "300", "300", "400", "60", "91.5", "Rapport"],
+    ["5", "1", "1", "1", "1", "2", "740", "300", "300", "60", "88.5", "annuel"],
+    ["5", "1", "1", "1", "2", "1", "300", "400", "200", "60", "12.0", "bruit"],
+]) + "\n"
+
+# Commande tesseract factice : lit l'image sur l'entrée standard et renvoie FAKE_TSV
+FAKE_TESSERACT = "#!{python}\nimport sys\nsys.stdin.buffer.read()\nsys.stdout.write({tsv!r})\n"
+
+
+class OCRTests(CorpusMixin, TestCase):
+    corpus_names = ['text_heavy', 'scanned']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.command = os.path.join(cls.workdir, 'tesseract')
+        with open(cls.command, 'w') as script:
+            script.write(FAKE_TESSERACT.format(python=sys.executable, tsv=FAKE_TSV))
+        os.chmod(cls.command, 0o755)
+
+    def engine(self, cache_folder='ocr'):
+        return TesseractOCR(command=self.command, dpi=72, cache_folder=os.path.join(self.workdir, cache_folder))
+
+    def test_only_scanned_pages_are_recognized(self):
+        with PDFBackends(self.corpus['text_heavy']) as backends:
+            page_data, _ = extract_page_content(backends, 0, 'images')
+        self.assertGreater(text_coverage(page_data), 0.01)
+        self.assertFalse(self.engine().needs_ocr(page_data))
+        self.assertTrue(is_blank(Image.new('L', (100, 100), 255)))
+
+        with PDFBackends(self.corpus['scanned']) as backends:
+            page_data, page_result = extract_page_content(backends, 0, 'images', ocr=self.engine())
+        self.assertEqual(page_data['ocr']['words'], 2)
+        self.assertIn("Rapport annuel", page_data['text'])
+        self.assertEqual([span['font'] for span in page_data['positioned_text']], ['OCR', 'OCR'])
+        self.assertIn('ocr', page_result['metrics']['stages'])
+
+    def test_parse_tsv_keeps_confident_words(self):
+        words = parse_tsv(FAKE_TSV, min_confidence=30)
+        self.assertEqual([word['text'] for word in words], ['Rapport', 'annuel'])
+        self.assertEqual(words[0]['line'], [1, 1, 1])
+        self.assertEqual(words[1]['conf'], 88.5)
+
+    def test_benchmark_with_ocr(self):
+        # Cache OCR propre à l'exécution : le cache partagé n'est pas utilisé
+        result = benchmark_document(self.corpus['scanned'], os.path.join(self.workdir, 'out'),
+                                    ocr=self.engine('shared_ocr'))
+        self.assertEqual(result['counts']['ocr_pages'], 2)
+        self.assertEqual(result['errors'], 0)
+        self.assertGreater(result['stage_seconds']['ocr'], 0)
+        self.assertFalse(os.path.exists(os.path.join(self.workdir, 'shared_ocr')))
+
+        results = run_benchmark({'scanned': self.corpus['scanned']}, os.path.join(self.workdir, 'bench'),
+                                ocr=self.engine())
+        self.assertEqual(results['ocr'], 'eng')
+        self.assertEqual(results['documents']['scanned']['counts']['ocr_pages'], 2)
+        self.assertIn('OCR eng', format_report(results))
@@ -0,0 +1,204 @@
+"""
+Réception des PDF uploadés.
+
+Le fichier est écrit sur disque par blocs pendant qu'il est reçu : son empreinte
+SHA-256 est calculée au fil de l'eau, l'en-tête %PDF est vérifié dès les premiers
+octets et la fin de fichier (startxref / %%EOF) à la fin du transfert. Un fichier
+trop volumineux ou invalide est rejeté avant qu'aucun moteur PDF ne l'ouvre, et la
+mémoire utilisée ne dépend pas de la taille du fichier.
+
+Les gros fichiers peuvent être envoyés par morceaux dans une UploadSession : chaque
+morceau est écrit à son offset, et un transfert interrompu reprend au dernier octet reçu.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.utils import timezone
+
+from .models import UploadSession
+
+# L'en-tête %PDF- peut être précédé d'octets parasites (1024 au plus selon la norme)
+HEADER_WINDOW = 1024
+TRAILER_WINDOW = 2048
+READ_BLOCK_SIZE = 1024 * 1024
+
+UPLOADS_FOLDER = os.path.join('media', 'uploads')
+
+
+class PDFValidationError(Exception):
+    """Fichier uploadé rejeté : trop volumineux, tronqué ou qui n'est pas un PDF"""
+
+
+def get_max_upload_bytes():
+    return getattr(settings, 'PDF_UPLOAD_MAX_BYTES', None)
+
+
+def get_max_chunked_upload_bytes():
+    return getattr(settings, 'PDF_CHUNKED_UPLOAD_MAX_BYTES', None)
+
+
+class PDFStreamValidator:
+    """
+    Valide un PDF reçu par blocs : taille maximale, en-tête et fin de fichier.
+    Calcule en même temps son empreinte SHA-256.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.head = b""
+        self.header_checked = False
+        self.tail = b""
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise PDFValidationError(
+                f"Fichier trop volumineux (maximum {self.max_bytes // (1024 * 1024)} Mo)"
+            )
+        self.sha256.update(chunk)
+        if not self.header_checked:
+            self.head += chunk[:HEADER_WINDOW]
+            if len(self.head) >= HEADER_WINDOW:
+                self._check_header()
+        self.tail = (self.tail + chunk[-TRAILER_WINDOW:])[-TRAILER_WINDOW:]
+
+    def _check_header(self):
+        self.header_checked = True
+        if b"%PDF-" not in self.head[:HEADER_WINDOW]:
+            raise PDFValidationError("Le fichier n'est pas un PDF (en-tête %PDF absent)")
+
+    def finish(self):
+        """Dernières vérifications ; retourne l'empreinte SHA-256 du fichier"""
+        if not self.header_checked:
+            self._check_header()
+        eof = self.tail.rfind(b"%%EOF")
+        if eof == -1 or b"startxref" not in self.tail[:eof]:
+            raise PDFValidationError("PDF tronqué ou corrompu (fin de fichier startxref / %%EOF absente)")
+        return self.sha256.hexdigest()
+
+    @property
+    def content_hash(self):
+        return self.sha256.hexdigest()
+
+
+def validate_pdf_file(path, max_bytes=None):
+    """Valide un PDF déjà écrit sur disque, lu par blocs ; retourne son empreinte"""
+    validator = PDFStreamValidator(max_bytes)
+    with open(path, 'rb') as pdf_file:
+        for chunk in iter(lambda: pdf_file.read(READ_BLOCK_SIZE), b""):
+            validator.feed(chunk)
+    return validator.finish()
+
+
+class PDFUploadHandler(TemporaryFileUploadHandler):
+    """
+    Gestionnaire d'upload Django : écrit le champ pdf_file sur disque par blocs en
+    le validant. En cas de rejet, le transfert est interrompu et la raison est
+    exposée dans request.pdf_upload_error.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.validator = None
+
+    def _reject(self, message):
+        self.request.pdf_upload_error = message
+        self.upload_interrupted()
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        max_bytes = get_max_upload_bytes()
+        if max_bytes is not None and content_length and content_length > max_bytes + HEADER_WINDOW:
+            # Refus immédiat sur la taille annoncée, sans lire le corps de la requête
+            self.request.pdf_upload_error = (
+                f"Fichier trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo)"
+            )
+
+    def new_file(self, field_name, *args, **kwargs):
+        if getattr(self.request, 'pdf_upload_error', None):
+            raise StopUpload(connection_reset=True)
+        super().new_file(field_name, *args, **kwargs)
+        self.validator = PDFStreamValidator(get_max_upload_bytes())
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            self.validator.feed(raw_data)
+        except PDFValidationError as e:
+            self._reject(str(e))
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        try:
+            content_hash = self.validator.finish()
+        except PDFValidationError as e:
+            self._reject(str(e))
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.content_hash = content_hash
+        return uploaded_file
+
+
+def get_part_path(session):
+    return os.path.join(UPLOADS_FOLDER, f"{session.id}.part")
+
+
+def write_chunk(session, stream, start, length):
+    """
+    Écrit un morceau à l'offset start, lu par blocs depuis stream.
+    Le premier morceau est contrôlé immédiatement (en-tête %PDF).
+    Retourne le nombre d'octets écrits.
+    """
+    os.makedirs(UPLOADS_FOLDER, exist_ok=True)
+    path = get_part_path(session)
+    written = 0
+    head = b""
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+        part.seek(start)
+        part.truncate()
+        while written < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            if start == 0 and len(head) < HEADER_WINDOW:
+                head += block[:HEADER_WINDOW]
+            part.write(block)
+            written += len(block)
+    if start == 0 and (len(head) >= HEADER_WINDOW or written == session.size) and b"%PDF-" not in head:
+        raise PDFValidationError("Le fichier n'est pas un PDF (en-tête %PDF absent)")
+    return written
+
+
+class SessionFile(File):
+    """
+    Fichier assemblé d'une UploadSession : le stockage Django le déplace vers
+    media/pdfs au lieu de le recopier (même mécanisme que les uploads temporaires)
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def open_session_file(session):
+    return SessionFile(open(get_part_path(session), 'rb'), name=session.original_filename)
+
+
+def delete_session(session):
+    try:
+        os.remove(get_part_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def purge_stale_uploads(max_age_hours):
+    """Supprime les uploads par morceaux inachevés et inactifs depuis max_age_hours"""
+    cutoff = timezone.now() - timedelta(hours=max_age_hours)
+    stale = list(UploadSession.objects.filter(updated_at__lt=cutoff))
+    for session in stale:
+        delete_session(session)
+    return len(stale)
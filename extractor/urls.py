@@ -4,5 +4,13 @@ from . import views
 urlpatterns = [
     path('', views.upload_pdf, name='upload_pdf'),
     path('process/', views.process_pdf, name='process_pdf'),
+    path('uploads/', views.create_upload_session, name='create_upload_session'),
+    path('uploads/<uuid:upload_id>/', views.upload_session, name='upload_session'),
+    path('uploads/<uuid:upload_id>/complete/', views.complete_upload_session, name='complete_upload_session'),
     path('results/<int:document_id>/', views.get_document_results, name='get_document_results'),
+    path('results/<int:document_id>/stream/', views.stream_document_results, name='stream_document_results'),
+    path('tables/<int:document_id>/<str:table_id>/export/', views.export_document_table, name='export_document_table'),
+    path('images/<str:content_hash>/thumbnail/', views.image_thumbnail_view, name='image_thumbnail'),
+    path('pages/<int:document_id>/<int:page_number>/preview/', views.page_preview_view, name='page_preview'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -1,16 +1,32 @@
 import pdfplumber
 import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 import fitz  # PyMuPDF
 from PIL import Image
 import io
+import logging
 import os
-import pandas as pd
+import numpy as np
 import json
 from datetime import datetime
 import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+from .imagestore import store_image
+from .metrics import ExtractionMetrics, PageMetrics, enable_page_peaks
+from .sources import PDFSource
+from .spatial import BBoxIndex, bbox_containment, bbox_iou
 
-def clean_and_validate_table(table, page, table_settings, page_num, table_idx, method):
+logger = logging.getLogger(__name__)
+
+# À incrémenter à chaque changement du format ou du contenu des résultats
+# d'extraction : les résultats mis en cache par une version antérieure sont ignorés.
+EXTRACTOR_VERSION = "10"
+
+
+def clean_and_validate_table(table, page, table_settings, page_num, table_idx, method, bbox=None):
     """
     Nettoie, normalise et valide un tableau extrait par pdfplumber ou autre.
     Retourne None si le tableau n'est pas pertinent.
@@ -65,34 +81,829 @@ def clean_and_validate_table(table, page, table_settings, page_num, table_idx, m
         if first_row_chars > avg_chars_other_rows * 0.7:
             has_headers = True
 
-    # Conversion en CSV
-    try:
-        if has_headers and len(normalized_table) > 1:
-            df = pd.DataFrame(normalized_table[1:], columns=normalized_table[0])
-            csv_data = df.to_csv(index=False)
-        else:
-            df = pd.DataFrame(normalized_table)
-            csv_data = df.to_csv(index=False, header=False)
-    except Exception as e:
-        csv_data = None
-
     return {
         "table_id": f"page_{page_num}_table_{table_idx + 1}",
         "page": page_num,
         "data": normalized_table,
         "rows": len(normalized_table),
         "columns": max_cols,
+        "bbox": list(bbox) if bbox else None,
         "has_borders": has_borders,
         "has_headers": has_headers,
-        "extraction_method": f"pdfplumber_{method}",
-        "csv_data": csv_data
+        "extraction_method": f"pdfplumber_{method}"
+    }
+
+
+# Stratégies pdfplumber : lignes, texte, hybride
+TABLE_STRATEGIES = [
+    ("lines", {"vertical_strategy": "lines", "horizontal_strategy": "lines", "snap_tolerance": 5,
+               "join_tolerance": 5}),
+    ("text", {"vertical_strategy": "text", "horizontal_strategy": "text", "snap_tolerance": 10,
+              "join_tolerance": 10}),
+    ("hybrid", {"vertical_strategy": "lines", "horizontal_strategy": "text", "snap_tolerance": 8,
+                "join_tolerance": 8}),
+]
+
+
+class PDFBackends:
+    """
+    Handles partagés des moteurs PDF pour un même document.
+    Les trois moteurs lisent le même PDFSource (chemin projeté en mémoire, ou
+    source fournie par l'appelant et laissée ouverte).
+    PyMuPDF est ouvert immédiatement ; pypdfium2 et pdfplumber ne sont ouverts
+    qu'à la première page qui en a réellement besoin.
+    """
+
+    def __init__(self, pdf):
+        self._own_source = not isinstance(pdf, PDFSource)
+        self.source = PDFSource.open(pdf)
+        try:
+            self.fitz_doc = self.source.open_fitz()
+        except BaseException:
+            if self._own_source:
+                self.source.close()
+            raise
+        self._pdfium_doc = None
+        self._plumber_pdf = None
+        self._plumber_stream = None
+        # Images déjà stockées, par xref : une image répétée sur plusieurs pages
+        # (logo, fond de page) n'est extraite qu'une fois
+        self.stored_images = {}
+
+    @property
+    def page_count(self):
+        return len(self.fitz_doc)
+
+    @property
+    def pdfium_doc(self):
+        if self._pdfium_doc is None:
+            self._pdfium_doc = self.source.open_pdfium()
+        return self._pdfium_doc
+
+    @property
+    def plumber_pdf(self):
+        if self._plumber_pdf is None:
+            self._plumber_pdf, self._plumber_stream = self.source.open_plumber()
+        return self._plumber_pdf
+
+    def close(self):
+        if self._plumber_pdf is not None:
+            self._plumber_pdf.close()
+            self._plumber_stream.close()
+            self._plumber_pdf = None
+            self._plumber_stream = None
+        if self._pdfium_doc is not None:
+            self._pdfium_doc.close()
+            self._pdfium_doc = None
+        self.fitz_doc.close()
+        if self._own_source:
+            self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _record_error(result, error_data):
+    """Ajoute une erreur d'extraction au résultat"""
+    if "extraction_errors" not in result:
+        result["extraction_errors"] = []
+    result["extraction_errors"].append(error_data)
+
+
+def _parse_text_dict(text_dict):
+    """
+    Parcourt une seule fois le dictionnaire PyMuPDF d'une page et produit
+    le texte, les spans positionnés et les blocs utilisés pour la détection de tableaux
+    """
+    page_text = ""
+    positioned_chars = []
+    text_blocks = []
+    image_blocks = 0
+
+    for block in text_dict["blocks"]:
+        if "lines" in block:
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    text = span["text"]
+                    if text.strip():
+                        page_text += text
+                        positioned_chars.append({
+                            "text": text,
+                            "bbox": span["bbox"],
+                            "font": span["font"],
+                            "size": span["size"],
+                            "flags": span["flags"],
+                            "color": span["color"]
+                        })
+                        text_blocks.append({
+                            "text": text.strip(),
+                            "x0": span["bbox"][0],
+                            "y0": span["bbox"][1],
+                            "x1": span["bbox"][2],
+                            "y1": span["bbox"][3],
+                            "font_size": span["size"]
+                        })
+                page_text += "\n"
+        elif block.get("type") == 1:
+            image_blocks += 1
+
+    return page_text, positioned_chars, text_blocks, image_blocks
+
+
+def image_fingerprint(image, size=None):
+    """
+    Empreinte perceptuelle d'une image : dimensions + dHash 64 bits calculé en niveaux
+    de gris. Indépendante du mode (RGB, RGBA, CMYK, L...) : une même image extraite
+    par PyMuPDF et rendue en bitmap par pypdfium2 donne la même empreinte.
+    size (largeur, hauteur) remplace les dimensions d'une image décodée à échelle réduite.
+    """
+    width, height = size or image.size
+    thumbnail = image.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(thumbnail.getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            dhash = (dhash << 1) | (1 if left > right else 0)
+    return width, height, dhash
+
+
+def _encoded_image_fingerprint(image_bytes, width, height):
+    """
+    Empreinte d'une image encodée, décodée depuis les octets en mémoire (les JPEG à
+    échelle réduite, le dHash n'utilisant que 9 x 8 pixels). None si Pillow ne sait
+    pas la décoder (JPEG 2000 sans OpenJPEG...).
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image.draft("L", (max(width // 8, 9), max(height // 8, 8)))
+            return image_fingerprint(image, (width, height))
+    except Exception:
+        return None
+
+
+class ImageHashIndex:
+    """
+    Index en mémoire des empreintes d'images d'une page.
+    Deux images sont considérées identiques si elles ont les mêmes dimensions et
+    des dHash distants d'au plus max_distance bits (les décodeurs JPEG ou les
+    conversions de couleurs des différents moteurs diffèrent de quelques bits).
+    Le dHash est découpé en max_distance + 1 bandes indexées séparément : deux
+    empreintes assez proches partagent forcément une bande, la recherche reste en O(1).
+    """
+
+    def __init__(self, max_distance=4):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        self._band_bounds = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+        self._buckets = {}
+
+    def _keys(self, fingerprint):
+        width, height, dhash = fingerprint
+        for band, (start, end) in enumerate(self._band_bounds):
+            yield width, height, band, (dhash >> start) & ((1 << (end - start)) - 1)
+
+    def find(self, fingerprint):
+        """Retourne l'image_id d'une image déjà indexée équivalente, ou None"""
+        dhash = fingerprint[2]
+        for key in self._keys(fingerprint):
+            for candidate_hash, image_id in self._buckets.get(key, ()):
+                if bin(candidate_hash ^ dhash).count("1") <= self.max_distance:
+                    return image_id
+        return None
+
+    def add(self, fingerprint, image_id):
+        for key in self._keys(fingerprint):
+            self._buckets.setdefault(key, []).append((fingerprint[2], image_id))
+
+
+# Formats écrits tels qu'extraits du PDF, sans décodage ni ré-encodage
+RAW_IMAGE_FORMATS = {"jpeg", "jpx", "png"}
+COMPONENT_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+PNG_COLOR_MODES = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}
+# Marqueurs JPEG SOF0 à SOF15 (hors DHT, JPG et DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _stream_mode(image_ext, image_bytes):
+    """
+    Mode Pillow lu dans l'en-tête du flux (IHDR PNG, segment SOF JPEG), sans décodage.
+    Retourne None si l'en-tête n'est pas reconnu.
+    """
+    if image_ext == "png" and image_bytes[12:16] == b"IHDR":
+        bit_depth, color_type = image_bytes[24], image_bytes[25]
+        if color_type == 0 and bit_depth == 1:
+            return "1"
+        return PNG_COLOR_MODES.get(color_type)
+    if image_ext == "jpeg":
+        pos = 2
+        while pos + 9 < len(image_bytes) and image_bytes[pos] == 0xFF:
+            marker = image_bytes[pos + 1]
+            if marker in JPEG_SOF_MARKERS:
+                return COMPONENT_MODES.get(image_bytes[pos + 9])
+            if marker == 0xDA:
+                break
+            pos += 2 + int.from_bytes(image_bytes[pos + 2:pos + 4], "big")
+    return None
+
+
+def _image_mode(base_image):
+    """
+    Mode Pillow d'une image extraite par PyMuPDF : en-tête du flux, à défaut
+    nombre de composantes de l'espace de couleurs déclaré dans son xref.
+    """
+    return (_stream_mode(base_image["ext"], base_image["image"])
+            or COMPONENT_MODES.get(base_image.get("colorspace"), ""))
+
+
+def _store_fitz_image(backends, xref, output_img_folder):
+    """
+    Extrait l'image d'un xref et l'enregistre dans output_img_folder, stocké par contenu.
+    Les flux JPEG, JPEG 2000 et PNG sont écrits tels quels ; seuls les autres formats
+    (JBIG2, TIFF...) sont décodés et convertis en PNG. L'empreinte de l'image
+    (image_fingerprint) est calculée sur les octets encore en mémoire.
+    """
+    base_image = backends.fitz_doc.extract_image(xref)
+    image_bytes = base_image["image"]
+    image_ext = base_image["ext"]
+    width, height = base_image["width"], base_image["height"]
+    mode = _image_mode(base_image)
+    if image_ext not in RAW_IMAGE_FORMATS:
+        pixmap = fitz.Pixmap(backends.fitz_doc, xref)
+        if pixmap.colorspace is not None and pixmap.colorspace.n > 3:
+            pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+        image_bytes = pixmap.tobytes("png")
+        image_ext = "png"
+        width, height = pixmap.width, pixmap.height
+        mode = COMPONENT_MODES.get(pixmap.n - pixmap.alpha, "") + ("A" if pixmap.alpha else "")
+    content_hash, image_filename, image_path = store_image(output_img_folder, image_bytes, image_ext)
+    return {
+        "fingerprint": _encoded_image_fingerprint(image_bytes, width, height),
+        "filename": image_filename,
+        "path": image_path,
+        "format": image_ext,
+        "width": width,
+        "height": height,
+        "size_bytes": len(image_bytes),
+        "mode": mode,
+        "content_hash": content_hash
     }
 
 
-def extract_pdf_content(pdf_path, output_img_folder):
+def _extract_fitz_images(backends, page, page_num, output_img_folder, page_data, page_result):
+    """
+    Extraction des images d'une page avec PyMuPDF.
+    Une image déjà rencontrée sur une autre page du document (même xref) n'est ni
+    extraite ni écrite à nouveau : la page référence le fichier déjà stocké.
+    Les empreintes des images de la page sont indexées dans page_result["image_hashes"]
+    (ImageHashIndex), consulté par la passe pypdfium2.
+    """
+    image_hashes = page_result.setdefault("image_hashes", ImageHashIndex())
+    image_list = page.get_images(full=True)
+    for img_index, img in enumerate(image_list):
+        try:
+            xref = img[0]
+            stored = backends.stored_images.get(xref)
+            if stored is None:
+                stored = _store_fitz_image(backends, xref, output_img_folder)
+                backends.stored_images[xref] = stored
+            page_data["images"].append({
+                "image_id": f"page_{page_num + 1}_image_{img_index + 1}",
+                "filename": stored["filename"],
+                "path": stored["path"],
+                "page": page_num + 1,
+                "format": stored["format"],
+                "width": stored["width"],
+                "height": stored["height"],
+                "size_bytes": stored["size_bytes"],
+                "mode": stored["mode"],
+                "content_hash": stored["content_hash"],
+                "extraction_method": "PyMuPDF"
+            })
+            if stored["fingerprint"] is not None:
+                image_hashes.add(stored["fingerprint"], page_data["images"][-1]["image_id"])
+        except Exception as e:
+            _record_error(page_result, {
+                "error": f"Erreur extraction image PyMuPDF page {page_num + 1}, index {img_index}: {str(e)}",
+                "page": page_num + 1,
+                "image_index": img_index,
+                "method": "PyMuPDF"
+            })
+
+
+def _extract_pdfium_images(backends, page_num, output_img_folder, page_data, page_result):
+    """
+    Extraction complémentaire avec pypdfium2 pour les images manquées par PyMuPDF.
+    Les doublons sont écartés en O(1) grâce à l'index d'empreintes de la page rempli
+    par la passe PyMuPDF (page_result["image_hashes"]), y compris lorsque les deux
+    moteurs ne restituent pas l'image dans le même mode.
+    """
+    image_index = page_result.setdefault("image_hashes", ImageHashIndex())
+    try:
+        page = backends.pdfium_doc[page_num]
+        try:
+            objects = list(page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,)))
+            for img_idx, obj in enumerate(objects):
+                try:
+                    bitmap = obj.get_bitmap()
+                    if bitmap:
+                        image = bitmap.to_pil()
+                        fingerprint = image_fingerprint(image)
+                        if image_index.find(fingerprint) is None:
+                            buffer = io.BytesIO()
+                            image.save(buffer, "PNG")
+                            image_bytes = buffer.getvalue()
+                            content_hash, image_filename, image_path = store_image(output_img_folder, image_bytes, "png")
+                            image_data = {
+                                "image_id": f"page_{page_num + 1}_pdfium_image_{img_idx + 1}",
+                                "filename": image_filename,
+                                "path": image_path,
+                                "page": page_num + 1,
+                                "format": "png",
+                                "width": image.width,
+                                "height": image.height,
+                                "size_bytes": len(image_bytes),
+                                "mode": image.mode,
+                                "content_hash": content_hash,
+                                "extraction_method": "pypdfium2"
+                            }
+                            page_data["images"].append(image_data)
+                            image_index.add(fingerprint, image_data["image_id"])
+                except Exception as e:
+                    _record_error(page_result, {
+                        "error": f"Erreur extraction image pypdfium2 page {page_num + 1}, index {img_idx}: {str(e)}",
+                        "page": page_num + 1,
+                        "image_index": img_idx,
+                        "method": "pypdfium2"
+                    })
+        finally:
+            page.close()
+    except Exception as e:
+        _record_error(page_result, {
+            "error": f"Erreur extraction images pypdfium2 page {page_num + 1}: {str(e)}",
+            "page": page_num + 1,
+            "method": "pypdfium2"
+        })
+
+
+# Pré-classification des pages pour la détection de tableaux
+RULING_MIN_LENGTH = 10
+ALIGNED_MIN_ROWS = 3
+# Distance maximale (en hauteurs de police) entre un trait et le texte qu'il encadre
+RULING_TEXT_DISTANCE = 3
+RULED_MIN_CELLS = 2
+# En deçà de ce nombre de lignes de texte, les statistiques d'alignement ne sont pas
+# fiables et pdfplumber est peu coûteux : la stratégie "text" est toujours exécutée
+SPARSE_PAGE_MAX_ROWS = 24
+TABLE_MERGE_IOU = 0.5
+# Un tableau contenu à ce point dans un tableau déjà retenu en est un fragment
+TABLE_CONTAINMENT = 0.8
+
+
+def _find_rulings(fitz_page):
+    """
+    Traits horizontaux (x0, x1, y) et nombre de traits verticaux de la page (lignes
+    et bords de rectangles), à partir des tracés PyMuPDF, sans passer par l'analyse
+    pdfminer
+    """
+    horizontal = []
+    vertical = 0
+    for drawing in fitz_page.get_cdrawings():
+        for item in drawing["items"]:
+            if item[0] == "l":
+                (x0, y0), (x1, y1) = item[1], item[2]
+                width, height = abs(x1 - x0), abs(y1 - y0)
+                if height <= 1 and width >= RULING_MIN_LENGTH:
+                    horizontal.append((min(x0, x1), max(x0, x1), (y0 + y1) / 2))
+                elif width <= 1 and height >= RULING_MIN_LENGTH:
+                    vertical += 1
+            elif item[0] == "re":
+                x0, y0, x1, y1 = item[1]
+                x0, x1 = min(x0, x1), max(x0, x1)
+                y0, y1 = min(y0, y1), max(y0, y1)
+                width, height = x1 - x0, y1 - y0
+                if height <= 2 and width >= RULING_MIN_LENGTH:
+                    horizontal.append((x0, x1, (y0 + y1) / 2))
+                elif width <= 2 and height >= RULING_MIN_LENGTH:
+                    vertical += 1
+                elif width >= RULING_MIN_LENGTH and height >= RULING_MIN_LENGTH:
+                    horizontal.append((x0, x1, y0))
+                    horizontal.append((x0, x1, y1))
+                    vertical += 2
+    return horizontal, vertical
+
+
+def _has_ruled_text(horizontal, text_blocks):
+    """
+    Vrai si au moins RULED_MIN_CELLS blocs de texte sont chacun encadrés par deux
+    traits horizontaux qui couvrent toute leur largeur, l'un au-dessus et l'autre en
+    dessous, à moins de RULING_TEXT_DISTANCE hauteurs de police : ce sont les cellules
+    d'un tableau réglé, même sans traits verticaux. Un seul bloc encadré est une
+    étiquette (cartouche, mention dans un cadre) plutôt qu'un tableau.
+    """
+    if len(horizontal) < 2:
+        return False
+    ruled = 0
+    for block in text_blocks:
+        margin = block["font_size"] * RULING_TEXT_DISTANCE
+        middle = (block["y0"] + block["y1"]) / 2
+        above = below = False
+        for x0, x1, y in horizontal:
+            if x0 > block["x0"] + 1 or x1 < block["x1"] - 1:
+                continue
+            if block["y0"] - margin <= y <= middle:
+                above = True
+            elif middle < y <= block["y1"] + margin:
+                below = True
+        if above and below:
+            ruled += 1
+            if ruled >= RULED_MIN_CELLS:
+                return True
+    return False
+
+
+def _count_text_rows(text_blocks):
+    """Nombre de lignes de texte de la page (blocs regroupés par ordonnée)"""
+    rows = 0
+    last_y = None
+    for y0 in sorted(block["y0"] for block in text_blocks):
+        if last_y is None or y0 - last_y > 3:
+            rows += 1
+            last_y = y0
+    return rows
+
+
+def _has_aligned_text(text_blocks):
+    """
+    Statistiques d'alignement des spans : vrai si au moins ALIGNED_MIN_ROWS lignes
+    comportent des cellules séparées par un blanc qui commencent sur au moins deux
+    colonnes alignées distinctes (hors première cellule, alignée sur la marge).
+    Une seule colonne alignée ne suffit pas : c'est aussi la colonne de droite d'une
+    page de texte sur deux colonnes.
+    """
+    rows = []
+    for block in sorted(text_blocks, key=lambda b: (b["y0"], b["x0"])):
+        if rows and abs(block["y0"] - rows[-1][0]["y0"]) <= 3:
+            rows[-1].append(block)
+        else:
+            rows.append([block])
+
+    column_hits = {}
+    row_starts = []
+    for row in rows:
+        row.sort(key=lambda b: b["x0"])
+        cell_starts = set()
+        previous = row[0]
+        for block in row[1:]:
+            if block["x0"] - previous["x1"] >= max(previous["font_size"], 4) * 1.5:
+                cell_starts.add(round(block["x0"] / 5))
+            previous = block
+        row_starts.append(cell_starts)
+        for start in cell_starts:
+            column_hits[start] = column_hits.get(start, 0) + 1
+    columns = {start for start, hits in column_hits.items() if hits >= ALIGNED_MIN_ROWS}
+    tabular_rows = sum(1 for cell_starts in row_starts if len(cell_starts & columns) >= 2)
+    return tabular_rows >= ALIGNED_MIN_ROWS
+
+
+def classify_table_page(fitz_page, text_blocks):
+    """
+    Choisit les stratégies pdfplumber à exécuter sur une page (liste vide : aucune).
+    - grille de traits horizontaux et verticaux : "lines"
+    - texte encadré par des traits horizontaux : "lines" et "hybrid"
+    - traits verticaux et texte aligné : "hybrid"
+    - texte aligné sans grille, ou page de moins de SPARSE_PAGE_MAX_ROWS lignes : "text"
+    """
+    if not text_blocks:
+        return []
+    horizontal, vertical = _find_rulings(fitz_page)
+    grid = len(horizontal) >= 3 and vertical >= 2
+    ruled = _has_ruled_text(horizontal, text_blocks)
+    aligned = _has_aligned_text(text_blocks)
+    sparse = _count_text_rows(text_blocks) <= SPARSE_PAGE_MAX_ROWS
+    strategies = []
+    if grid or ruled:
+        strategies.append("lines")
+    if ruled or (vertical >= 2 and aligned):
+        strategies.append("hybrid")
+    if (aligned and not grid) or sparse:
+        strategies.append("text")
+    return strategies
+
+
+def _add_table(page_data, table_index, table_data, iou_threshold):
+    """
+    Ajoute un tableau à la page sauf s'il recouvre (IoU >= iou_threshold) un
+    tableau déjà retenu, ou s'il en est un fragment (TABLE_CONTAINMENT) ; les
+    candidats sont retrouvés via l'index spatial de la page
+    """
+    bbox = table_data.get("bbox")
+    if bbox:
+        for other, _ in table_index.overlapping(bbox):
+            if bbox_iou(bbox, other) >= iou_threshold or bbox_containment(bbox, other) >= TABLE_CONTAINMENT:
+                return False
+        table_index.insert(bbox, table_data["table_id"])
+    page_data["tables"].append(table_data)
+    return True
+
+
+def _extract_plumber_tables(backends, page_num, strategies, page_data, page_result, table_index,
+                            iou_threshold=TABLE_MERGE_IOU):
+    """
+    Extraction des tableaux d'une page avec pdfplumber, limitée aux stratégies
+    retenues par classify_table_page. Les tableaux de stratégies différentes qui se
+    recouvrent sont fusionnés : seul le premier, dans l'ordre de TABLE_STRATEGIES,
+    est conservé.
+    """
+    try:
+        page = backends.plumber_pdf.pages[page_num]
+        try:
+            tables_found = []
+            for method, settings in TABLE_STRATEGIES:
+                if method not in strategies:
+                    continue
+                try:
+                    for table in page.find_tables(settings):
+                        tables_found.append((method, table, settings))
+                except Exception:
+                    continue
+            for table_idx, (method, table, settings) in enumerate(tables_found):
+                iou, _ = table_index.best_match(table.bbox)
+                if iou >= iou_threshold:
+                    continue
+                table_data = clean_and_validate_table(table.extract(), page, settings, page_num + 1, table_idx,
+                                                      method, bbox=table.bbox)
+                if table_data:
+                    _add_table(page_data, table_index, table_data, iou_threshold)
+        finally:
+            # Libère les objets pdfminer mis en cache pour cette page
+            page.close()
+    except Exception as e:
+        _record_error(page_result, {
+            "error": f"Erreur extraction tableaux avec pdfplumber page {page_num + 1}: {str(e)}",
+            "page": page_num + 1,
+            "method": "pdfplumber"
+        })
+
+
+def _extract_text_block_tables(text_blocks, page_num, page_data, page_result, table_index,
+                               iou_threshold=TABLE_MERGE_IOU):
+    """
+    Extraction complémentaire de tableaux par alignement des blocs texte PyMuPDF ;
+    les tableaux déjà trouvés par pdfplumber au même endroit sont ignorés
+    """
+    try:
+        for table_data in detect_tables_from_text_blocks(text_blocks, page_num + 1):
+            _add_table(page_data, table_index, table_data, iou_threshold)
+    except Exception as e:
+        _record_error(page_result, {
+            "error": f"Erreur extraction tableaux avec PyMuPDF page {page_num + 1}: {str(e)}",
+            "page": page_num + 1,
+            "method": "PyMuPDF_position"
+        })
+
+
+def extract_page_content(backends, page_num, output_img_folder, table_iou_threshold=TABLE_MERGE_IOU, ocr=None):
+    """
+    Pipeline complet pour une page : le contenu de la page n'est analysé qu'une fois
+    par PyMuPDF, et les moteurs secondaires ne sont sollicités que si nécessaire.
+    Les tableaux dont l'IoU avec un tableau déjà retenu atteint table_iou_threshold
+    sont considérés comme des doublons.
+    ocr (extractor.ocr.TesseractOCR) complète la page si son texte natif est
+    insuffisant, dans le même processus que le reste de l'extraction de la page.
+    Retourne (page_data, page_result) où page_result contient les éventuelles erreurs
+    et les mesures de la page (page_result["metrics"], voir PageMetrics).
+    """
+    page_metrics = PageMetrics(page_num + 1)
+    page_result = {}
+    page = backends.fitz_doc[page_num]
+    page_data = {
+        "page_number": page_num + 1,
+        "text": "",
+        "positioned_text": [],
+        "tables": [],
+        "images": [],
+        "bbox": [0, 0, page.rect.width, page.rect.height],
+        "rotation": page.rotation
+    }
+
+    # Texte avec positions (PyMuPDF), analysé une seule fois par page
+    text_blocks = []
+    image_blocks = 0
+    with page_metrics.stage("fitz_text"):
+        try:
+            text_dict = page.get_text("dict")
+            page_text, positioned_chars, text_blocks, image_blocks = _parse_text_dict(text_dict)
+            del text_dict
+            page_data["text"] = page_text
+            page_data["positioned_text"] = positioned_chars
+        except Exception as e:
+            _record_error(page_result, {
+                "error": f"Erreur extraction texte PyMuPDF page {page_num + 1}: {str(e)}",
+                "page": page_num + 1,
+                "method": "PyMuPDF"
+            })
+
+    # Images avec PyMuPDF
+    with page_metrics.stage("fitz_images"):
+        _extract_fitz_images(backends, page, page_num, output_img_folder, page_data, page_result)
+
+    # pypdfium2 uniquement si la page affiche plus d'images que PyMuPDF n'en a extrait
+    # (images inline, erreurs d'extraction...) ; l'index d'empreintes sert au dédoublonnage
+    if image_blocks > len(page_data["images"]):
+        with page_metrics.stage("pdfium_images"):
+            _extract_pdfium_images(backends, page_num, output_img_folder, page_data, page_result)
+    page_result.pop("image_hashes", None)
+
+    # Pas de tableau possible sur une page sans texte ; pdfplumber n'est ouvert
+    # que si la pré-classification de la page retient au moins une stratégie
+    if text_blocks:
+        table_index = BBoxIndex()
+        with page_metrics.stage("plumber_tables"):
+            try:
+                strategies = classify_table_page(page, text_blocks)
+            except Exception:
+                strategies = [method for method, _ in TABLE_STRATEGIES]
+            if strategies:
+                _extract_plumber_tables(backends, page_num, strategies, page_data, page_result, table_index,
+                                        table_iou_threshold)
+        with page_metrics.stage("text_block_tables"):
+            _extract_text_block_tables(text_blocks, page_num, page_data, page_result, table_index,
+                                       table_iou_threshold)
+
+    # OCR en dernier : les mots déjà couverts par le texte natif sont ignorés.
+    # Le temps CPU de tesseract (sous-processus) n'est pas compté dans l'étape
+    if ocr is not None and ocr.needs_ocr(page_data):
+        with page_metrics.stage("ocr"):
+            ocr.process_page(backends, page_num, page_data, page_result)
+
+    page_result["metrics"] = page_metrics.finish(page_data)
+    return page_data, page_result
+
+
+def _safe_extract_page(backends, page_num, output_img_folder, table_iou_threshold=TABLE_MERGE_IOU, ocr=None):
+    """
+    Extrait une page sans jamais lever d'exception.
+    Retourne (page_data, erreurs, mesures) ; page_data et mesures valent None si la page a échoué.
+    """
+    try:
+        page_data, page_result = extract_page_content(backends, page_num, output_img_folder, table_iou_threshold,
+                                                      ocr)
+        return page_data, page_result.get("extraction_errors", []), page_result["metrics"]
+    except Exception as e:
+        return None, [{
+            "error": f"Erreur extraction page {page_num + 1}: {str(e)}",
+            "page": page_num + 1
+        }], None
+
+
+# Source du document et moteur OCR dans un worker du pool de processus, transmis
+# une fois à son démarrage (_init_pool_worker) plutôt qu'avec chaque bloc de pages
+_pool_source = None
+_pool_ocr = None
+
+
+def _init_pool_worker(source, ocr=None):
+    global _pool_source, _pool_ocr
+    _pool_source = source
+    _pool_ocr = ocr
+    enable_page_peaks()
+
+
+def _extract_pages(output_img_folder, page_nums, table_iou_threshold=TABLE_MERGE_IOU):
+    """
+    Tâche d'un worker du pool de processus : ouvre ses propres handles
+    PyMuPDF / pdfplumber / pypdfium2 sur la source du worker et extrait les pages page_nums
+    """
+    pages = []
+    with PDFBackends(_pool_source) as backends:
+        for page_num in page_nums:
+            page_data, errors, metrics = _safe_extract_page(backends, page_num, output_img_folder,
+                                                            table_iou_threshold, _pool_ocr)
+            pages.append((page_num, page_data, errors, metrics))
+    return pages
+
+
+def _iter_pages_serial(backends, output_img_folder, page_nums, table_iou_threshold=TABLE_MERGE_IOU, ocr=None):
+    for page_num in page_nums:
+        page_data, errors, metrics = _safe_extract_page(backends, page_num, output_img_folder, table_iou_threshold,
+                                                        ocr)
+        yield page_num, page_data, errors, metrics
+
+
+def _iter_pages_parallel(source, page_nums, output_img_folder, workers, chunk_size,
+                         table_iou_threshold=TABLE_MERGE_IOU, ocr=None):
+    """
+    Répartit les pages par blocs de chunk_size sur un pool de processus et
+    restitue les résultats dans l'ordre des pages. Seuls 2 blocs par worker sont
+    en vol à un instant donné, pour que la mémoire ne dépende pas du nombre de pages.
+    """
+    # "spawn" : l'extraction tourne souvent dans un thread du pool de jobs,
+    # et un fork depuis un processus multi-threadé n'est pas sûr
+    context = multiprocessing.get_context("spawn")
+    chunks = iter([page_nums[start:start + chunk_size] for start in range(0, len(page_nums), chunk_size)])
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_pool_worker,
+                             initargs=(source, ocr)) as executor:
+        pending = deque()
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(executor.submit(_extract_pages, output_img_folder, chunk,
+                                               table_iou_threshold))
+
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            chunk = pending.popleft().result()
+            submit_next()
+            for page in chunk:
+                yield page
+
+
+def iter_pdf_pages(pdf_path, output_img_folder, workers=1, chunk_size=8, backends=None,
+                   table_iou_threshold=TABLE_MERGE_IOU, pages=None, page_timeout=None,
+                   page_memory_limit_mb=None, ocr=None):
+    """
+    Extraction en flux : produit (page_num, page_data, erreurs, mesures) dans l'ordre
+    des pages, dès que chaque page est prête. page_data et mesures valent None si la
+    page a échoué.
+    pages limite l'extraction à certaines pages (numéros à partir de 0).
+    Avec page_timeout (secondes) ou page_memory_limit_mb, chaque page est extraite
+    dans un processus isolé (extractor.isolation, max(workers, 1) processus) et une
+    page qui dépasse son budget est abandonnée sans interrompre le document.
+    pdf_path est un chemin ou un PDFSource ; les processus d'extraction reçoivent
+    la source des handles (backends.source).
+    ocr (extractor.ocr.TesseractOCR) est transmis aux processus d'extraction : l'OCR
+    d'une page est fait par le processus qui l'extrait, sous le même budget.
+    La mémoire occupée ne dépend que des pages en cours de traitement.
+    """
+    own_backends = backends is None
+    if own_backends:
+        backends = PDFBackends(pdf_path)
+    try:
+        os.makedirs(output_img_folder, exist_ok=True)
+        page_nums = sorted(pages) if pages is not None else list(range(backends.page_count))
+        if page_timeout or page_memory_limit_mb:
+            # Import local : extractor.isolation dépend de ce module
+            from .isolation import iter_pages_isolated
+            yield from iter_pages_isolated(backends.source, page_nums, output_img_folder, workers, page_timeout,
+                                           page_memory_limit_mb, table_iou_threshold, ocr)
+        elif workers > 1 and len(page_nums) > chunk_size:
+            yield from _iter_pages_parallel(backends.source, page_nums, output_img_folder, workers, chunk_size,
+                                            table_iou_threshold, ocr)
+        else:
+            yield from _iter_pages_serial(backends, output_img_folder, page_nums, table_iou_threshold, ocr)
+    finally:
+        if own_backends:
+            backends.close()
+
+
+def _file_size(pdf):
+    """
+    Taille du PDF (chemin ou PDFSource), None si le fichier est illisible : l'erreur
+    est alors enregistrée à l'ouverture des moteurs
+    """
+    if isinstance(pdf, PDFSource):
+        return pdf.size
+    try:
+        return os.path.getsize(pdf)
+    except OSError:
+        return None
+
+
+def extract_pdf_content(pdf_path, output_img_folder, progress_callback=None, workers=1, chunk_size=8,
+                        page_callback=None, collect_pages=True, table_iou_threshold=TABLE_MERGE_IOU,
+                        pages=None, page_timeout=None, page_memory_limit_mb=None, ocr=None):
     """
     Extraction complète du contenu PDF avec préservation de la position
-    et détection améliorée des images et tableaux
+    et détection améliorée des images et tableaux.
+    progress_callback(pages_traitées, total_pages) est appelé après chaque page,
+    page_callback(page_data) après chaque page extraite avec succès.
+    Avec collect_pages=False, le contenu des pages n'est transmis qu'à page_callback :
+    le résultat ne contient alors que les métadonnées et les erreurs.
+    pdf_path est un chemin ou un PDFSource (extractor.sources), lu une seule fois
+    par les trois moteurs ; un PDFSource fourni n'est pas fermé.
+    Avec workers > 1, les pages sont réparties par blocs de chunk_size sur un pool
+    de processus, chacun ouvrant ses propres handles sur la source.
+    table_iou_threshold est le recouvrement à partir duquel deux tableaux d'une
+    même page sont considérés comme un seul.
+    pages limite l'extraction à certaines pages (numéros à partir de 0) : les
+    statistiques ne portent alors que sur ces pages, et progress_callback reçoit
+    (pages traitées, pages à traiter).
+    page_timeout (secondes) et page_memory_limit_mb (mémoire résidente) fixent le
+    budget de chaque page, extraite alors dans un processus isolé : une page qui le
+    dépasse, ou dont le processus s'arrête, est comptée en échec avec une erreur
+    structurée (reason : timeout, memory ou crash) et l'extraction continue.
+    ocr (extractor.ocr.TesseractOCR) complète par OCR, dans le processus qui extrait
+    la page et sous son budget, les pages dont le texte natif est insuffisant ; leur
+    nombre est enregistré dans metadata["ocr_pages"].
+    Les mesures de l'extraction (durée et temps CPU par étape et par page, pic de
+    mémoire, éléments extraits par moteur) sont enregistrées dans metadata["metrics"].
     """
     result = {
         "text": "",
@@ -102,266 +913,72 @@ def extract_pdf_content(pdf_path, output_img_folder):
         "metadata": {
             "total_pages": 0,
             "extraction_date": datetime.now().isoformat(),
-            "file_size": os.path.getsize(pdf_path)
+            "file_size": _file_size(pdf_path)
         },
         "pages": []
     }
+    totals = {"images": 0, "tables": 0, "text_length": 0, "positioned_elements": 0}
 
     # Créer le dossier de sortie pour les images
     os.makedirs(output_img_folder, exist_ok=True)
 
-    # Extraction avec PyMuPDF pour images et contenu positionnel
-    try:
-        pdf_doc = fitz.open(pdf_path)
-        result["metadata"]["total_pages"] = len(pdf_doc)
+    if ocr is not None:
+        result["metadata"]["ocr_pages"] = 0
+        if ocr.error:
+            _record_error(result, {"error": ocr.error, "method": "OCR"})
+            ocr = None
 
-        for page_num in range(len(pdf_doc)):
-            page = pdf_doc[page_num]
-            page_data = {
-                "page_number": page_num + 1,
-                "text": "",
-                "positioned_text": [],
-                "tables": [],
-                "images": [],
-                "bbox": [0, 0, page.rect.width, page.rect.height],
-                "rotation": page.rotation
-            }
-
-            # Extraction du texte avec positions (PyMuPDF)
-            text_dict = page.get_text("dict")
-            positioned_chars = []
-            page_text = ""
-
-            for block in text_dict["blocks"]:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            text = span["text"]
-                            if text.strip():
-                                page_text += text
-                                positioned_chars.append({
-                                    "text": text,
-                                    "bbox": span["bbox"],
-                                    "font": span["font"],
-                                    "size": span["size"],
-                                    "flags": span["flags"],
-                                    "color": span["color"]
-                                })
-                        page_text += "\n"
-
-            page_data["text"] = page_text
-            page_data["positioned_text"] = positioned_chars
-            result["positioned_text"].extend(positioned_chars)
-            result["text"] += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-
-            # Extraction des images avec PyMuPDF
-            image_list = page.get_images(full=True)
-            for img_index, img in enumerate(image_list):
-                try:
-                    xref = img[0]
-                    base_image = pdf_doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    image_ext = base_image["ext"]
-                    image_pil = Image.open(io.BytesIO(image_bytes))
-                    image_filename = f"pymupdf_p{page_num + 1}_{img_index + 1}.{image_ext}"
-                    image_path = os.path.join(output_img_folder, image_filename)
-                    image_pil.save(image_path)
-                    image_data = {
-                        "image_id": f"page_{page_num + 1}_image_{img_index + 1}",
-                        "filename": image_filename,
-                        "path": image_path,
-                        "page": page_num + 1,
-                        "format": image_ext,
-                        "width": image_pil.width,
-                        "height": image_pil.height,
-                        "size_bytes": os.path.getsize(image_path),
-                        "mode": image_pil.mode,
-                        "extraction_method": "PyMuPDF"
-                    }
-                    result["images"].append(image_data)
-                    page_data["images"].append(image_data)
-                except Exception as e:
-                    error_data = {
-                        "error": f"Erreur extraction image PyMuPDF page {page_num + 1}, index {img_index}: {str(e)}",
-                        "page": page_num + 1,
-                        "image_index": img_index,
-                        "method": "PyMuPDF"
-                    }
-                    if "extraction_errors" not in result:
-                        result["extraction_errors"] = []
-                    result["extraction_errors"].append(error_data)
-            result["pages"].append(page_data)
-        pdf_doc.close()
+    try:
+        backends = PDFBackends(pdf_path)
     except Exception as e:
-        error_data = {
+        _record_error(result, {
             "error": f"Erreur ouverture PDF avec PyMuPDF: {str(e)}"
-        }
-        if "extraction_errors" not in result:
-            result["extraction_errors"] = []
-        result["extraction_errors"].append(error_data)
+        })
+        backends = None
 
-    # Extraction complémentaire avec pypdfium2 pour images manquées
-    try:
-        pdf_doc_pdfium = pdfium.PdfDocument(pdf_path)
-        for page_num in range(len(pdf_doc_pdfium)):
-            page = pdf_doc_pdfium[page_num]
-            try:
-                objects = []
-                for obj_index in range(page.count_objects()):
-                    obj = page.get_object(obj_index)
-                    if obj.get_type() == pdfium.FPDF_PAGEOBJ_IMAGE:
-                        objects.append((obj_index, obj))
-                for img_idx, (obj_index, obj) in enumerate(objects):
-                    try:
-                        bitmap = obj.get_bitmap()
-                        if bitmap:
-                            width = bitmap.get_width()
-                            height = bitmap.get_height()
-                            stride = bitmap.get_stride()
-                            buffer = bitmap.get_buffer()
-                            image = Image.frombuffer("RGBA", (width, height), buffer, "raw", "BGRA", stride)
-                            image_hash = hashlib.md5(image.tobytes()).hexdigest()
-                            existing_hashes = []
-                            for existing_img in result["images"]:
-                                if existing_img.get("page") == page_num + 1:
-                                    try:
-                                        existing_pil = Image.open(existing_img["path"])
-                                        existing_hash = hashlib.md5(existing_pil.tobytes()).hexdigest()
-                                        existing_hashes.append(existing_hash)
-                                    except:
-                                        pass
-                            if image_hash not in existing_hashes:
-                                image_filename = f"pdfium_p{page_num + 1}_{img_idx + 1}.png"
-                                image_path = os.path.join(output_img_folder, image_filename)
-                                image.save(image_path, "PNG")
-                                image_data = {
-                                    "image_id": f"page_{page_num + 1}_pdfium_image_{img_idx + 1}",
-                                    "filename": image_filename,
-                                    "path": image_path,
-                                    "page": page_num + 1,
-                                    "format": "png",
-                                    "width": width,
-                                    "height": height,
-                                    "size_bytes": os.path.getsize(image_path),
-                                    "mode": image.mode if hasattr(image, 'mode') else 'RGBA',
-                                    "extraction_method": "pypdfium2"
-                                }
-                                result["images"].append(image_data)
-                                if page_num < len(result["pages"]):
-                                    result["pages"][page_num]["images"].append(image_data)
-                    except Exception as e:
-                        error_data = {
-                            "error": f"Erreur extraction image pypdfium2 page {page_num + 1}, index {img_idx}: {str(e)}",
-                            "page": page_num + 1,
-                            "image_index": img_idx,
-                            "method": "pypdfium2"
-                        }
-                        if "extraction_errors" not in result:
-                            result["extraction_errors"] = []
-                        result["extraction_errors"].append(error_data)
-            except Exception as e:
-                error_data = {
-                    "error": f"Erreur extraction images pypdfium2 page {page_num + 1}: {str(e)}",
-                    "page": page_num + 1,
-                    "method": "pypdfium2"
-                }
-                if "extraction_errors" not in result:
-                    result["extraction_errors"] = []
-                result["extraction_errors"].append(error_data)
-    except Exception as e:
-        error_data = {
-            "error": f"Erreur ouverture PDF pypdfium2 pour extraction images: {str(e)}"
-        }
-        if "extraction_errors" not in result:
-            result["extraction_errors"] = []
-        result["extraction_errors"].append(error_data)
-
-    # Extraction des tableaux avec pdfplumber (robuste)
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, 1):
-                # Stratégies : lignes, texte, hybride
-                strategies = [
-                    ("lines", {"vertical_strategy": "lines", "horizontal_strategy": "lines", "snap_tolerance": 5,
-                               "join_tolerance": 5}),
-                    ("text", {"vertical_strategy": "text", "horizontal_strategy": "text", "snap_tolerance": 10,
-                              "join_tolerance": 10}),
-                    ("hybrid", {"vertical_strategy": "lines", "horizontal_strategy": "text", "snap_tolerance": 8,
-                                "join_tolerance": 8}),
-                ]
-                tables_found = []
-                for method, settings in strategies:
-                    try:
-                        tables = page.extract_tables(settings)
-                        if tables:
-                            for table in tables:
-                                tables_found.append((method, table, settings))
-                    except Exception:
-                        continue
-                for table_idx, (method, table, settings) in enumerate(tables_found):
-                    table_data = clean_and_validate_table(table, page, settings, page_num, table_idx, method)
-                    if table_data:
-                        result["tables"].append(table_data)
-                        if page_num - 1 < len(result["pages"]):
-                            result["pages"][page_num - 1]["tables"].append(table_data)
-    except Exception as e:
-        error_data = {
-            "error": f"Erreur extraction tableaux avec pdfplumber: {str(e)}"
-        }
-        if "extraction_errors" not in result:
-            result["extraction_errors"] = []
-        result["extraction_errors"].append(error_data)
-
-    # Extraction complémentaire de tableaux avec PyMuPDF (alignement des blocs texte)
-    try:
-        pdf_doc = fitz.open(pdf_path)
-        for page_num in range(len(pdf_doc)):
-            page = pdf_doc[page_num]
-            text_dict = page.get_text("dict")
-            text_blocks = []
-            for block in text_dict["blocks"]:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            if span["text"].strip():
-                                text_blocks.append({
-                                    "text": span["text"].strip(),
-                                    "x0": span["bbox"][0],
-                                    "y0": span["bbox"][1],
-                                    "x1": span["bbox"][2],
-                                    "y1": span["bbox"][3],
-                                    "font_size": span["size"]
-                                })
-            if text_blocks:
-                detected_tables = detect_tables_from_text_blocks(text_blocks, page_num + 1)
-                for table_data in detected_tables:
-                    already = False
-                    for existing in result["tables"]:
-                        if (existing["page"] == table_data["page"] and
-                                existing["rows"] == table_data["rows"] and
-                                existing["columns"] == table_data["columns"] and
-                                existing["data"] and table_data["data"] and
-                                existing["data"][0] == table_data["data"][0]):
-                            already = True
-                            break
-                    if not already:
-                        result["tables"].append(table_data)
-                        if page_num < len(result["pages"]):
-                            result["pages"][page_num]["tables"].append(table_data)
-        pdf_doc.close()
-    except Exception as e:
-        error_data = {
-            "error": f"Erreur extraction tableaux avec PyMuPDF: {str(e)}"
-        }
-        if "extraction_errors" not in result:
-            result["extraction_errors"] = []
-        result["extraction_errors"].append(error_data)
+    if backends is not None:
+        with backends:
+            page_count = backends.page_count
+            result["metadata"]["total_pages"] = page_count
+            pages_to_process = len(pages) if pages is not None else page_count
+            pages_processed = 0
+            text_parts = []
+            metrics = ExtractionMetrics()
+            extracted_pages = iter_pdf_pages(pdf_path, output_img_folder, workers, chunk_size, backends=backends,
+                                             table_iou_threshold=table_iou_threshold, pages=pages,
+                                             page_timeout=page_timeout, page_memory_limit_mb=page_memory_limit_mb,
+                                             ocr=ocr)
+            for page_num, page_data, errors, page_metrics in extracted_pages:
+                for error_data in errors:
+                    _record_error(result, error_data)
+                metrics.add_page(page_metrics, errors)
+                if page_data is not None:
+                    page_text = f"\n--- Page {page_num + 1} ---\n{page_data['text']}\n"
+                    totals["images"] += len(page_data["images"])
+                    totals["tables"] += len(page_data["tables"])
+                    totals["text_length"] += len(page_text)
+                    totals["positioned_elements"] += len(page_data["positioned_text"])
+                    if "ocr" in page_data:
+                        result["metadata"]["ocr_pages"] += 1
+                    if collect_pages:
+                        result["positioned_text"].extend(page_data["positioned_text"])
+                        result["tables"].extend(page_data["tables"])
+                        result["images"].extend(page_data["images"])
+                        result["pages"].append(page_data)
+                        text_parts.append(page_text)
+                    if page_callback is not None:
+                        page_callback(page_data)
+                pages_processed += 1
+                if progress_callback is not None:
+                    progress_callback(pages_processed, pages_to_process)
+            result["text"] = "".join(text_parts)
+            result["metadata"]["metrics"] = metrics.as_dict()
 
     # Ajouter des statistiques finales
-    result["metadata"]["total_images"] = len(result["images"])
-    result["metadata"]["total_tables"] = len(result["tables"])
-    result["metadata"]["total_text_length"] = len(result["text"])
-    result["metadata"]["total_positioned_elements"] = len(result["positioned_text"])
+    result["metadata"]["total_images"] = totals["images"]
+    result["metadata"]["total_tables"] = totals["tables"]
+    result["metadata"]["total_text_length"] = totals["text_length"]
+    result["metadata"]["total_positioned_elements"] = totals["positioned_elements"]
 
     return result
 
@@ -392,146 +1009,304 @@ def detect_table_borders(page, table_settings):
         return False
 
 
+# Colonnes numériques produites par extract_text_with_layout
+LAYOUT_COLUMNS = {
+    "page": np.int32,
+    "block": np.int32,
+    "line": np.int32,
+    "span": np.int32,
+    "char_index": np.int32,
+    "codepoint": np.uint32,
+    "x": np.float32,
+    "y": np.float32,
+    "width": np.float32,
+    "height": np.float32,
+    "font_code": np.int32,
+    "size": np.float32,
+    "color": np.uint32,
+}
+
+
 def extract_text_with_layout(pdf_path):
     """
-    Extraction de texte avec préservation complète du layout
-    Retourne les coordonnées exactes de chaque caractère/mot
+    Extraction de texte avec préservation complète du layout.
+    Chaque page est analysée une seule fois en "rawdict" et les coordonnées
+    réelles de chaque caractère sont conservées.
+    Retourne une structure en colonnes : un tableau NumPy par champ de LAYOUT_COLUMNS
+    (une entrée par caractère) et "fonts", la table des polices indexée par font_code.
+    layout_to_records() reconstruit au besoin une liste de dicts par caractère.
+    En cas d'échec, les pages déjà analysées sont conservées et l'erreur est
+    ajoutée à "extraction_errors".
     """
-    layout_data = []
+    layout_result = {}
+    columns = {name: [] for name in LAYOUT_COLUMNS}
+    fonts = []
+    font_codes = {}
+    flags = fitz.TEXTFLAGS_RAWDICT & ~fitz.TEXT_PRESERVE_IMAGES
     try:
         pdf_doc = fitz.open(pdf_path)
         for page_num in range(len(pdf_doc)):
             page = pdf_doc[page_num]
-            text_dict = page.get_text("dict")
-            for block_num, block in enumerate(text_dict["blocks"]):
-                if "lines" in block:
-                    for line_num, line in enumerate(block["lines"]):
-                        for span_num, span in enumerate(line["spans"]):
-                            chars = page.get_text("rawdict")
-                            for char_data in chars["blocks"]:
-                                if "lines" in char_data:
-                                    for line_data in char_data["lines"]:
-                                        for span_data in line_data["spans"]:
-                                            if span_data["bbox"] == span["bbox"]:
-                                                text = span_data["text"]
-                                                for i, char in enumerate(text):
-                                                    char_width = (span["bbox"][2] - span["bbox"][0]) / len(text)
-                                                    char_x = span["bbox"][0] + (i * char_width)
-                                                    layout_data.append({
-                                                        "page": page_num + 1,
-                                                        "block": block_num,
-                                                        "line": line_num,
-                                                        "span": span_num,
-                                                        "char": char,
-                                                        "char_index": i,
-                                                        "x": char_x,
-                                                        "y": span["bbox"][1],
-                                                        "width": char_width,
-                                                        "height": span["bbox"][3] - span["bbox"][1],
-                                                        "font": span["font"],
-                                                        "size": span["size"],
-                                                        "color": span["color"]
-                                                    })
+            raw_dict = page.get_text("rawdict", flags=flags)
+            # Accumulation par page dans des listes plates, converties en une fois en tableaux
+            page_columns = {name: [] for name in ("block", "line", "span", "char_index", "codepoint",
+                                                  "font_code", "size", "color")}
+            bboxes = []
+            for block_num, block in enumerate(raw_dict["blocks"]):
+                if "lines" not in block:
+                    continue
+                for line_num, line in enumerate(block["lines"]):
+                    for span_num, span in enumerate(line["spans"]):
+                        chars = span["chars"]
+                        if not chars:
+                            continue
+                        count = len(chars)
+                        font_code = font_codes.get(span["font"])
+                        if font_code is None:
+                            font_code = font_codes[span["font"]] = len(fonts)
+                            fonts.append(span["font"])
+                        page_columns["block"].extend([block_num] * count)
+                        page_columns["line"].extend([line_num] * count)
+                        page_columns["span"].extend([span_num] * count)
+                        page_columns["char_index"].extend(range(count))
+                        page_columns["codepoint"].extend(ord(char["c"][0]) if char["c"] else 0 for char in chars)
+                        page_columns["font_code"].extend([font_code] * count)
+                        page_columns["size"].extend([span["size"]] * count)
+                        page_columns["color"].extend([span["color"]] * count)
+                        bboxes.extend(char["bbox"] for char in chars)
+            del raw_dict
+            if not bboxes:
+                continue
+            boxes = np.array(bboxes, dtype=np.float32)
+            columns["page"].append(np.full(len(bboxes), page_num + 1, dtype=np.int32))
+            for name, values in page_columns.items():
+                columns[name].append(np.array(values, dtype=LAYOUT_COLUMNS[name]))
+            columns["x"].append(boxes[:, 0])
+            columns["y"].append(boxes[:, 1])
+            columns["width"].append(boxes[:, 2] - boxes[:, 0])
+            columns["height"].append(boxes[:, 3] - boxes[:, 1])
         pdf_doc.close()
     except Exception as e:
-        print(f"Erreur extraction layout: {e}")
+        logger.exception("Erreur extraction layout de %s", pdf_path)
+        _record_error(layout_result, {
+            "error": f"Erreur extraction layout: {str(e)}",
+            "method": "PyMuPDF"
+        })
+
+    layout_data = {
+        name: np.concatenate(columns[name]) if columns[name] else np.empty(0, dtype=dtype)
+        for name, dtype in LAYOUT_COLUMNS.items()
+    }
+    layout_data["fonts"] = fonts
+    layout_data.update(layout_result)
     return layout_data
 
 
+def layout_to_records(layout_data, start=0, stop=None):
+    """
+    Matérialise les caractères [start, stop) d'une structure produite par
+    extract_text_with_layout sous forme de dicts (un par caractère)
+    """
+    fonts = layout_data["fonts"]
+    selected = {name: layout_data[name][start:stop].tolist() for name in LAYOUT_COLUMNS}
+    records = []
+    for i in range(len(selected["page"])):
+        records.append({
+            "page": selected["page"][i],
+            "block": selected["block"][i],
+            "line": selected["line"][i],
+            "span": selected["span"][i],
+            "char": chr(selected["codepoint"][i]),
+            "char_index": selected["char_index"][i],
+            "x": selected["x"][i],
+            "y": selected["y"][i],
+            "width": selected["width"][i],
+            "height": selected["height"][i],
+            "font": fonts[selected["font_code"][i]],
+            "size": selected["size"][i],
+            "color": selected["color"][i]
+        })
+    return records
+
+
+# Détection de tableaux par alignement des spans PyMuPDF
+CELL_GAP_EM = 1.0
+TABLE_ROW_GAP = 2.0
+TABLE_MIN_FILL = 0.4
+# Au-delà, les "cellules" sont des lignes de prose : mise en page sur plusieurs
+# colonnes (médiane du tableau) ou texte à numéros de ligne (médiane d'une colonne)
+TABLE_MAX_MEDIAN_CELL_CHARS = 40
+TABLE_MAX_COLUMN_CELL_CHARS = 60
+
+
+def _cluster_rows(boxes):
+    """
+    Regroupe les spans en lignes : les centres verticaux triés sont coupés là où
+    l'écart dépasse la moitié de la hauteur médiane des spans.
+    Retourne (ordre de tri, identifiant de ligne par span trié)
+    """
+    y_centers = (boxes[:, 1] + boxes[:, 3]) / 2
+    tolerance = max(2.0, 0.5 * float(np.median(boxes[:, 3] - boxes[:, 1])))
+    order = np.argsort(y_centers, kind="stable")
+    breaks = np.diff(y_centers[order]) > tolerance
+    row_ids = np.concatenate(([0], np.cumsum(breaks)))
+    # Dans chaque ligne, les spans sont ordonnés de gauche à droite
+    order = order[np.lexsort((boxes[order, 0], row_ids))]
+    return order, row_ids
+
+
+def _merge_cells(boxes, font_sizes, order, row_ids):
+    """
+    Fusionne les spans contigus d'une même ligne en cellules : une nouvelle cellule
+    commence à chaque ligne, ou quand le blanc qui précède dépasse CELL_GAP_EM cadratins.
+    Retourne (premier span trié de chaque cellule, bbox des cellules, ligne des cellules)
+    """
+    sorted_boxes = boxes[order]
+    gaps = sorted_boxes[1:, 0] - sorted_boxes[:-1, 2]
+    new_cell = np.concatenate((
+        [True],
+        (row_ids[1:] != row_ids[:-1]) | (gaps > CELL_GAP_EM * font_sizes[order][:-1])
+    ))
+    starts = np.flatnonzero(new_cell)
+    cell_boxes = np.column_stack((
+        np.minimum.reduceat(sorted_boxes[:, 0], starts),
+        np.minimum.reduceat(sorted_boxes[:, 1], starts),
+        np.maximum.reduceat(sorted_boxes[:, 2], starts),
+        np.maximum.reduceat(sorted_boxes[:, 3], starts),
+    ))
+    return starts, cell_boxes, row_ids[starts]
+
+
+def _table_row_runs(row_cell_counts, row_centers):
+    """
+    Découpe les lignes en suites contiguës de lignes à plusieurs cellules.
+    Une ligne isolée à une seule cellule est conservée entre deux lignes tabulaires ;
+    un écart vertical supérieur à TABLE_ROW_GAP fois l'interligne médian coupe la suite.
+    """
+    if len(row_centers) < 2:
+        return []
+    pitch = np.diff(row_centers)
+    max_gap = TABLE_ROW_GAP * float(np.median(pitch))
+    tabular = row_cell_counts >= 2
+    # Pont sur une ligne à une cellule encadrée par deux lignes tabulaires
+    bridge = np.zeros_like(tabular)
+    bridge[1:-1] = ~tabular[1:-1] & tabular[:-2] & tabular[2:]
+    member = tabular | bridge
+    cut = np.concatenate(([True], ~member[:-1] | ~member[1:] | (pitch > max_gap)))
+    runs = []
+    for start, stop in zip(np.flatnonzero(cut), np.append(np.flatnonzero(cut)[1:], len(member))):
+        if not member[start]:
+            continue
+        # Une suite ne commence ni ne finit par une ligne pontée
+        while start < stop and not tabular[start]:
+            start += 1
+        while stop > start and not tabular[stop - 1]:
+            stop -= 1
+        if stop - start >= 2:
+            runs.append((start, stop))
+    return runs
+
+
+def _column_starts(cell_boxes):
+    """
+    Colonnes d'un tableau par projection horizontale : une colonne commence après
+    chaque couloir vertical vide. Les cellules plus larges que la moitié du tableau
+    (titres fusionnés) sont ignorées pour ne pas masquer les couloirs.
+    """
+    x0, x1 = cell_boxes[:, 0], cell_boxes[:, 2]
+    width = x1.max() - x0.min()
+    narrow = (x1 - x0) <= 0.5 * width
+    if narrow.sum() >= 2:
+        x0, x1 = x0[narrow], x1[narrow]
+    order = np.argsort(x0, kind="stable")
+    x0, x1 = x0[order], x1[order]
+    covered = np.maximum.accumulate(x1)
+    starts = np.concatenate(([True], x0[1:] > covered[:-1]))
+    return x0[starts]
+
+
 def detect_tables_from_text_blocks(text_blocks, page_num):
     """
-    Détecte les tableaux basés sur l'alignement et la position des blocs de texte
+    Détecte les tableaux basés sur l'alignement et la position des blocs de texte.
+    Les spans sont regroupés en lignes (centres verticaux) puis en cellules (blancs
+    horizontaux) ; chaque suite de lignes à plusieurs cellules forme un tableau
+    candidat dont les colonnes sont délimitées par les couloirs verticaux vides.
+    Plusieurs tableaux peuvent être détectés sur une même page.
     """
     if not text_blocks or len(text_blocks) < 4:
         return []
-    text_blocks.sort(key=lambda b: (round(b["y0"], 1), round(b["x0"], 1)))
-    lines = []
-    current_line = []
-    current_y = None
-    y_tolerance = 5
-    for block in text_blocks:
-        if current_y is None or abs(block["y0"] - current_y) <= y_tolerance:
-            current_line.append(block)
-            current_y = block["y0"] if current_y is None else current_y
-        else:
-            if len(current_line) >= 2:
-                lines.append(sorted(current_line, key=lambda b: b["x0"]))
-            current_line = [block]
-            current_y = block["y0"]
-    if len(current_line) >= 2:
-        lines.append(sorted(current_line, key=lambda b: b["x0"]))
-    if len(lines) < 2:
-        return []
+    count = len(text_blocks)
+    boxes = np.fromiter(
+        (value for b in text_blocks for value in (b["x0"], b["y0"], b["x1"], b["y1"])),
+        dtype=np.float64, count=4 * count
+    ).reshape(count, 4)
+    font_sizes = np.fromiter((b["font_size"] for b in text_blocks), dtype=np.float64, count=count)
+
+    order, row_ids = _cluster_rows(boxes)
+    cell_starts, cell_boxes, cell_rows = _merge_cells(boxes, font_sizes, order, row_ids)
+
+    # Texte des cellules (les spans d'une cellule sont déjà triés de gauche à droite)
+    texts = [text_blocks[index]["text"] for index in order.tolist()]
+    if len(cell_starts) == count:
+        cell_texts = texts
+    else:
+        bounds = cell_starts.tolist() + [count]
+        cell_texts = [" ".join(texts[start:stop]) for start, stop in zip(bounds, bounds[1:])]
+
+    row_count = int(cell_rows[-1]) + 1
+    row_cell_counts = np.bincount(cell_rows, minlength=row_count)
+    row_first_cell = np.concatenate(([0], np.cumsum(row_cell_counts)[:-1]))
+    row_centers = (
+        np.minimum.reduceat(cell_boxes[:, 1], row_first_cell)
+        + np.maximum.reduceat(cell_boxes[:, 3], row_first_cell)
+    ) / 2
+
     detected_tables = []
-    if len(lines) >= 2:
-        col_counts = {}
-        for line in lines:
-            count = len(line)
-            col_counts[count] = col_counts.get(count, 0) + 1
-        most_common_cols = max([k for k in col_counts.keys() if k >= 2], default=0)
-        if most_common_cols >= 2:
-            table_lines = []
-            for line in lines:
-                if abs(len(line) - most_common_cols) <= 1:
-                    if len(line) < most_common_cols:
-                        while len(line) < most_common_cols:
-                            line.append({"text": "", "x0": line[-1]["x1"], "y0": line[-1]["y0"],
-                                         "x1": line[-1]["x1"], "y1": line[-1]["y1"],
-                                         "font_size": line[-1]["font_size"]})
-                    elif len(line) > most_common_cols:
-                        line = line[:most_common_cols]
-                    table_lines.append(line)
-            if len(table_lines) >= 2:
-                column_positions = []
-                for col_idx in range(most_common_cols):
-                    positions = []
-                    for line in table_lines:
-                        if col_idx < len(line):
-                            positions.append(line[col_idx]["x0"])
-                    if positions:
-                        avg_pos = sum(positions) / len(positions)
-                        max_deviation = max(abs(pos - avg_pos) for pos in positions)
-                        if max_deviation <= 20:
-                            column_positions.append(avg_pos)
-                if len(column_positions) >= 2:
-                    table_data = []
-                    for line in table_lines:
-                        row = []
-                        for col_idx in range(most_common_cols):
-                            if col_idx < len(line):
-                                row.append(line[col_idx]["text"])
-                            else:
-                                row.append("")
-                        table_data.append(row)
-                    non_empty_cells = sum(1 for row in table_data for cell in row if cell.strip())
-                    total_cells = len(table_data) * most_common_cols
-                    if non_empty_cells >= (total_cells * 0.4):
-                        has_headers = False
-                        if len(table_data) > 1:
-                            first_row_chars = sum(len(cell) for cell in table_data[0])
-                            if len(table_data) > 1:
-                                avg_other_rows = sum(sum(len(cell) for cell in row) for row in table_data[1:]) / (
-                                            len(table_data) - 1)
-                                if first_row_chars > avg_other_rows * 0.7:
-                                    has_headers = True
-                        table_info = {
-                            "table_id": f"page_{page_num}_pymupdf_table_{len(detected_tables) + 1}",
-                            "page": page_num,
-                            "data": table_data,
-                            "rows": len(table_data),
-                            "columns": most_common_cols,
-                            "has_headers": has_headers,
-                            "has_borders": False,
-                            "extraction_method": "PyMuPDF_position"
-                        }
-                        try:
-                            if has_headers and len(table_data) > 1:
-                                df = pd.DataFrame(table_data[1:], columns=table_data[0])
-                                table_info["csv_data"] = df.to_csv(index=False)
-                            else:
-                                df = pd.DataFrame(table_data)
-                                table_info["csv_data"] = df.to_csv(index=False, header=False)
-                        except Exception as e:
-                            table_info["conversion_error"] = str(e)
-                        detected_tables.append(table_info)
-    return detected_tables
\ No newline at end of file
+    for start_row, stop_row in _table_row_runs(row_cell_counts, row_centers):
+        first_cell = row_first_cell[start_row]
+        stop_cell = row_first_cell[stop_row] if stop_row < row_count else len(cell_boxes)
+        table_boxes = cell_boxes[first_cell:stop_cell]
+        column_starts = _column_starts(table_boxes)
+        if len(column_starts) < 2:
+            continue
+        columns = np.searchsorted(column_starts, table_boxes[:, 0], side="right") - 1
+        np.clip(columns, 0, len(column_starts) - 1, out=columns)
+        rows = cell_rows[first_cell:stop_cell] - start_row
+
+        table_data = [[""] * len(column_starts) for _ in range(stop_row - start_row)]
+        for offset, (row, column) in enumerate(zip(rows.tolist(), columns.tolist())):
+            text = cell_texts[first_cell + offset]
+            current = table_data[row][column]
+            table_data[row][column] = f"{current} {text}" if current else text
+
+        cell_lengths = [len(cell) for row in table_data for cell in row if cell.strip()]
+        total_cells = len(table_data) * len(column_starts)
+        if len(cell_lengths) < total_cells * TABLE_MIN_FILL:
+            continue
+        if np.median(cell_lengths) > TABLE_MAX_MEDIAN_CELL_CHARS:
+            continue
+        if any(
+            np.median([len(row[column]) for row in table_data if row[column]] or [0]) > TABLE_MAX_COLUMN_CELL_CHARS
+            for column in range(len(column_starts))
+        ):
+            continue
+
+        first_row_chars = sum(len(cell) for cell in table_data[0])
+        avg_other_rows = sum(sum(len(cell) for cell in row) for row in table_data[1:]) / (len(table_data) - 1)
+        has_headers = first_row_chars > avg_other_rows * 0.7
+
+        detected_tables.append({
+            "table_id": f"page_{page_num}_pymupdf_table_{len(detected_tables) + 1}",
+            "page": page_num,
+            "data": table_data,
+            "rows": len(table_data),
+            "columns": len(column_starts),
+            "bbox": [
+                float(table_boxes[:, 0].min()), float(table_boxes[:, 1].min()),
+                float(table_boxes[:, 2].max()), float(table_boxes[:, 3].max())
+            ],
+            "has_headers": has_headers,
+            "has_borders": False,
+            "extraction_method": "PyMuPDF_position"
+        })
+    return detected_tables
@@ -1,29 +1,157 @@
 from django.shortcuts import render
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
-from .models import PDFDocument
-from .utils import extract_pdf_content
+from django.utils import timezone
+from django.db.models import Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from .models import PAGE_SECTIONS, PDFDocument, StoredImage, Table, UploadSession
+from .jobs import enqueue_extraction, queue_gauges
+from .cache import find_cached_document, hash_uploaded_file
+from .derivatives import get_derivative_widths, image_thumbnail, page_preview
+from .exports import EXPORT_FORMATS, ExportUnavailable, available_export_formats, export_edited_table, export_table
+from .metrics import REGISTRY
+from .ocr import get_extractor_version
+from .streaming import iter_document_events, iter_results_json
+from .uploads import (
+    PDFUploadHandler, PDFValidationError, delete_session, get_max_chunked_upload_bytes,
+    get_part_path, open_session_file, validate_pdf_file, write_chunk
+)
 import os
 import json
-from datetime import datetime
+import base64
+import hashlib
+import re
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
 
 def upload_pdf(request):
     """Vue principale pour l'upload et l'affichage"""
     return render(request, 'extractor/index.html')
 
+def _srcset(url, widths):
+    return ', '.join(f'{url}?w={width} {width}w' for width in widths)
+
+def _add_image_urls(response_data, document):
+    """Convertit les chemins d'images en URLs accessibles"""
+    for image in response_data.get('images', []):
+        _add_image_url(image)
+    for table in response_data.get('tables', []):
+        _add_table_export_urls(table, document)
+    
+    # Ajouter les URLs aux pages aussi
+    for page in response_data.get('pages', []):
+        _add_page_image_urls(page, document)
+    return response_data
+
+def _add_image_url(image):
+    # Convertir le chemin absolu en URL relative
+    relative_path = image['path'].replace(os.getcwd() + '/', '')
+    image['url'] = '/' + relative_path.replace('\\', '/')
+    
+    # Vignettes WebP plus petites que l'original, générées à la première demande
+    widths = [width for width in get_derivative_widths() if width < image.get('width', 0)]
+    if image.get('content_hash') and widths:
+        thumbnail_url = f"/images/{image['content_hash']}/thumbnail/"
+        image['thumbnail_url'] = f'{thumbnail_url}?w={widths[0]}'
+        image['srcset'] = f"{_srcset(thumbnail_url, widths)}, {image['url']} {image['width']}w"
+    else:
+        image['thumbnail_url'] = image['url']
+        image['srcset'] = f"{image['url']} {image.get('width', 0)}w"
+
+def _add_table_export_urls(table, document):
+    # Un lien par format dont les dépendances sont installées
+    export_url = f"/tables/{document.id}/{table['table_id']}/export/"
+    table['export_urls'] = {
+        export_format: f'{export_url}?format={export_format}'
+        for export_format in available_export_formats()
+    }
+
+def _add_page_image_urls(page, document):
+    for image in page.get('images', []):
+        _add_image_url(image)
+    for table in page.get('tables', []):
+        _add_table_export_urls(table, document)
+    
+    # Aperçus de la page rendue
+    if 'page_number' in page:
+        widths = get_derivative_widths()
+        preview_url = f"/pages/{document.id}/{page['page_number']}/preview/"
+        page['preview_url'] = f'{preview_url}?w={widths[0]}'
+        page['preview_srcset'] = _srcset(preview_url, widths)
+    return page
+
+def _get_previous_document(data):
+    """Révision d'un document déjà extrait : seules les pages modifiées seront ré-extraites"""
+    if not data.get('previous_document_id'):
+        return None
+    try:
+        return PDFDocument.objects.get(id=int(data['previous_document_id']))
+    except ValueError:
+        raise PDFDocument.DoesNotExist
+
+def _queue_document(pdf_file, original_filename, file_size, content_hash, previous_document):
+    """Réutilise un PDF identique déjà extrait (ou en cours), sinon crée le document et le met en file"""
+    cached_document = find_cached_document(content_hash)
+    if cached_document is not None:
+        return JsonResponse({
+            'success': True,
+            'document_id': cached_document.id,
+            'status': cached_document.status,
+            'progress': cached_document.progress,
+            'cached': True
+        })
+    
+    # Créer le document avec métadonnées
+    document = PDFDocument.objects.create(
+        file=pdf_file,
+        original_filename=original_filename,
+        file_size=file_size,
+        content_hash=content_hash,
+        extractor_version=get_extractor_version(),
+        last_accessed_at=timezone.now(),
+        previous_document=previous_document
+    )
+    
+    # L'extraction est exécutée en arrière-plan
+    enqueue_extraction(document)
+    
+    return JsonResponse({
+        'success': True,
+        'document_id': document.id,
+        'status': document.status,
+        'progress': document.progress,
+        'cached': False
+    }, status=202)
+
+@csrf_exempt
 @require_http_methods(["POST"])
 def process_pdf(request):
-    """API endpoint pour traiter le PDF en AJAX"""
-    if 'pdf_file' not in request.FILES:
+    """API endpoint pour mettre un PDF en file d'extraction (AJAX)"""
+    # Le PDF est écrit sur disque et validé pendant sa réception : le gestionnaire
+    # doit être en place avant la lecture du corps, donc avant le contrôle CSRF
+    request.upload_handlers = [PDFUploadHandler(request)]
+    return _process_pdf(request)
+
+@csrf_protect
+def _process_pdf(request):
+    pdf_file = request.FILES.get('pdf_file')
+    upload_error = getattr(request, 'pdf_upload_error', None)
+    if upload_error:
+        return JsonResponse({
+            'success': False,
+            'error': upload_error
+        }, status=400)
+    
+    if pdf_file is None:
         return JsonResponse({
             'success': False, 
             'error': 'Aucun fichier PDF fourni'
         }, status=400)
     
-    pdf_file = request.FILES['pdf_file']
-    
     # Validation du type de fichier
     if not pdf_file.name.lower().endswith('.pdf'):
         return JsonResponse({
@@ -32,49 +160,183 @@ def process_pdf(request):
         }, status=400)
     
     try:
-        # Créer le document avec métadonnées
-        document = PDFDocument.objects.create(
-            file=pdf_file,
-            original_filename=pdf_file.name,
-            file_size=pdf_file.size
-        )
-        
-        # Chemin vers le fichier PDF
-        pdf_path = document.file.path
-        
-        # Dossier de sortie pour les images
-        output_folder = os.path.join('media', 'extracted_images', str(document.id))
-        
-        # Extraction du contenu
-        extraction_results = extract_pdf_content(pdf_path, output_folder)
-        
-        # Sauvegarder les résultats dans le modèle
-        document.extraction_results = extraction_results
-        document.extraction_completed = True
-        document.extraction_date = datetime.now()
-        document.save()
-        
-        # Préparer la réponse avec URLs relatives pour les images
-        response_data = extraction_results.copy()
-        
-        # Convertir les chemins d'images en URLs accessibles
-        for image in response_data.get('images', []):
-            # Convertir le chemin absolu en URL relative
-            relative_path = image['path'].replace(os.getcwd() + '/', '')
-            image['url'] = '/' + relative_path.replace('\\', '/')
-        
-        # Ajouter les URLs aux pages aussi
-        for page in response_data.get('pages', []):
-            if 'images' in page:
-                for image in page['images']:
-                    relative_path = image['path'].replace(os.getcwd() + '/', '')
-                    image['url'] = '/' + relative_path.replace('\\', '/')
+        previous_document = _get_previous_document(request.POST)
+    except PDFDocument.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Document précédent non trouvé'
+        }, status=404)
+    
+    try:
+        # L'empreinte est calculée pendant la réception du fichier
+        content_hash = getattr(pdf_file, 'content_hash', None) or hash_uploaded_file(pdf_file)
+        return _queue_document(pdf_file, pdf_file.name, pdf_file.size, content_hash, previous_document)
         
+    except Exception as e:
         return JsonResponse({
-            'success': True,
-            'document_id': document.id,
-            'results': response_data
-        })
+            'success': False,
+            'error': f'Erreur lors du traitement du PDF: {str(e)}'
+        }, status=500)
+
+def _upload_session_response(session, status=200):
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(session.id),
+        'offset': session.received,
+        'size': session.size,
+        'chunk_size': getattr(settings, 'PDF_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+    }, status=status)
+
+def _parse_content_range(value):
+    """Content-Range: bytes <début>-<fin>/<total> -> (début, fin incluse, total)"""
+    match = CONTENT_RANGE_RE.match(value or '')
+    if not match:
+        raise ValueError(value)
+    start, end, total = (int(group) for group in match.groups())
+    if end < start:
+        raise ValueError(value)
+    return start, end, total
+
+@require_http_methods(["POST"])
+def create_upload_session(request):
+    """
+    API endpoint d'ouverture d'un upload par morceaux (fichiers volumineux).
+    Paramètres : filename et size (octets). Les morceaux sont ensuite envoyés
+    par PUT /uploads/<upload_id>/ puis l'upload est finalisé par POST .../complete/.
+    """
+    filename = request.POST.get('filename', '')
+    if not filename.lower().endswith('.pdf'):
+        return JsonResponse({
+            'success': False,
+            'error': 'Le fichier doit être un PDF'
+        }, status=400)
+    
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = 0
+    if size <= 0:
+        return JsonResponse({
+            'success': False,
+            'error': 'Taille du fichier invalide'
+        }, status=400)
+    
+    max_bytes = get_max_chunked_upload_bytes()
+    if max_bytes is not None and size > max_bytes:
+        return JsonResponse({
+            'success': False,
+            'error': f'Fichier trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo)'
+        }, status=400)
+    
+    session = UploadSession.objects.create(original_filename=filename[:255], size=size)
+    return _upload_session_response(session, status=201)
+
+@require_http_methods(["GET", "PUT"])
+def upload_session(request, upload_id):
+    """
+    GET : offset à partir duquel reprendre l'envoi.
+    PUT : écrit un morceau (en-tête Content-Range: bytes <début>-<fin>/<total>).
+    Un morceau doit commencer à l'offset courant, sinon 409 avec l'offset attendu.
+    """
+    try:
+        session = UploadSession.objects.get(id=upload_id)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Upload non trouvé'
+        }, status=404)
+    
+    if request.method == 'GET':
+        return _upload_session_response(session)
+    
+    try:
+        start, end, total = _parse_content_range(request.META.get('HTTP_CONTENT_RANGE'))
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'En-tête Content-Range invalide (bytes <début>-<fin>/<total>)'
+        }, status=400)
+    
+    if total != session.size or end >= session.size:
+        return JsonResponse({
+            'success': False,
+            'error': 'Le morceau dépasse la taille annoncée du fichier'
+        }, status=400)
+    
+    if start != session.received:
+        return JsonResponse({
+            'success': False,
+            'error': "Le morceau ne commence pas à l'offset attendu",
+            'offset': session.received
+        }, status=409)
+    
+    try:
+        # Le corps est lu par blocs depuis la requête, jamais chargé entièrement en mémoire
+        written = write_chunk(session, request, start, end - start + 1)
+    except PDFValidationError as e:
+        delete_session(session)
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    
+    # Un envoi interrompu en cours de morceau reprend au dernier octet écrit
+    updated = UploadSession.objects.filter(id=session.id, received=start).update(
+        received=start + written, updated_at=timezone.now()
+    )
+    if not updated:
+        session.refresh_from_db()
+        return JsonResponse({
+            'success': False,
+            'error': "Le morceau ne commence pas à l'offset attendu",
+            'offset': session.received
+        }, status=409)
+    
+    session.received = start + written
+    return _upload_session_response(session)
+
+@require_http_methods(["POST"])
+def complete_upload_session(request, upload_id):
+    """API endpoint de finalisation d'un upload par morceaux : validation puis mise en file d'extraction"""
+    try:
+        session = UploadSession.objects.get(id=upload_id)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Upload non trouvé'
+        }, status=404)
+    
+    if session.received < session.size:
+        return JsonResponse({
+            'success': False,
+            'error': 'Upload incomplet',
+            'offset': session.received
+        }, status=409)
+    
+    try:
+        previous_document = _get_previous_document(request.POST)
+    except PDFDocument.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Document précédent non trouvé'
+        }, status=404)
+    
+    try:
+        content_hash = validate_pdf_file(get_part_path(session), get_max_chunked_upload_bytes())
+    except PDFValidationError as e:
+        delete_session(session)
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    
+    try:
+        # Le fichier assemblé est déplacé (et non recopié) vers le stockage des PDF
+        with open_session_file(session) as pdf_file:
+            response = _queue_document(pdf_file, session.original_filename, session.size,
+                                       content_hash, previous_document)
+        delete_session(session)
+        return response
         
     except Exception as e:
         return JsonResponse({
@@ -82,43 +344,385 @@ def process_pdf(request):
             'error': f'Erreur lors du traitement du PDF: {str(e)}'
         }, status=500)
 
+RESULT_SECTIONS = PAGE_SECTIONS + ('metadata',)
+
+def _parse_page_ranges(value):
+    """
+    Analyse un paramètre 'pages' du type "1-5,8,12-" en intervalles (début, fin)
+    triés et fusionnés ; fin vaut None pour un intervalle ouvert
+    """
+    ranges = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            first = int(first) if first.strip() else 1
+            last = int(last) if last.strip() else None
+        else:
+            first = last = int(part)
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(part)
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError(value)
+    
+    ranges.sort(key=lambda r: r[0])
+    merged = [ranges[0]]
+    for first, last in ranges[1:]:
+        previous_first, previous_last = merged[-1]
+        if previous_last is None or first <= previous_last + 1:
+            if previous_last is not None and (last is None or last > previous_last):
+                merged[-1] = (previous_first, last)
+        else:
+            merged.append((first, last))
+    return merged
+
+def _encode_cursor(page_number):
+    return base64.urlsafe_b64encode(json.dumps({'page': page_number}).encode()).decode()
+
+def _decode_cursor(cursor):
+    page_number = json.loads(base64.urlsafe_b64decode(cursor.encode()))['page']
+    if not isinstance(page_number, int) or page_number < 1:
+        raise ValueError(cursor)
+    return page_number
+
+def _pages_filter(ranges, after_page):
+    """Condition sur les pages sélectionnées par ranges et situées après after_page, ou None"""
+    condition = None
+    for first, last in ranges:
+        first = max(first, after_page + 1)
+        if last is not None and first > last:
+            continue
+        q = Q(page_number__gte=first)
+        if last is not None:
+            q &= Q(page_number__lte=last)
+        condition = q if condition is None else condition | q
+    return condition
+
+def _select_pages(document, ranges, sections, start_page, limit):
+    """
+    Retourne (pages, page de reprise) pour les pages sélectionnées à partir de
+    start_page, au plus limit pages ; la page de reprise vaut None en fin de sélection
+    """
+    pages = []
+    for first, last in ranges:
+        first = max(first, start_page)
+        if last is not None and first > last:
+            continue
+        for page_data in document.iter_page_data(first_page=first, last_page=last, sections=sections,
+                                                 batch_size=min(limit or 20, 20)):
+            pages.append(page_data)
+            if limit is not None and len(pages) == limit:
+                break
+        if limit is not None and len(pages) == limit:
+            break
+    
+    if limit is None or len(pages) < limit:
+        return pages, None
+    remaining = _pages_filter(ranges, pages[-1]['page_number'])
+    if remaining is None or not document.pages.filter(remaining).exists():
+        return pages, None
+    return pages, pages[-1]['page_number'] + 1
+
+def _results_etag(request, document):
+    """ETag des résultats : état du document et paramètres de la requête"""
+    key = '|'.join([
+        str(document.id),
+        document.status,
+        str(document.pages_processed),
+        document.extraction_date.isoformat() if document.extraction_date else '',
+        document.extractor_version,
+        request.GET.urlencode(),
+    ])
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
 def get_document_results(request, document_id):
-    """API endpoint pour récupérer les résultats d'un document"""
+    """
+    API endpoint pour récupérer l'état et les résultats d'un document.
+    Sans paramètre, renvoie l'intégralité des résultats (encodés au fil de la lecture
+    des pages à partir de PDF_LARGE_DOCUMENT_PAGES pages). Paramètres optionnels :
+    - pages : pages à renvoyer, ex. "1-5,8,12-"
+    - fields : sections à inclure parmi text, positioned_text, tables, images, metadata
+    - limit / cursor : pagination par curseur (nombre de pages par réponse)
+    Supporte ETag / If-None-Match.
+    """
     try:
         document = PDFDocument.objects.get(id=document_id)
         
-        if not document.extraction_completed:
-            return JsonResponse({
-                'success': False,
-                'error': 'L\'extraction n\'est pas encore terminée'
-            }, status=404)
-        
-        response_data = document.extraction_results.copy()
+        etag = _results_etag(request, document)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
         
-        # Convertir les chemins d'images en URLs accessibles
-        for image in response_data.get('images', []):
-            relative_path = image['path'].replace(os.getcwd() + '/', '')
-            image['url'] = '/' + relative_path.replace('\\', '/')
+        if document.status == PDFDocument.STATUS_FAILED:
+            response = JsonResponse({
+                'success': False,
+                'document_id': document.id,
+                'status': document.status,
+                'error': document.error_message or 'L\'extraction a échoué'
+            }, status=500)
+        elif not document.extraction_completed:
+            response = JsonResponse({
+                'success': True,
+                'document_id': document.id,
+                'status': document.status,
+                'progress': document.progress
+            }, status=202)
+        elif (not any(param in request.GET for param in ('pages', 'fields', 'limit', 'cursor'))
+                and document.page_count >= getattr(settings, 'PDF_LARGE_DOCUMENT_PAGES', 200)):
+            # Grand document : résultats encodés au fil de la lecture des pages
+            response = StreamingHttpResponse(_stream_full_results(document), content_type='application/json')
+        elif not any(param in request.GET for param in ('pages', 'fields', 'limit', 'cursor')):
+            response = JsonResponse({
+                'success': True,
+                'document_id': document.id,
+                'status': document.status,
+                'progress': document.progress,
+                'results': _add_image_urls(document.build_results(), document)
+            })
+        else:
+            try:
+                ranges = _parse_page_ranges(request.GET.get('pages', '1-'))
+                fields = request.GET.get('fields')
+                sections = RESULT_SECTIONS if fields is None else tuple(
+                    field.strip() for field in fields.split(',') if field.strip()
+                )
+                unknown = [section for section in sections if section not in RESULT_SECTIONS]
+                if unknown:
+                    raise ValueError(', '.join(unknown))
+                limit = int(request.GET['limit']) if 'limit' in request.GET else None
+                if limit is not None and limit < 1:
+                    raise ValueError(limit)
+                start_page = _decode_cursor(request.GET['cursor']) if 'cursor' in request.GET else 1
+            except (ValueError, TypeError, KeyError) as e:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Paramètre invalide: {str(e)}'
+                }, status=400)
+            
+            pages, next_page = _select_pages(
+                document, ranges, [section for section in sections if section in PAGE_SECTIONS],
+                start_page, limit
+            )
+            results = {'pages': [_add_page_image_urls(page, document) for page in pages]}
+            if 'metadata' in sections:
+                stored = document.extraction_results or {}
+                results['metadata'] = stored.get('metadata', {})
+                if stored.get('extraction_errors'):
+                    results['extraction_errors'] = stored['extraction_errors']
+            response = JsonResponse({
+                'success': True,
+                'document_id': document.id,
+                'status': document.status,
+                'progress': document.progress,
+                'results': results,
+                'next_cursor': _encode_cursor(next_page) if next_page is not None else None
+            })
         
-        for page in response_data.get('pages', []):
-            if 'images' in page:
-                for image in page['images']:
-                    relative_path = image['path'].replace(os.getcwd() + '/', '')
-                    image['url'] = '/' + relative_path.replace('\\', '/')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
         
+    except PDFDocument.DoesNotExist:
         return JsonResponse({
-            'success': True,
-            'document_id': document.id,
-            'results': response_data
-        })
-        
+            'success': False,
+            'error': 'Document non trouvé'
+        }, status=404)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur: {str(e)}'
+        }, status=500)
+
+def _stream_full_results(document):
+    """Réponse complète de get_document_results, encodée par morceaux"""
+    yield json.dumps({
+        'success': True,
+        'document_id': document.id,
+        'status': document.status,
+        'progress': document.progress,
+    })[:-1] + ', "results": '
+    yield from iter_results_json(
+        document,
+        add_image_url=_add_image_url,
+        add_page_urls=lambda page: _add_page_image_urls(page, document)
+    )
+    yield '}'
+
+def stream_document_results(request, document_id):
+    """
+    API endpoint de streaming (NDJSON) : une ligne JSON par événement, les pages
+    étant envoyées au fur et à mesure de leur extraction
+    """
+    try:
+        document = PDFDocument.objects.get(id=document_id)
     except PDFDocument.DoesNotExist:
         return JsonResponse({
             'success': False,
             'error': 'Document non trouvé'
         }, status=404)
+    
+    def generate():
+        for event in iter_document_events(document):
+            if event['type'] == 'page':
+                _add_page_image_urls(event['page'], document)
+            yield json.dumps(event) + '\n'
+    
+    response = StreamingHttpResponse(generate(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _parse_edited_rows(request):
+    """Lignes de cellules envoyées par le client ({"rows": [[...], ...]}) ; ValueError si invalides"""
+    rows = json.loads(request.body or b'{}').get('rows')
+    if not isinstance(rows, list) or not all(isinstance(row, list) for row in rows):
+        raise ValueError('rows doit être une liste de lignes')
+    return [['' if cell is None else str(cell) for cell in row] for row in rows]
+
+@require_http_methods(["GET", "POST"])
+def export_document_table(request, document_id, table_id):
+    """
+    API endpoint d'export d'un tableau : ?format=csv (défaut), xlsx ou parquet.
+    En GET, le fichier est généré au premier appel puis servi depuis le cache disque.
+    En POST, le corps JSON {"rows": [...]} contient les cellules modifiées dans le
+    navigateur : l'export est généré à partir de ces lignes, sans cache.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({
+            'success': False,
+            'error': f'Format non supporté: {export_format} (formats: {", ".join(EXPORT_FORMATS)})'
+        }, status=400)
+    
+    table = Table.objects.filter(document_id=document_id, table_id=table_id).first()
+    if table is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Tableau non trouvé'
+        }, status=404)
+    
+    rows = None
+    if request.method == 'POST':
+        try:
+            rows = _parse_edited_rows(request)
+        except (ValueError, AttributeError) as e:
+            return JsonResponse({
+                'success': False,
+                'error': f'Cellules invalides: {str(e)}'
+            }, status=400)
+    
+    try:
+        if rows is None:
+            path = export_table(table, export_format)
+        else:
+            content = export_edited_table(table, rows, export_format)
+    except ExportUnavailable as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Export {export_format} indisponible: {str(e)}'
+        }, status=501)
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': f'Erreur: {str(e)}'
         }, status=500)
+    
+    extension, content_type = EXPORT_FORMATS[export_format]
+    if rows is not None:
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{table.table_id}.{extension}"'
+        return response
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=os.path.basename(path),
+        content_type=content_type
+    )
+
+def _parse_derivative_width(request):
+    """Largeur demandée (?w=), limitée aux largeurs générées ; ValueError sinon"""
+    widths = get_derivative_widths()
+    width = int(request.GET.get('w', widths[0]))
+    if width not in widths:
+        raise ValueError(f"w doit être l'une des largeurs {', '.join(map(str, widths))}")
+    return width
+
+def _webp_response(path, max_age):
+    response = FileResponse(open(path, 'rb'), content_type='image/webp')
+    response['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+def image_thumbnail_view(request, content_hash):
+    """API endpoint de vignette WebP d'une image extraite : ?w=<largeur>"""
+    try:
+        width = _parse_derivative_width(request)
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Paramètre invalide: {str(e)}'
+        }, status=400)
+    
+    stored = StoredImage.objects.filter(content_hash=content_hash).first()
+    if stored is None or not os.path.exists(stored.path):
+        return JsonResponse({
+            'success': False,
+            'error': 'Image non trouvée'
+        }, status=404)
+    
+    try:
+        path = image_thumbnail(content_hash, stored.path, width)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur: {str(e)}'
+        }, status=500)
+    
+    # Adressée par contenu : la vignette d'une empreinte ne change jamais
+    return _webp_response(path, 31536000)
+
+def page_preview_view(request, document_id, page_number):
+    """API endpoint d'aperçu WebP d'une page rendue : ?w=<largeur>"""
+    try:
+        width = _parse_derivative_width(request)
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Paramètre invalide: {str(e)}'
+        }, status=400)
+    
+    document = PDFDocument.objects.filter(id=document_id).first()
+    if (document is None or not document.file or not document.file.storage.exists(document.file.name)
+            or not document.pages.filter(page_number=page_number).exists()):
+        return JsonResponse({
+            'success': False,
+            'error': 'Page non trouvée'
+        }, status=404)
+    
+    try:
+        path = page_preview(document, page_number, width)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Erreur: {str(e)}'
+        }, status=500)
+    
+    return _webp_response(path, 86400)
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """
+    Métriques d'extraction au format texte de Prometheus : compteurs et histogrammes
+    des extractions exécutées par ce processus, et documents par statut
+    """
+    if not getattr(settings, 'PDF_METRICS_ENABLED', True):
+        return JsonResponse({
+            'success': False,
+            'error': 'Métriques désactivées'
+        }, status=404)
+    return HttpResponse(
+        REGISTRY.render(queue_gauges()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
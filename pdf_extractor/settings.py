@@ -129,3 +129,100 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Extraction PDF en arrière-plan
+# Nombre de threads du pool d'extraction local au processus Django.
+# 0 désactive le pool : les tâches sont alors traitées par `manage.py run_extraction_worker`.
+PDF_EXTRACTION_WORKERS = 2
+
+# Nombre de processus entre lesquels les pages d'un même document sont réparties
+# (1 = extraction séquentielle), et nombre de pages confiées à un processus à la fois.
+# Chaque thread d'extraction dispose de son propre pool de processus.
+PDF_EXTRACTION_PROCESSES = 1
+PDF_EXTRACTION_CHUNK_SIZE = 8
+
+# Upload des PDF : taille maximale d'un envoi direct sur /process/ et d'un upload
+# par morceaux sur /uploads/ (None = pas de limite), taille des morceaux proposée
+# au client, et délai après lequel un upload par morceaux inachevé est supprimé
+# par `manage.py evict_extraction_cache`.
+PDF_UPLOAD_MAX_BYTES = 1024 * 1024 * 1024
+PDF_CHUNKED_UPLOAD_MAX_BYTES = 20 * 1024 * 1024 * 1024
+PDF_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+PDF_UPLOAD_SESSION_MAX_AGE_HOURS = 24
+
+# Budget de chaque page (désactivé par défaut) : au-delà de PDF_PAGE_TIMEOUT_SECONDS
+# secondes ou de PDF_PAGE_MEMORY_LIMIT_MB Mo de mémoire anonyme résidente (RssAnon, hors
+# pages du PDF projeté en mémoire), la page est abandonnée
+# (erreur structurée, reason timeout / memory / crash / startup) et l'extraction continue.
+# Les pages sont alors extraites une à une dans des processus isolés
+# (max(PDF_EXTRACTION_PROCESSES, 1), démarrés pour chaque document, même d'une page),
+# qu'un blocage ou un dépassement de mémoire ne peut pas faire tomber avec le worker ;
+# PDF_EXTRACTION_CHUNK_SIZE ne s'applique pas dans ce mode.
+# None pour les deux : extraction dans le processus du worker (ou par blocs dans le
+# pool de PDF_EXTRACTION_PROCESSES processus), sans budget.
+PDF_PAGE_TIMEOUT_SECONDS = None
+PDF_PAGE_MEMORY_LIMIT_MB = None
+
+# Recouvrement (intersection sur union des bbox) à partir duquel deux tableaux
+# détectés sur une même page, par pdfplumber ou PyMuPDF, sont fusionnés.
+PDF_TABLE_IOU_THRESHOLD = 0.5
+
+# À partir de ce nombre de pages, /results/<id>/ sans paramètre encode la réponse
+# complète au fil de la lecture des pages (sections écrites dans des fichiers
+# temporaires) au lieu de l'assembler en mémoire.
+PDF_LARGE_DOCUMENT_PAGES = 200
+
+# Flux NDJSON /results/<id>/stream/ : fermé par un événement d'erreur 'timeout'
+# après PDF_STREAM_IDLE_TIMEOUT secondes sans nouvelle page ni progression du job,
+# ou après PDF_STREAM_MAX_SECONDS secondes au total. None : sans limite.
+PDF_STREAM_IDLE_TIMEOUT = 300
+PDF_STREAM_MAX_SECONDS = 3600
+
+# Cache des résultats par empreinte du PDF : un document non consulté depuis
+# PDF_EXTRACTION_CACHE_MAX_AGE_DAYS jours, ou au-delà de PDF_EXTRACTION_CACHE_MAX_BYTES
+# au total, est évincé par `manage.py evict_extraction_cache` (None = pas de limite).
+PDF_EXTRACTION_CACHE_MAX_AGE_DAYS = 30
+PDF_EXTRACTION_CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+
+# Les images extraites sont stockées une seule fois par contenu (media/extracted_images/store)
+# et partagées entre pages et documents. Les images qui ne sont plus référencées sont
+# supprimées par `manage.py gc_image_store` (et après chaque éviction du cache), sauf si
+# elles ont été écrites depuis moins de PDF_IMAGE_STORE_GRACE_HOURS heures.
+PDF_IMAGE_STORE_GRACE_HOURS = 1
+
+# Vignettes WebP des images extraites et aperçus des pages, générés à la première demande
+# aux largeurs ci-dessous (en pixels) et conservés dans media/derivatives. Au-delà de
+# PDF_DERIVATIVES_MAX_BYTES, les moins récemment utilisés sont supprimés par
+# `manage.py evict_extraction_cache`.
+PDF_DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+PDF_DERIVATIVE_WEBP_QUALITY = 80
+PDF_DERIVATIVES_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Mesures de l'extraction : chaque document enregistre dans metadata["metrics"] la durée
+# et le temps CPU de chaque étape et de chaque page, le pic de mémoire et le nombre
+# d'éléments extraits par moteur. /metrics/ les expose au format Prometheus (cumul des
+# extractions exécutées par le processus ; `run_extraction_worker --metrics-port` pour
+# un worker séparé). PDF_EXTRACTION_PROFILER ('cprofile' ou 'pyinstrument', None pour
+# désactiver) enregistre en plus un profil de chaque tâche dans media/profiles/.
+PDF_METRICS_ENABLED = True
+PDF_EXTRACTION_PROFILER = None
+
+# OCR des pages numérisées par Tesseract (commande PDF_OCR_TESSERACT_CMD, installée
+# localement). Seules les pages dont le texte natif couvre moins de
+# PDF_OCR_MIN_TEXT_COVERAGE de la surface, et dont le rendu n'est pas blanc, sont
+# rendues à PDF_OCR_DPI puis reconnues par tesseract, dans le processus qui extrait
+# la page (sous PDF_PAGE_TIMEOUT_SECONDS / PDF_PAGE_MEMORY_LIMIT_MB si l'isolation est
+# active) ; PDF_OCR_THREADS threads OpenMP par tesseract, le parallélisme venant des
+# processus d'extraction (None : réglage de tesseract). Les
+# mots de confiance inférieure à PDF_OCR_MIN_CONFIDENCE sont ignorés. Les résultats
+# sont mis en cache par empreinte du rendu dans media/ocr/, réduit par
+# `manage.py evict_extraction_cache` au-delà de PDF_OCR_CACHE_MAX_BYTES.
+PDF_OCR_ENABLED = False
+PDF_OCR_TESSERACT_CMD = 'tesseract'
+PDF_OCR_LANGUAGES = 'fra+eng'
+PDF_OCR_DPI = 300
+PDF_OCR_MIN_TEXT_COVERAGE = 0.01
+PDF_OCR_MIN_CONFIDENCE = 30
+PDF_OCR_THREADS = 1
+PDF_OCR_TIMEOUT_SECONDS = 120
+PDF_OCR_CACHE_MAX_BYTES = 512 * 1024 * 1024
@@ -11,6 +11,10 @@ document.addEventListener('DOMContentLoaded', function() {
     
     let selectedFile = null;
 
+    // Au-delà de cette taille, le PDF est envoyé par morceaux (upload reprenable)
+    const CHUNKED_UPLOAD_THRESHOLD = 100 * 1024 * 1024;
+    const CHUNK_RETRIES = 3;
+
     // Gestion du drag & drop
     uploadSection.addEventListener('dragover', handleDragOver);
     uploadSection.addEventListener('dragleave', handleDragLeave);
@@ -78,31 +82,128 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function uploadPDF() {
-        const formData = new FormData();
-        formData.append('pdf_file', selectedFile);
-
         // Afficher le chargement
         uploadSection.style.display = 'none';
         loading.style.display = 'block';
         hideError();
 
+        const upload = selectedFile.size > CHUNKED_UPLOAD_THRESHOLD
+            ? uploadInChunks(selectedFile)
+            : uploadDirect(selectedFile);
+
+        upload
+        .then(data => {
+            if (data.success) {
+                // L'extraction tourne en arrière-plan : recevoir les pages au fil de l'eau
+                if (window.ReadableStream && window.TextDecoder) {
+                    streamResults(data.document_id);
+                } else {
+                    pollResults(data.document_id);
+                }
+            } else {
+                loading.style.display = 'none';
+                showError(data.error || 'Une erreur est survenue lors du traitement du PDF.');
+                uploadSection.style.display = 'block';
+            }
+        })
+        .catch(error => {
+            loading.style.display = 'none';
+            uploadSection.style.display = 'block';
+            showError('Erreur de connexion. Veuillez réessayer.');
+            console.error('Error:', error);
+        });
+    }
+
+    function uploadDirect(file) {
+        const formData = new FormData();
+        formData.append('pdf_file', file);
+
         // Envoyer la requête AJAX
-        fetch('/process/', {
+        return fetch('/process/', {
             method: 'POST',
             body: formData,
             headers: {
                 'X-CSRFToken': getCookie('csrftoken')
             }
         })
+        .then(response => response.json());
+    }
+
+    function uploadInChunks(file) {
+        const headers = { 'X-CSRFToken': getCookie('csrftoken') };
+        const params = new FormData();
+        params.append('filename', file.name);
+        params.append('size', file.size);
+
+        return fetch('/uploads/', { method: 'POST', body: params, headers: headers })
+        .then(response => response.json())
+        .then(session => {
+            if (!session.success) {
+                return session;
+            }
+            return sendChunks(file, session, headers, 0).then(result => {
+                if (!result.success) {
+                    return result;
+                }
+                return fetch(`/uploads/${session.upload_id}/complete/`, { method: 'POST', headers: headers })
+                    .then(response => response.json());
+            });
+        });
+    }
+
+    function sendChunks(file, session, headers, retries) {
+        const start = session.offset;
+        if (start >= file.size) {
+            return Promise.resolve({ success: true });
+        }
+        const end = Math.min(start + session.chunk_size, file.size) - 1;
+        updateFileProgress(start, file.size);
+
+        return fetch(`/uploads/${session.upload_id}/`, {
+            method: 'PUT',
+            body: file.slice(start, end + 1),
+            headers: Object.assign({ 'Content-Range': `bytes ${start}-${end}/${file.size}` }, headers)
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success || data.offset !== undefined) {
+                // 409 : le serveur indique l'offset à partir duquel reprendre
+                return sendChunks(file, Object.assign(session, { offset: data.offset }), headers, 0);
+            }
+            return data;
+        })
+        .catch(error => {
+            if (retries >= CHUNK_RETRIES) {
+                throw error;
+            }
+            // Connexion interrompue : reprendre au dernier octet reçu par le serveur
+            return fetch(`/uploads/${session.upload_id}/`, { headers: headers })
+                .then(response => response.json())
+                .then(data => sendChunks(file, Object.assign(session, { offset: data.offset }), headers, retries + 1));
+        });
+    }
+
+    function updateFileProgress(sent, total) {
+        const message = loading.querySelector('p');
+        if (message) {
+            message.textContent = `Envoi du fichier : ${Math.round(sent * 100 / total)}%`;
+        }
+    }
+
+    function pollResults(documentId) {
+        fetch(`/results/${documentId}/`)
         .then(response => response.json())
         .then(data => {
-            loading.style.display = 'none';
-            
-            if (data.success) {
+            if (data.success && data.status === 'done') {
+                loading.style.display = 'none';
                 displayResults(data.results);
                 uploadSection.style.display = 'block';
                 resetForm();
+            } else if (data.success) {
+                updateProgress(data.progress);
+                setTimeout(() => pollResults(documentId), 1000);
             } else {
+                loading.style.display = 'none';
                 showError(data.error || 'Une erreur est survenue lors du traitement du PDF.');
                 uploadSection.style.display = 'block';
             }
@@ -115,25 +216,119 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    function streamResults(documentId) {
+        const results = { text: '', positioned_text: [], tables: [], images: [], pages: [], metadata: {} };
+        let renderTimer = null;
+        let shown = false;
+
+        function render() {
+            renderTimer = null;
+            if (!shown) {
+                loading.style.display = 'none';
+                resultsSection.style.display = 'block';
+                resultsSection.classList.add('show');
+                initializeTabs();
+                shown = true;
+            }
+            renderResults(results);
+        }
+
+        function scheduleRender() {
+            if (!renderTimer) {
+                renderTimer = setTimeout(render, 300);
+            }
+        }
+
+        function handleEvent(event) {
+            if (event.type === 'page') {
+                const page = event.page;
+                results.pages.push(page);
+                results.text += `\n--- Page ${page.page_number} ---\n${page.text}\n`;
+                results.positioned_text.push(...page.positioned_text.map(item => ({ ...item, page: page.page_number })));
+                results.tables.push(...page.tables);
+                results.images.push(...page.images);
+                results.metadata = {
+                    total_pages: event.progress ? event.progress.pages_total : results.pages.length,
+                    total_text_length: results.text.length,
+                    total_positioned_elements: results.positioned_text.length,
+                    total_tables: results.tables.length,
+                    total_images: results.images.length
+                };
+                updateProgress(event.progress);
+                scheduleRender();
+            } else if (event.type === 'end') {
+                results.metadata = event.metadata;
+                clearTimeout(renderTimer);
+                render();
+                uploadSection.style.display = 'block';
+                resetForm();
+            } else if (event.type === 'error') {
+                loading.style.display = 'none';
+                showError(event.error || 'Une erreur est survenue lors du traitement du PDF.');
+                uploadSection.style.display = 'block';
+            } else {
+                updateProgress(event.progress);
+            }
+        }
+
+        fetch(`/results/${documentId}/stream/`)
+        .then(response => {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            function read() {
+                return reader.read().then(({ done, value }) => {
+                    if (done) {
+                        return;
+                    }
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+                    return read();
+                });
+            }
+            return read();
+        })
+        .catch(error => {
+            loading.style.display = 'none';
+            uploadSection.style.display = 'block';
+            showError('Erreur de connexion. Veuillez réessayer.');
+            console.error('Error:', error);
+        });
+    }
+
+    function updateProgress(progress) {
+        const message = loading.querySelector('p');
+        if (message && progress && progress.pages_total) {
+            message.textContent = `Page ${progress.pages_processed} / ${progress.pages_total} (${progress.percent}%)`;
+        }
+    }
+
     function displayResults(results) {
         // Afficher la section des résultats
         resultsSection.style.display = 'block';
         resultsSection.classList.add('show');
 
-        // Mettre à jour les statistiques
-        updateResultsStats(results);
-
         // Initialiser les onglets
         initializeTabs();
 
         // Afficher le contenu de chaque onglet
+        renderResults(results);
+
+        // Scroll vers les résultats
+        resultsSection.scrollIntoView({ behavior: 'smooth' });
+    }
+
+    function renderResults(results) {
+        // Mettre à jour les statistiques
+        updateResultsStats(results);
+
         displayTextContent(results.text);
         displayPositionedContent(results.positioned_text, results.pages);
         displayTablesContent(results.tables);
         displayImagesContent(results.images);
-
-        // Scroll vers les résultats
-        resultsSection.scrollIntoView({ behavior: 'smooth' });
     }
 
     function updateResultsStats(results) {
@@ -316,7 +511,7 @@ document.addEventListener('DOMContentLoaded', function() {
                             </div>
                         </div>
                         <div class="content-actions">
-                            <button class="btn-secondary" onclick="exportTableData('${table.table_id}')">📊 Exporter CSV</button>
+                            ${generateExportButtons(table)}
                             <button class="btn-secondary" onclick="copyTableData('${table.table_id}')">📋 Copier</button>
                         </div>
                     </div>
@@ -330,6 +525,14 @@ document.addEventListener('DOMContentLoaded', function() {
         tablesContainer.innerHTML = `<div class="tables-section">${tablesHTML}</div>`;
     }
 
+    function generateExportButtons(table) {
+        // Un bouton par format proposé par le serveur (XLSX et Parquet selon les dépendances installées)
+        const labels = { csv: '📊 Exporter CSV', xlsx: '📗 Exporter XLSX', parquet: '🗄️ Exporter Parquet' };
+        return Object.entries(table.export_urls || {}).map(([format, url]) =>
+            `<button class="btn-secondary" onclick="exportTableData('${url}', '${format}', '${table.table_id}')">${labels[format] || format}</button>`
+        ).join('');
+    }
+
     function generateTableHTML(table) {
         if (!table.data || table.data.length === 0) {
             return '<div class="alert alert-warning">Données de tableau vides</div>';
@@ -402,7 +605,11 @@ document.addEventListener('DOMContentLoaded', function() {
                         </div>
                     </div>
                     <div class="image-wrapper">
-                        <img src="${image.url}" alt="${image.filename}" class="extracted-image" loading="lazy">
+                        <a href="${image.url}" target="_blank" rel="noopener">
+                            <img src="${image.thumbnail_url || image.url}" srcset="${image.srcset || ''}"
+                                 sizes="(max-width: 768px) 100vw, 600px"
+                                 alt="${image.filename}" class="extracted-image" loading="lazy">
+                        </a>
                     </div>
                 </div>
             `;
@@ -531,64 +738,62 @@ document.addEventListener('DOMContentLoaded', function() {
         showNotification('Données positionnelles exportées!');
     };
 
+    // Tableaux dont des cellules ont été modifiées dans la page
+    const editedTables = new Set();
+
     window.updateTableCell = function(tableId, row, col, newValue) {
         // Mettre à jour une cellule de tableau
         console.log(`Mise à jour cellule ${tableId} [${row}, ${col}]: ${newValue}`);
+        editedTables.add(tableId);
         showNotification('Cellule mise à jour!');
     };
 
-    window.exportTableData = function(tableId) {
+    function getTableRows(tableId) {
+        // Cellules affichées (éventuellement modifiées), ligne par ligne
         const table = document.querySelector(`table[data-table-id="${tableId}"]`);
-        if (!table) return;
-
-        const rows = [];
-        const headerRows = table.querySelectorAll('thead tr');
-        const bodyRows = table.querySelectorAll('tbody tr');
-
-        // Collecter les en-têtes
-        headerRows.forEach(row => {
-            const cells = Array.from(row.querySelectorAll('th')).map(cell => cell.textContent.trim());
-            rows.push(cells);
-        });
-
-        // Collecter les données
-        bodyRows.forEach(row => {
-            const cells = Array.from(row.querySelectorAll('td')).map(cell => cell.textContent.trim());
-            rows.push(cells);
-        });
-
-        // Convertir en CSV
-        const csvContent = rows.map(row => 
-            row.map(cell => `"${cell.replace(/"/g, '""')}"`).join(',')
-        ).join('\n');
+        if (!table) return null;
+        return Array.from(table.querySelectorAll('thead tr, tbody tr')).map(row =>
+            Array.from(row.querySelectorAll('th, td')).map(cell => cell.textContent.trim())
+        );
+    }
 
-        const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
-        const url = URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `${tableId}.csv`;
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        URL.revokeObjectURL(url);
-        showNotification('Tableau exporté en CSV!');
+    window.exportTableData = async function(url, format, tableId) {
+        // Fichier généré par le serveur à partir des cellules stockées, ou des
+        // cellules affichées si le tableau a été modifié dans la page
+        const rows = editedTables.has(tableId) ? getTableRows(tableId) : null;
+        const options = rows ? {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
+            body: JSON.stringify({ rows: rows })
+        } : {};
+        try {
+            const response = await fetch(url, options);
+            if (!response.ok) {
+                const data = await response.json().catch(() => ({}));
+                throw new Error(data.error || `Erreur ${response.status}`);
+            }
+            const disposition = response.headers.get('Content-Disposition') || '';
+            const match = disposition.match(/filename="?([^";]+)"?/);
+            const blob = await response.blob();
+            const objectUrl = URL.createObjectURL(blob);
+            const a = document.createElement('a');
+            a.href = objectUrl;
+            a.download = match ? match[1] : `table.${format}`;
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            URL.revokeObjectURL(objectUrl);
+            showNotification(`Tableau exporté en ${format.toUpperCase()}!`);
+        } catch (error) {
+            showError(`Export impossible: ${error.message}`);
+        }
     };
 
     window.copyTableData = function(tableId) {
-        const table = document.querySelector(`table[data-table-id="${tableId}"]`);
-        if (!table) return;
-
-        const rows = [];
-        const headerRows = table.querySelectorAll('thead tr');
-        const bodyRows = table.querySelectorAll('tbody tr');
-
-        // Collecter toutes les lignes
-        [...headerRows, ...bodyRows].forEach(row => {
-            const cells = Array.from(row.querySelectorAll('th, td')).map(cell => cell.textContent.trim());
-            rows.push(cells.join('\t'));
-        });
+        const rows = getTableRows(tableId);
+        if (!rows) return;
 
-        const textContent = rows.join('\n');
+        const textContent = rows.map(cells => cells.join('\t')).join('\n');
         
         // Copier dans le presse-papiers
         if (navigator.clipboard && window.isSecureContext) {